@@ -1,63 +1,141 @@
+import atexit
+import os
 from flask import Flask, g
-from flask_cors import CORS
 
+from lib import streak
 from lib.db import Db
+from lib.backup import Backups
+from lib.reset import HistoryReset
+from lib.cache import ResponseCache
+from lib.metrics import Metrics
+from lib.origins import OriginResolver
+from lib.slow_queries import SlowQueryLog
+from lib.review_buffer import ReviewBuffer
 
 import routes.words
 import routes.groups
 import routes.study_sessions
 import routes.dashboard
 import routes.study_activities
-
-def get_allowed_origins(app):
-    try:
-        cursor = app.db.cursor()
-        cursor.execute('SELECT url FROM study_activities')
-        urls = cursor.fetchall()
-        # Convert URLs to origins (e.g., https://example.com/app -> https://example.com)
-        origins = set()
-        for url in urls:
-            try:
-                from urllib.parse import urlparse
-                parsed = urlparse(url['url'])
-                origin = f"{parsed.scheme}://{parsed.netloc}"
-                origins.add(origin)
-            except:
-                continue
-        return list(origins) if origins else ["*"]
-    except:
-        return ["*"]  # Fallback to allow all origins if there's an error
+import routes.admin
 
 def create_app(test_config=None):
     app = Flask(__name__)
     
-    if test_config is None:
-        app.config.from_mapping(
-            DATABASE='words.db'
-        )
-    else:
+    app.config.from_mapping(
+        DATABASE='words.db',
+        DB_POOL_SIZE=5,  # 0 opens a fresh connection per request
+        DB_PROFILE='balanced',  # One of lib.db.PRAGMA_PROFILES
+        DB_READ_POOL_SIZE=5,  # Read-only connections for GET requests, 0 reads through the main pool
+        DB_STREAM_POOL_SIZE=2,  # Read-only connections for streamed exports, 0 shares the read pool
+        DB_WRITER=True,  # Run Db.write() transactions on one writer thread, which keeps one DB_POOL_SIZE connection
+        DB_WRITER_QUEUE=256,  # Writes queued before new ones get a 503
+        DB_WRITER_TIMEOUT_MS=10000,  # Writes still queued after this long get a 503, None waits for them
+        STREAK_TIMEZONE=None,  # IANA name for study day boundaries, None is the server's local time
+        CACHE_MAX_BYTES=16 * 1024 * 1024,  # Response cache size, 0 disables it
+        REVIEW_BUFFER=False,  # Write single reviews behind through lib.review_buffer
+        REVIEW_BUFFER_MAX_ITEMS=100,  # Group commit after this many reviews...
+        REVIEW_BUFFER_MAX_DELAY_MS=50,  # ...or this long after the first queued one
+        REVIEW_BUFFER_SPOOL=None,  # Defaults to <DATABASE>.reviews.spool
+        METRICS=True,  # Per-route latency at GET /metrics
+        METRICS_SQL=False,  # Also time every statement per route, about 1us each
+        SLOW_QUERY_MS=100,  # Log statements slower than this, None disables the log
+        SLOW_QUERY_INTERVAL_S=60,  # Log each statement fingerprint at most this often
+        SLOW_QUERY_LOG=None,  # Defaults to <DATABASE>.slow-queries.jsonl
+        BACKUP_DIR=None,  # Defaults to backups/ next to DATABASE
+        BACKUP_KEEP=7,  # Newest backups kept, 0 keeps them all
+        BACKUP_COMPRESS=False,  # gzip finished backups
+        BACKUP_PAGES=256,  # Pages copied per backup step...
+        BACKUP_PAUSE_MS=5,  # ...and the pause between steps
+        RESET_CHUNK=5000,  # Rows deleted per transaction by the history reset, -1 for one transaction...
+        RESET_PAUSE_MS=10,  # ...and the pause between chunks
+        RESET_ARCHIVE=None,  # Defaults to <DATABASE>.archive.db
+        ADMIN_TOKEN=None,  # Bearer token required by /admin/*, None allows local requests only
+        MIGRATE_ON_START=True  # Apply pending sql/migrations when the app starts
+    )
+    if test_config is not None:
         app.config.update(test_config)
     
-    # Initialize database first since we need it for CORS configuration
-    app.db = Db(database=app.config['DATABASE'])
+    # Initialize the database first, everything below uses it
+    app.db = Db(
+        database=app.config['DATABASE'],
+        pool_size=app.config['DB_POOL_SIZE'],
+        profile=app.config['DB_PROFILE'],
+        read_pool_size=app.config['DB_READ_POOL_SIZE'],
+        stream_pool_size=app.config['DB_STREAM_POOL_SIZE']
+    )
+
+    # A single schema_migrations read when nothing is pending
+    if app.config['MIGRATE_ON_START']:
+        timezone = streak.get_timezone(app.config['STREAK_TIMEZONE'])
+        for migration in app.db.migrate_on_start(timezone):
+            app.logger.info("Applied migration %s", migration.name)
+
+    # Single writer, closed at exit after the review buffer has flushed through it
+    if app.config['DB_WRITER']:
+        timeout_ms = app.config['DB_WRITER_TIMEOUT_MS']
+        app.db.start_writer(
+            max_queue=app.config['DB_WRITER_QUEUE'],
+            wait_timeout=None if timeout_ms is None else timeout_ms / 1000
+        )
+        atexit.register(app.db.writer.close)
+
+    # Cache for read endpoints, invalidated through table versions bumped by the writes
+    app.cache = ResponseCache(app.db, max_bytes=app.config['CACHE_MAX_BYTES'])
     
-    # Get allowed origins from study_activities table
-    allowed_origins = get_allowed_origins(app)
+    # Optional write-behind queue for review POSTs, flushed on shutdown
+    app.review_buffer = None
+    if app.config['REVIEW_BUFFER']:
+        app.review_buffer = ReviewBuffer(
+            app.db,
+            spool_path=app.config['REVIEW_BUFFER_SPOOL'] or app.config['DATABASE'] + '.reviews.spool',
+            max_items=app.config['REVIEW_BUFFER_MAX_ITEMS'],
+            max_delay=app.config['REVIEW_BUFFER_MAX_DELAY_MS'] / 1000.0
+        )
+        atexit.register(app.review_buffer.close)
+    
+    # Online backups, started from routes.admin or `invoke backup`
+    app.backups = Backups(
+        app.config['DATABASE'],
+        app.config['BACKUP_DIR'] or os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE'])), 'backups'),
+        keep=app.config['BACKUP_KEEP'],
+        compress=app.config['BACKUP_COMPRESS'],
+        pages=app.config['BACKUP_PAGES'],
+        pause=app.config['BACKUP_PAUSE_MS'] / 1000.0
+    )
+    
+    # Background study history reset, started from routes.study_sessions
+    app.history_reset = HistoryReset(
+        app.db,
+        app.config['RESET_ARCHIVE'] or app.config['DATABASE'] + '.archive.db',
+        chunk=app.config['RESET_CHUNK'],
+        pause=app.config['RESET_PAUSE_MS'] / 1000.0
+    )
+    
+    # Slow statements with their query plans, summarized by `invoke slow-queries`
+    if app.config['SLOW_QUERY_MS'] is not None:
+        app.db.slow_queries = SlowQueryLog(
+            app.config['SLOW_QUERY_LOG'] or app.config['DATABASE'] + '.slow-queries.jsonl',
+            threshold=app.config['SLOW_QUERY_MS'] / 1000.0,
+            interval=app.config['SLOW_QUERY_INTERVAL_S']
+        )
+        atexit.register(app.db.slow_queries.flush)
     
-    # In development, add localhost to allowed origins
-    if app.debug:
-        allowed_origins.extend(["http://localhost:8080", "http://127.0.0.1:8080"])
+    # Request and SQL timing, exported by routes.admin
+    app.metrics = None
+    if app.config['METRICS']:
+        app.metrics = Metrics(sql=app.config['METRICS_SQL'])
+        app.metrics.install(app)
     
-    # Configure CORS with combined origins
-    CORS(app, resources={
-        r"/*": {
-            "origins": allowed_origins,
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
-        }
-    })
+    # CORS origins from study_activities, loaded on the first cross-origin request
+    # and reloaded when the table changes instead of read once here
+    app.origins = OriginResolver(
+        app.db,
+        extra=["http://localhost:8080", "http://127.0.0.1:8080"] if app.debug else ()
+    )
+    app.origins.install(app)
 
-    # Close database connection
+    # Return the request's database connection to the pool
     @app.teardown_appcontext
     def close_db(exception):
         app.db.close()
@@ -68,6 +146,7 @@ def create_app(test_config=None):
     routes.study_sessions.load(app)
     routes.dashboard.load(app)
     routes.study_activities.load(app)
+    routes.admin.load(app)
     
     return app
 
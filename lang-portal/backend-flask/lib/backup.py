@@ -0,0 +1,147 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Online backups through the sqlite3 backup API. The copy is made `pages` pages
+# at a time with a pause between steps, so requests get the database in between.
+
+class BackupRestarted(Exception):
+  pass
+
+def backup(database, path, pages=256, pause=0.005, max_restarts=3, progress=None):
+  """
+  Copy `database` to `path` while it is in use and return the backup stats.
+
+  Under WAL the copy reads one snapshot, pinned by a read transaction held
+  across the steps, so writers carry on and the backup is consistent as of its
+  start. Under a rollback journal that transaction would block the writers,
+  so every step takes its own lock and a write from another connection makes
+  the next step start over. After `max_restarts` of those the rest is copied
+  in a single step, which blocks writers for as long as the copy takes.
+  """
+  stats = {'steps': 0, 'restarts': 0, 'pages': 0, 'single_step': False, 'snapshot': False}
+  remaining_before = [None]
+
+  def step(status, remaining, total):
+    stats['steps'] += 1
+    stats['pages'] = total
+    if remaining_before[0] is not None and remaining > remaining_before[0]:
+      stats['restarts'] += 1
+      if stats['restarts'] > max_restarts:
+        raise BackupRestarted()
+    remaining_before[0] = remaining
+    if progress is not None:
+      progress(total - remaining, total)
+    if remaining:
+      time.sleep(pause)
+
+  started = time.perf_counter()
+  source = sqlite3.connect(database)
+  try:
+    stats['snapshot'] = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    if stats['snapshot']:
+      source.execute('BEGIN')
+      source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone()
+    target = sqlite3.connect(path)
+    try:
+      try:
+        source.backup(target, pages=pages, progress=step)
+      except BackupRestarted:
+        stats['single_step'] = True
+        source.backup(target, pages=-1)
+    finally:
+      target.close()
+  finally:
+    source.close()
+  stats['seconds'] = time.perf_counter() - started
+  return stats
+
+def compress(path):
+  # Replace `path` with `path`.gz, streamed so a multi-GB file never sits in memory
+  with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb', compresslevel=6) as target:
+    shutil.copyfileobj(source, target, 1024 * 1024)
+  os.remove(path)
+  return path + '.gz'
+
+def rotate(directory, prefix, keep):
+  # Delete all but the newest `keep` backups, their names sort by time
+  backups = sorted(name for name in os.listdir(directory)
+                   if name.startswith(prefix) and (name.endswith('.db') or name.endswith('.db.gz')))
+  removed = backups[:-keep] if keep else []
+  for name in removed:
+    os.remove(os.path.join(directory, name))
+  return removed
+
+class Backups:
+  """
+  Timestamped backups of one database in `directory`, optionally gzipped and
+  rotated to the newest `keep`.
+
+  `run()` makes a backup in the calling thread, `start()` in a background
+  thread, one at a time. A backup is written to a .tmp file and renamed when
+  complete, so the directory never holds a partial backup under a final name.
+  """
+  def __init__(self, database, directory, keep=7, compress=False, pages=256, pause=0.005):
+    self.database = database
+    self.directory = directory
+    self.keep = keep
+    self.compress = compress
+    self.pages = pages
+    self.pause = pause
+    self.prefix = os.path.splitext(os.path.basename(database))[0] + '-'
+    self._lock = threading.Lock()
+    self._thread = None
+    self._status = {'state': 'idle'}
+
+  def run(self):
+    os.makedirs(self.directory, exist_ok=True)
+    name = self.prefix + time.strftime('%Y%m%d-%H%M%S') + '.db'
+    path = os.path.join(self.directory, name)
+    self._update(state='running', path=None, copied=0, total=None, error=None)
+    try:
+      stats = backup(self.database, path + '.tmp', pages=self.pages, pause=self.pause,
+                     progress=lambda copied, total: self._update(copied=copied, total=total))
+      os.replace(path + '.tmp', path)
+      if self.compress:
+        path = compress(path)
+      stats['bytes'] = os.path.getsize(path)
+      stats['removed'] = rotate(self.directory, self.prefix, self.keep)
+    except Exception as e:
+      if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+      self._update(state='failed', error=str(e))
+      raise
+    self._update(state='done', path=path, finished=time.strftime('%Y-%m-%dT%H:%M:%S'), **stats)
+    return dict(stats, path=path)
+
+  def start(self):
+    # False if a backup is already running
+    with self._lock:
+      if self._thread is not None and self._thread.is_alive():
+        return False
+      self._status = {'state': 'running'}
+      self._thread = threading.Thread(target=self._run_quietly, name='backup', daemon=True)
+      self._thread.start()
+      return True
+
+  def wait(self, timeout=None):
+    thread = self._thread
+    if thread is not None:
+      thread.join(timeout)
+
+  def status(self):
+    with self._lock:
+      return dict(self._status)
+
+  def _run_quietly(self):
+    try:
+      self.run()
+    except Exception:
+      pass  # Reported through status()
+
+  def _update(self, **values):
+    with self._lock:
+      self._status.update(values)
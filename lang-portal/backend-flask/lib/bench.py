@@ -0,0 +1,437 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import Flask
+from lib.db import PRAGMA_PROFILES, ConnectionPool, Db
+from lib.metrics import percentile
+from lib.shards import ShardRouter
+from lib.slow_queries import explain, plan_warnings
+
+# Helpers shared by the benchmark tasks in tasks.py
+
+@contextmanager
+def temp_database(seed=True):
+  # Yield the path of a throwaway database, seeded like `invoke init-db`
+  directory = tempfile.mkdtemp(prefix='lang-portal-bench-')
+  path = os.path.join(directory, 'words.db')
+  try:
+    if seed:
+      db = Db(database=path, pool_size=1, profile='bulk')
+      db.init(Flask(__name__))
+      db.pool.close_all()
+    yield path
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+def summarize(samples, elapsed=None):
+  # Latencies are collected in seconds and reported in milliseconds
+  summary = {
+    'count': len(samples),
+    'mean_ms': (sum(samples) / len(samples) * 1000) if samples else 0.0,
+    'p50_ms': percentile(samples, 50) * 1000,
+    'p95_ms': percentile(samples, 95) * 1000,
+    'p99_ms': percentile(samples, 99) * 1000
+  }
+  if elapsed:
+    summary['per_second'] = len(samples) / elapsed
+  return summary
+
+def format_summary(label, summary):
+  line = (f"{label:<24} n={summary['count']:<7} mean={summary['mean_ms']:.3f}ms "
+          f"p50={summary['p50_ms']:.3f}ms p95={summary['p95_ms']:.3f}ms p99={summary['p99_ms']:.3f}ms")
+  if 'per_second' in summary:
+    line += f" {summary['per_second']:.0f}/s"
+  return line
+
+def time_calls(fn, count):
+  # Call fn() `count` times and return the latency of each call
+  samples = []
+  for _ in range(count):
+    started = time.perf_counter()
+    fn()
+    samples.append(time.perf_counter() - started)
+  return samples
+
+def run_requests(app, path, count, threads=1, method='get', **kwargs):
+  """
+  Issue `count` requests against `path`, spread over `threads` test clients.
+  Returns (latency samples, wall clock seconds).
+  """
+  samples = []
+  errors = []
+  lock = threading.Lock()
+
+  def worker(n):
+    try:
+      run(n)
+    except Exception as e:
+      errors.append(e)
+
+  def run(n):
+    client = app.test_client()
+    call = getattr(client, method)
+    local = []
+    for _ in range(n):
+      started = time.perf_counter()
+      response = call(path, **kwargs)
+      local.append(time.perf_counter() - started)
+      if response.status_code >= 500:
+        raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    with lock:
+      samples.extend(local)
+
+  per_thread = [count // threads + (1 if i < count % threads else 0) for i in range(threads)]
+  workers = [threading.Thread(target=worker, args=(n,)) for n in per_thread]
+  started = time.perf_counter()
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+  if errors:
+    raise errors[0]
+  return samples, time.perf_counter() - started
+
+# Every GET route with representative arguments, used to drive benchmarks through the test client
+ROUTES = [
+  '/words',
+  '/words?page=200&sort_by=english',
+  '/words?sort_by=correct_count&order=desc',
+  '/words/search?q=ab',
+  '/words/1',
+  '/groups',
+  '/groups?sort_by=words_count&order=desc',
+  '/groups/1',
+  '/groups/1/words',
+  '/groups/1/words?page=50&sort_by=wrong_count&order=desc',
+  '/groups/1/words/due?limit=50',
+  '/groups/1/study_sessions',
+  '/groups/1/study_sessions?sort_by=reviewItemsCount',
+  '/api/study-sessions',
+  '/api/study-sessions?page=500',
+  '/api/study-sessions/1',
+  '/api/study-activities',
+  '/api/study-activities/1',
+  '/api/study-activities/1/sessions',
+  '/api/study-activities/1/launch',
+  '/dashboard/recent-session',
+  '/dashboard/stats'
+]
+
+# Write endpoints, run after the reads since they change the data
+WRITE_ROUTES = [
+  ('post', '/api/study-sessions', {'json': {'group_id': 1, 'activity_id': 1}}),
+  ('post', '/api/study-sessions/1/review', {'json': {'word_id': 1, 'correct': True}}),
+  ('post', '/api/study-sessions/1/reviews', {'json': [{'word_id': n, 'correct': n % 3 != 0} for n in range(1, 21)]})
+]
+
+def is_query(sql):
+  # Transaction control and PRAGMAs are not counted as queries
+  return not sql.lstrip().upper().startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK'))
+
+def count_queries(captured):
+  # The trace callback repeats a statement's text for every trigger program it runs,
+  # so consecutive duplicates are counted once
+  count = 0
+  previous = None
+  for sql in captured:
+    if sql != previous and is_query(sql):
+      count += 1
+    previous = sql
+  return count
+
+def run_suite(app, routes, repeat=20):
+  """
+  Drive every (method, path, kwargs) in `routes` through the test client `repeat`
+  times and return one result per route: status, latency percentiles and the
+  number of SQL queries per request.
+  """
+  captured = []
+  app.db.add_connect_hook(lambda connection: connection.set_trace_callback(captured.append))
+  client = app.test_client()
+  results = []
+  for method, path, kwargs in routes:
+    call = getattr(client, method)
+    call(path, **kwargs)  # warm up
+    samples = []
+    queries = []
+    for _ in range(repeat):
+      del captured[:]
+      started = time.perf_counter()
+      response = call(path, **kwargs)
+      samples.append(time.perf_counter() - started)
+      queries.append(count_queries(captured))
+    results.append(dict(
+      summarize(samples),
+      method=method.upper(),
+      route=path,
+      status=response.status_code,
+      queries=sum(queries) / len(queries)
+    ))
+  return results
+
+def compare_results(previous, current):
+  # Per route p50/p95 change against a previous run, routes missing on either side are skipped
+  before = {(r['method'], r['route']): r for r in previous}
+  lines = []
+  for result in current:
+    old = before.get((result['method'], result['route']))
+    if old is None:
+      continue
+    lines.append(
+      f"{result['method']:<5} {result['route'][:48]:<48} "
+      f"p50 {old['p50_ms']:8.3f} -> {result['p50_ms']:8.3f}ms ({change(old['p50_ms'], result['p50_ms'])}) "
+      f"p95 {old['p95_ms']:8.3f} -> {result['p95_ms']:8.3f}ms ({change(old['p95_ms'], result['p95_ms'])})"
+    )
+  return lines
+
+def change(before, after):
+  if not before:
+    return 'n/a'
+  return f"{(after - before) / before * 100:+.0f}%"
+
+def run_until(app, routes, stop, threads=4, failures=None):
+  """
+  Cycle through (method, path, kwargs) `routes` from `threads` test clients
+  until `stop` is set. Returns the latency samples by method. A 5xx response
+  raises, or with a `failures` dict is counted there by its error message.
+  """
+  samples = {}
+  errors = []
+  lock = threading.Lock()
+
+  def worker(offset):
+    client = app.test_client()
+    local = []
+    n = offset
+    try:
+      while not stop.is_set():
+        method, path, kwargs = routes[n % len(routes)]
+        n += 1
+        started = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        local.append((method, time.perf_counter() - started))
+        if response.status_code >= 500 and failures is not None:
+          message = (response.get_json(silent=True) or {}).get('error', str(response.status_code))
+          with lock:
+            failures[message] = failures.get(message, 0) + 1
+        elif response.status_code >= 500:
+          raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+    except Exception as e:
+      errors.append(e)
+    with lock:
+      for method, seconds in local:
+        samples.setdefault(method, []).append(seconds)
+
+  workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+  if errors:
+    raise errors[0]
+  return samples
+
+def shard_router(db, directory, max_open=64, pool_size=2):
+  # Per-learner shards in `directory` with db as the catalog, opened like the pools of db
+  return ShardRouter(
+    db.database,
+    directory,
+    db.sql('shard/schema.sql'),
+    lambda path: ConnectionPool(
+      path,
+      size=pool_size,
+      pragmas=PRAGMA_PROFILES[db.profile],
+      cached_statements=db.statements.cache_size(),
+      uri=True
+    ),
+    max_open=max_open
+  )
+
+def shard_writes(connection, learners, seconds, threads=8):
+  """
+  Single-review write transactions from `threads` threads for `seconds`, each
+  thread cycling through its share of `learners`. `connection(learner)` is a
+  context manager like ShardRouter.connection. Returns the commit latencies.
+  """
+  stop = threading.Event()
+  samples = []
+  errors = []
+  lock = threading.Lock()
+
+  def worker(offset):
+    mine = learners[offset::threads] or learners
+    local = []
+    n = 0
+    try:
+      while not stop.is_set():
+        learner = mine[n % len(mine)]
+        started = time.perf_counter()
+        with connection(learner) as shard:
+          shard.execute(
+            'INSERT INTO word_review_items (word_id, study_session_id, correct) VALUES (?, 1, ?)',
+            (n % 500 + 1, n % 3 != 0)
+          )
+          shard.commit()
+        local.append(time.perf_counter() - started)
+        n += 1
+    except Exception as e:
+      errors.append(e)
+    with lock:
+      samples.extend(local)
+
+  workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+  for thread in workers:
+    thread.start()
+  time.sleep(seconds)
+  stop.set()
+  for thread in workers:
+    thread.join()
+  if errors:
+    raise errors[0]
+  return samples
+
+def export_run(database, path, queue):
+  """
+  Fetch `path` in a fresh process and put its time to first byte, total time,
+  size and peak RSS growth on `queue`. A path of None runs the buffered
+  baseline instead: fetchall() and one json.dumps() of the whole group.
+  """
+  import json
+  import resource
+  from app import create_app
+
+  app = create_app({'DATABASE': database, 'DB_POOL_SIZE': 1, 'CACHE_MAX_BYTES': 0, 'SLOW_QUERY_MS': None})
+  client = app.test_client()
+  client.get('/groups/1')  # Open the pooled connection first
+  before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  started = time.perf_counter()
+  if path is None:
+    with app.app_context():
+      cursor = app.db.cursor()
+      cursor.execute('''
+        SELECT w.id, w.kanji, w.romaji, w.english, w.parts
+        FROM word_groups wg JOIN words w ON w.id = wg.word_id
+        WHERE wg.group_id = 1 ORDER BY wg.word_id
+      ''')
+      body = json.dumps([
+        {'id': row[0], 'kanji': row[1], 'romaji': row[2], 'english': row[3], 'parts': json.loads(row[4])}
+        for row in cursor.fetchall()
+      ]).encode()
+    first_byte = time.perf_counter()
+    size = len(body)
+  else:
+    response = client.get(path)
+    chunks = response.iter_encoded()
+    size = len(next(chunks))
+    first_byte = time.perf_counter()
+    size += sum(len(chunk) for chunk in chunks)
+    response.close()
+  finished = time.perf_counter()
+  queue.put({
+    'ttfb_ms': (first_byte - started) * 1000,
+    'total_ms': (finished - started) * 1000,
+    'bytes': size,
+    # ru_maxrss is in kilobytes on Linux
+    'peak_rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024
+  })
+
+def profile_routes(app, database, routes=ROUTES, repeat=5):
+  """
+  Run each route through the test client, capture the SQL it executes and
+  return per-route latency plus the plan and latency of every statement.
+  """
+  import sqlite3
+
+  captured = []
+  app.db.add_connect_hook(lambda connection: connection.set_trace_callback(captured.append))
+  probe = sqlite3.connect(database)
+  client = app.test_client()
+  report = []
+  try:
+    for path in routes:
+      del captured[:]
+      response = client.get(path)
+      statements = [sql for sql in captured if is_query(sql)]
+      samples = time_calls(lambda: client.get(path), repeat)
+      entry = {
+        'route': path,
+        'status': response.status_code,
+        'latency': summarize(samples),
+        'statements': []
+      }
+      for sql in statements:
+        plan = explain(probe, sql)
+        timings = time_calls(lambda: probe.execute(sql).fetchall(), repeat)
+        entry['statements'].append({
+          'sql': ' '.join(sql.split()),
+          'plan': plan,
+          'warnings': plan_warnings(plan),
+          'latency': summarize(timings)
+        })
+      report.append(entry)
+  finally:
+    probe.close()
+  return report
+
+def metrics_overhead(make_app, path, requests=2000, rounds=5):
+  """
+  Cost of lib.metrics per request. Returns (route, parts): `route` maps each
+  setting (METRICS off, on, on with METRICS_SQL) to the best round's seconds
+  per request of `path`, with the rounds interleaved so the machine's drift
+  hits every setting alike. `parts` times the hooks and a statement with and
+  without a TimedCursor directly: a few microseconds are well within the
+  noise of whole requests.
+  """
+  from flask import Response
+  from lib.metrics import Metrics, TimedCursor
+  settings = (('off', {'METRICS': False}), ('on', {'METRICS': True}), ('on + sql', {'METRICS': True, 'METRICS_SQL': True}))
+  apps = [(label, make_app(dict(config, SLOW_QUERY_MS=None, CACHE_MAX_BYTES=0))) for label, config in settings]
+  clients = [(label, app.test_client()) for label, app in apps]
+  best = {label: float('inf') for label, _ in clients}
+  for label, client in clients:
+    for _ in range(50):
+      client.get(path)  # warm up
+  for round in range(rounds):
+    # Every other round in reverse, whichever runs first tends to be slower
+    for label, client in (clients if round % 2 == 0 else clients[::-1]):
+      started = time.perf_counter()
+      for _ in range(requests):
+        client.get(path)
+      best[label] = min(best[label], (time.perf_counter() - started) / requests)
+
+  app = apps[0][1]
+  parts = {}
+  response = Response('')
+  for label, sql in (('hooks', False), ('hooks + sql', True)):
+    metrics = Metrics(sql=sql)
+    with app.test_request_context(path):
+      def hooks():
+        metrics._start()
+        metrics._finish(response)
+      parts[label] = min(time_calls_total(hooks, requests * 10) for _ in range(rounds))
+  with app.test_request_context(path):
+    connection = app.db.get()
+    for label, factory in (('statement', None), ('timed statement', TimedCursor)):
+      cursor = connection.cursor() if factory is None else connection.cursor(factory)
+      if factory is not None:
+        cursor.totals = [0, 0.0]
+      def statement():
+        cursor.execute('SELECT id FROM groups WHERE id = ?', (1,))
+        cursor.fetchone()
+      parts[label] = min(time_calls_total(statement, requests * 10) for _ in range(rounds))
+    app.db.close()
+  for _, app in apps:
+    app.db.writer.close()
+    app.db.pool.close_all()
+    app.db.read_pool.close_all()
+  return best, parts
+
+def time_calls_total(fn, count):
+  # Seconds per call of fn() over `count` calls, without a sample per call
+  started = time.perf_counter()
+  for _ in range(count):
+    fn()
+  return (time.perf_counter() - started) / count
@@ -0,0 +1,110 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, make_response, request
+
+class ResponseCache:
+  """
+  Byte-bounded LRU of rendered GET responses.
+
+  Entries are keyed by endpoint, view arguments and the sorted query string, and
+  remember the versions of the tables the view reads (see Db.table_versions).
+  A write path bumps the versions of the tables it changes, so a stale entry is
+  simply never served again and ages out of the LRU. Every cached response
+  carries a strong ETag and conditional requests are answered with 304.
+  """
+  def __init__(self, db, max_bytes=16 * 1024 * 1024):
+    self.db = db
+    self.max_bytes = max_bytes
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self._metrics = {
+      'hits': 0,
+      'misses': 0,
+      'not_modified': 0,
+      'evictions': 0,
+      'saved_seconds': 0.0
+    }
+
+  def cached(self, *tables):
+    """
+    Decorator for a GET view whose response depends only on its arguments and `tables`.
+    """
+    def decorator(view):
+      @functools.wraps(view)
+      def wrapper(*args, **kwargs):
+        if not self.max_bytes:
+          return view(*args, **kwargs)
+        started = time.perf_counter()
+        # Read the versions before the view runs, a write in between only makes the entry stale
+        versions = self.db.table_versions(self.db.cursor(), tables)
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        entry = self._lookup(key, versions)
+        if entry is not None:
+          body, mimetype, etag, cost = entry
+          response = Response(body, mimetype=mimetype)
+          response.set_etag(etag)
+          response = response.make_conditional(request)
+          self._record_hit(response, cost - (time.perf_counter() - started))
+          return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+          return response
+        body = response.get_data()
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._store(key, versions, (body, response.mimetype, etag, time.perf_counter() - started))
+        response.set_etag(etag)
+        return response.make_conditional(request)
+      return wrapper
+    return decorator
+
+  def _lookup(self, key, versions):
+    with self._lock:
+      item = self._entries.get(key)
+      if item is None or item[0] != versions:
+        self._metrics['misses'] += 1
+        return None
+      self._entries.move_to_end(key)
+      self._metrics['hits'] += 1
+      return item[1]
+
+  def _record_hit(self, response, saved):
+    with self._lock:
+      self._metrics['saved_seconds'] += max(saved, 0.0)
+      if response.status_code == 304:
+        self._metrics['not_modified'] += 1
+
+  def _store(self, key, versions, entry):
+    size = len(entry[0])
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._bytes -= len(previous[1][0])
+      self._entries[key] = (versions, entry)
+      self._bytes += size
+      while self._bytes > self.max_bytes:
+        _, (_, evicted) = self._entries.popitem(last=False)
+        self._bytes -= len(evicted[0])
+        self._metrics['evictions'] += 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def stats(self):
+    with self._lock:
+      lookups = self._metrics['hits'] + self._metrics['misses']
+      return dict(
+        self._metrics,
+        hit_ratio=self._metrics['hits'] / lookups if lookups else 0.0,
+        entries=len(self._entries),
+        bytes=self._bytes,
+        max_bytes=self.max_bytes
+      )
@@ -1,35 +1,319 @@
+import os
 import sqlite3
 import json
-from flask import g
+import threading
+import time
+from urllib.parse import quote
+from flask import g, has_app_context, has_request_context, request
+from lib import importer, migrations
+from lib.metrics import TimedCursor
+from lib.statements import StatementRegistry
+from lib.writer import Writer
+
+# Named PRAGMA profiles applied to every connection the pool opens.
+# Values are trusted constants and are interpolated directly into the PRAGMA statements.
+PRAGMA_PROFILES = {
+  # Rollback journal with full fsyncs, closest to sqlite3's own defaults
+  'safe': {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,       # 2MB page cache
+    'mmap_size': 0,
+    'temp_store': 'DEFAULT',
+    'busy_timeout': 5000
+  },
+  # WAL with relaxed syncing: readers don't block the writer and commits skip most fsyncs
+  'balanced': {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,      # 16MB page cache
+    'mmap_size': 67108864,     # 64MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000
+  },
+  # For imports and benchmarks only, a crash can lose recent commits
+  'bulk': {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -64000,      # 64MB page cache
+    'mmap_size': 268435456,    # 256MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 30000
+  }
+}
+
+class ConnectionPool:
+  """
+  Thread-safe pool of sqlite3 connections shared by every request.
+
+  Connections are opened lazily up to `size` and handed back to the idle list on
+  release. A `size` of 0 disables pooling: every checkout opens a new connection
+  and every release closes it, which is what Db.get() used to do per request.
+  """
+  def __init__(self, database, size=5, timeout=30.0, pragmas=None, cached_statements=128, uri=False):
+    self.database = database
+    self.uri = uri
+    self.size = size
+    self.timeout = timeout
+    self.pragmas = pragmas or {}
+    self.cached_statements = cached_statements
+    self.connect_hooks = []
+    self._idle = []
+    self._open = 0
+    self._condition = threading.Condition()
+    self._metrics = {
+      'checkouts': 0,
+      'waits': 0,
+      'wait_time': 0.0,
+      'connects': 0,
+      'peak_open': 0
+    }
+
+  def _connect(self):
+    connection = sqlite3.connect(
+      self.database,
+      check_same_thread=False,
+      cached_statements=self.cached_statements,
+      uri=self.uri
+    )
+    connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+    for name, value in self.pragmas.items():
+      connection.execute(f'PRAGMA {name} = {value}')
+    for hook in self.connect_hooks:
+      hook(connection)
+    return connection
+
+  def acquire(self):
+    with self._condition:
+      self._metrics['checkouts'] += 1
+      if self._idle:
+        return self._idle.pop()
+      if self.size and self._open >= self.size:
+        # Every connection is checked out, wait for one to be released
+        self._metrics['waits'] += 1
+        started = time.perf_counter()
+        if not self._condition.wait_for(lambda: self._idle, timeout=self.timeout):
+          raise TimeoutError(f"No database connection available after {self.timeout}s")
+        self._metrics['wait_time'] += time.perf_counter() - started
+        return self._idle.pop()
+      self._open += 1
+      self._metrics['connects'] += 1
+      self._metrics['peak_open'] = max(self._metrics['peak_open'], self._open)
+    try:
+      return self._connect()
+    except Exception:
+      with self._condition:
+        self._open -= 1
+        self._condition.notify()
+      raise
+
+  def release(self, connection):
+    # Never hand out a connection with a half finished transaction
+    if connection.in_transaction:
+      connection.rollback()
+    with self._condition:
+      if self.size:
+        self._idle.append(connection)
+        self._condition.notify()
+        return
+      self._open -= 1
+    connection.close()
+
+  def close_all(self):
+    with self._condition:
+      idle, self._idle = self._idle, []
+      self._open -= len(idle)
+    for connection in idle:
+      connection.close()
+
+  def stats(self):
+    with self._condition:
+      return dict(
+        self._metrics,
+        size=self.size,
+        open=self._open,
+        idle=len(self._idle),
+        in_use=self._open - len(self._idle)
+      )
+
+# Requests served from the read-only pool when Db has one
+READ_METHODS = ('GET', 'HEAD')
 
 class Db:
-  def __init__(self, database='words.db'):
+  def __init__(self, database='words.db', pool_size=5, profile='balanced', read_pool_size=0, stream_pool_size=2):
     self.database = database
-    self.connection = None
+    self.profile = profile
+    self.statements = StatementRegistry()
+    self._migrations = None
+    self.timed_cursors = False  # Set by lib.metrics
+    self.slow_queries = None  # lib.slow_queries.SlowQueryLog
+    self.pool = ConnectionPool(
+      database,
+      size=pool_size,
+      pragmas=PRAGMA_PROFILES[profile],
+      cached_statements=self.statements.cache_size()
+    )
+    # Read-only connections for GET requests, see get(). Under WAL they never
+    # wait for the writer, and a stray write from a read route fails loudly.
+    self.read_pool = None
+    if read_pool_size:
+      self.read_pool = self._read_only_pool(read_pool_size)
+    # Streamed exports hold their connection until the client has read everything,
+    # so they get a few of their own and a slow client can't starve the requests.
+    # A stream that finds them all taken waits `timeout` seconds, then gives up.
+    self.stream_pool = None
+    if stream_pool_size:
+      self.stream_pool = self._read_only_pool(stream_pool_size, timeout=5.0)
+    self.writer = None  # lib.writer.Writer, see start_writer()
+
+  def _read_only_pool(self, size, timeout=30.0):
+    return ConnectionPool(
+      'file:' + quote(os.path.abspath(self.database)) + '?mode=ro',
+      size=size,
+      timeout=timeout,
+      # A read-only connection can't set the journal mode, the writers do
+      pragmas={name: value for name, value in PRAGMA_PROFILES[self.profile].items() if name != 'journal_mode'},
+      cached_statements=self.statements.cache_size(),
+      uri=True
+    )
+
+  def start_writer(self, max_queue=256, timeout=5.0, retries=3, wait_timeout=None):
+    # Serialize write() transactions through one thread and one pooled connection,
+    # which it keeps: requests share the other pool_size - 1
+    self.writer = Writer(self.pool, max_queue=max_queue, timeout=timeout, retries=retries, wait_timeout=wait_timeout)
+
+  def write(self, fn):
+    # Run fn(cursor) in a write transaction and return its result: through the
+    # writer when there is one, otherwise on the request's connection, or on a
+    # pooled one outside a request. A second checkout per request could starve the pool.
+    if self.writer is not None:
+      # Timed on the writer thread, counted towards this request
+      totals = self._request_totals()
+      return self.writer.run(fn, cursor=lambda connection: self._cursor(connection, totals))
+    if has_request_context():
+      connection = self.get()
+      try:
+        result = fn(self._cursor(connection, self._request_totals()))
+        connection.commit()
+        return result
+      except Exception:
+        connection.rollback()
+        raise
+    connection = self.pool.acquire()
+    try:
+      result = fn(self._cursor(connection))
+      connection.commit()
+      return result
+    finally:
+      # Rolls back a transaction fn left unfinished
+      self.pool.release(connection)
+
+  def add_connect_hook(self, hook):
+    # hook(connection) runs for every connection the pool opens from now on
+    self.pool.connect_hooks.append(hook)
 
   def get(self):
+    if self.read_pool is not None and has_request_context() and request.method in READ_METHODS:
+      if 'read_db' not in g:
+        g.read_db = self.read_pool.acquire()
+      return g.read_db
     if 'db' not in g:
-      g.db = sqlite3.connect(self.database)
-      g.db.row_factory = sqlite3.Row  # Return rows as dictionaries
+      g.db = self.pool.acquire()
     return g.db
 
   def commit(self):
     self.get().commit()
 
+  def rollback(self):
+    self.get().rollback()
+
   def cursor(self):
     # Ensure the connection is valid before getting a cursor
-    connection = self.get()
-    return connection.cursor()
+    return self._cursor(self.get(), self._request_totals())
+
+  def stream_cursor(self):
+    # Cursor on a connection of its own for a streamed response, which outlives the
+    # request's teardown. Hand it to release_cursor() once the stream is closed.
+    # Raises TimeoutError when every stream connection stays busy.
+    pool = self._stream_pool()
+    connection = pool.acquire()
+    try:
+      return self._cursor(connection, self._request_totals())
+    except Exception:
+      pool.release(connection)
+      raise
+
+  def release_cursor(self, cursor):
+    connection = cursor.connection
+    cursor.close()
+    self._stream_pool().release(connection)
+
+  def _stream_pool(self):
+    return self.stream_pool or self.read_pool or self.pool
+
+  def _cursor(self, connection, totals=None):
+    if not self.timed_cursors and self.slow_queries is None:
+      return connection.cursor()
+    cursor = connection.cursor(TimedCursor)
+    cursor.totals = totals
+    cursor.slow_queries = self.slow_queries
+    return cursor
+
+  def _request_totals(self):
+    # Request totals exist only while lib.metrics is timing a request
+    if not self.timed_cursors or not has_app_context():
+      return None
+    return getattr(g._get_current_object(), 'sql_totals', None)
 
   def close(self):
+    # Hand the request's connection back to the pool
     db = g.pop('db', None)
     if db is not None:
-      db.close()
+      self.pool.release(db)
+    db = g.pop('read_db', None)
+    if db is not None:
+      self.read_pool.release(db)
+
+  def pool_stats(self):
+    stats = self.pool.stats()
+    if self.read_pool is not None:
+      stats['read'] = self.read_pool.stats()
+    if self.stream_pool is not None:
+      stats['stream'] = self.stream_pool.stats()
+    return stats
+
+  def define(self, name, template, **choices):
+    # Register a route statement, see StatementRegistry.define. Call before the first request.
+    self.statements.define(name, template, **choices)
+    self.pool.cached_statements = self.statements.cache_size()
+
+  def execute(self, cursor, name, params=(), **variant):
+    # Run one pre-rendered variant of a registered statement
+    return self.statements.execute(cursor, name, params, **variant)
+
+  def table_versions(self, cursor, names):
+    # Current version of each table in `names`, in the same order
+    placeholders = ','.join('?' * len(names))
+    cursor.execute(f'SELECT name, version FROM table_versions WHERE name IN ({placeholders})', tuple(names))
+    versions = dict(cursor.fetchall())
+    return tuple(versions.get(name, 0) for name in names)
+
+  def counter(self, cursor, name, key=0):
+    # A row count maintained by the triggers from migration 0012, 0 if nothing was counted yet
+    cursor.execute('SELECT value FROM counters WHERE name = ? AND key = ?', (name, key))
+    row = cursor.fetchone()
+    return row[0] if row is not None else 0
 
-  # Function to load SQL from a file
+  def bump_table_versions(self, cursor, *names):
+    # Call inside the write transaction so readers never see new rows with an old version
+    cursor.executemany('''
+      INSERT INTO table_versions (name, version) VALUES (?, 1)
+      ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', [(name,) for name in names])
+
+  # Function to load SQL from a file, every file under sql/ is read once at startup
   def sql(self, filepath):
-    with open('sql/' + filepath, 'r') as file:
-      return file.read()
+    return self.statements.file(filepath)
 
   # Function to load the words from a JSON file
   def load_json(self, filepath):
@@ -59,61 +343,79 @@ class Db:
     cursor.execute(self.sql('setup/create_table_study_sessions.sql'))
     self.get().commit()
 
+  def schema_migrations(self):
+    # sql/migrations/*.sql as lib.migrations.Migration, ordered by version
+    if self._migrations is None:
+      self._migrations = migrations.load(
+        {path: self.sql(path) for path in self.statements.files('migrations/')},
+        include=self.sql
+      )
+    return self._migrations
+
+  def migrate(self,cursor,timezone=None):
+    # Apply the migrations schema_migrations doesn't list yet, each in its own transaction.
+    # `timezone` is the streak's day boundary for the backfills, None is server local time.
+    return migrations.apply(cursor.connection, self.schema_migrations(), backfills=migrations.default_backfills(timezone))
+
+  def migrate_on_start(self, timezone=None):
+    # One primary key read when the schema is current. A database without tables is
+    # left alone, `invoke init-db` creates them and migrates.
+    connection = self.pool.acquire()
+    try:
+      if migrations.is_current(connection, self.schema_migrations()):
+        return []
+      if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'words'").fetchone():
+        return []
+      return migrations.apply(connection, self.schema_migrations(), backfills=migrations.default_backfills(timezone))
+    finally:
+      self.pool.release(connection)
+
+  def rebuild(self, app, name):
+    # Recompute a derived table from the source rows with sql/rebuild/<name>.sql, in one
+    # transaction. The migration that adds the table runs the same file as its backfill.
+    with app.app_context():
+      connection = self.get()
+      connection.execute('BEGIN IMMEDIATE')
+      try:
+        for statement in migrations.split_statements(self.sql(f'rebuild/{name}.sql')):
+          connection.execute(statement)
+        connection.commit()
+      except Exception:
+        connection.rollback()
+        raise
+      finally:
+        self.close()
+
   def import_study_activities_json(self,cursor,data_json_path):
     study_actvities = self.load_json(data_json_path)
     for activity in study_actvities:
       cursor.execute('''
       INSERT INTO study_activities (name,url,preview_url) VALUES (?,?,?)
       ''', (activity['name'],activity['url'],activity['preview_url'],))
+    # The study_activities version is bumped by the triggers from migration 0011
     self.get().commit()
 
-  def import_word_json(self,cursor,group_name,data_json_path):
-      # Insert a new group
-      cursor.execute('''
-        INSERT INTO groups (name) VALUES (?)
-      ''', (group_name,))
-      self.get().commit()
-
-      # Get the ID of the group
-      cursor.execute('SELECT id FROM groups WHERE name = ?', (group_name,))
-      core_verbs_group_id = cursor.fetchone()[0]
-
-      # Insert some sample words (verbs) from JSON file and associate with the group
-      words = self.load_json(data_json_path)
-
-      for word in words:
-        # Insert the word into the words table
-        cursor.execute('''
-          INSERT INTO words (kanji, romaji, english, parts) VALUES (?, ?, ?, ?)
-        ''', (word['kanji'], word['romaji'], word['english'], json.dumps(word['parts'])))
-        
-        # Get the last inserted word's ID
-        word_id = cursor.lastrowid
-
-        # Insert the word-group relationship into word_groups table
-        cursor.execute('''
-          INSERT INTO word_groups (word_id, group_id) VALUES (?, ?)
-        ''', (word_id, core_verbs_group_id))
-      self.get().commit()
-
-      # Update the words_count in the groups table by counting all words in the group
-      cursor.execute('''
-        UPDATE groups
-        SET words_count = (
-          SELECT COUNT(*) FROM word_groups WHERE group_id = ?
-        )
-        WHERE id = ?
-      ''', (core_verbs_group_id, core_verbs_group_id))
-
+  def import_word_json(self,cursor,group_name,data_json_path,batch_size=1000,progress=None):
+      # Stream the words into the group in batches, skipping words that already exist
+      stats = importer.import_words(
+        cursor,
+        group_name,
+        data_json_path,
+        batch_size=batch_size,
+        progress=progress
+      )
+      # The words, groups and word_groups versions are bumped by the triggers from migration 0013
       self.get().commit()
 
-      print(f"Successfully added {len(words)} verbs to the '{group_name}' group.")
+      print(f"Successfully added {stats['inserted']} verbs to the '{group_name}' group.")
+      return stats
 
   # Initialize the database with sample data
   def init(self, app):
     with app.app_context():
       cursor = self.cursor()
       self.setup_tables(cursor)
+      self.migrate(cursor)
       self.import_word_json(
         cursor=cursor,
         group_name='Core Verbs',
@@ -129,6 +431,7 @@ class Db:
         cursor=cursor,
         data_json_path='seed/study_activities.json'
       )
+      self.close()
 
 # Create an instance of the Db class
 db = Db()
@@ -0,0 +1,52 @@
+import json
+
+# Row-by-row JSON encoding for the streaming export endpoints. orjson is used when
+# it is installed, it encodes a row several times faster than the json module.
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+FORMATS = {
+  'json': 'application/json',
+  'ndjson': 'application/x-ndjson'
+}
+
+# Rows fetched and written per chunk of the response
+CHUNK_ROWS = 500
+
+if orjson is not None:
+  def dumps(value):
+    return orjson.dumps(value)
+else:
+  def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+def encode_word(row):
+  # words.parts is already stored as JSON text, it is spliced in instead of parsed and re-encoded
+  head = dumps({'id': row[0], 'kanji': row[1], 'romaji': row[2], 'english': row[3]})
+  return head[:-1] + b',"parts":' + row[4].encode() + b'}'
+
+def stream_rows(cursor, encode, format='ndjson', chunk_rows=CHUNK_ROWS):
+  """
+  Yield the rows of an executed cursor as NDJSON lines or as one JSON array.
+
+  Rows are fetched `chunk_rows` at a time and every chunk is encoded and yielded
+  as one bytes object, so memory stays flat however many rows the query returns.
+  """
+  separator = b'\n' if format == 'ndjson' else b','
+  first = True
+  if format == 'json':
+    yield b'['
+  while True:
+    rows = cursor.fetchmany(chunk_rows)
+    if not rows:
+      break
+    chunk = separator.join(encode(row) for row in rows)
+    if format == 'ndjson':
+      yield chunk + b'\n'
+    else:
+      yield chunk if first else b',' + chunk
+    first = False
+  if format == 'json':
+    yield b']'
@@ -0,0 +1,152 @@
+import json
+import time
+
+# Streaming word-deck importer. The JSON array is decoded one item at a time and
+# words are written in executemany batches through a temporary staging table, so
+# memory stays flat and every batch is deduplicated with a few set-based statements.
+
+# Characters that can continue a JSON number
+NUMBER_CHARS = '0123456789.eE+-'
+
+def iter_json_array(file, chunk_size=65536):
+  """
+  Yield the items of the top-level JSON array in `file` without reading it all into memory.
+  """
+  decoder = json.JSONDecoder()
+  buffer = file.read(chunk_size)
+  eof = not buffer
+  position = 0
+  started = False
+
+  while True:
+    # Skip whitespace and separators, reading more input when the buffer runs out
+    while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+      if buffer[position] == '[':
+        if started:
+          break
+        started = True
+      position += 1
+    if position >= len(buffer):
+      if eof:
+        raise ValueError("Unexpected end of JSON array")
+      buffer = file.read(chunk_size)
+      eof = not buffer
+      position = 0
+      continue
+    if not started:
+      raise ValueError("Expected a JSON array")
+    if buffer[position] == ']':
+      return
+
+    try:
+      item, end = decoder.raw_decode(buffer, position)
+      # A value that touches the end of the buffer may continue in the next chunk, and
+      # a number cut before its fraction or exponent ("-1500." then "0") decodes short
+      if not eof and (end == len(buffer) or (isinstance(item, (int, float)) and buffer[end] in NUMBER_CHARS)):
+        raise json.JSONDecodeError("Incomplete value", buffer, end)
+    except json.JSONDecodeError:
+      if eof:
+        raise
+      chunk = file.read(chunk_size)
+      eof = not chunk
+      buffer = buffer[position:] + chunk
+      position = 0
+      continue
+    yield item
+    position = end
+
+    # Drop consumed input so the buffer stays around one chunk long
+    if position > chunk_size:
+      buffer = buffer[position:]
+      position = 0
+
+def import_words(cursor, group_name, data_json_path, batch_size=1000, progress=None):
+  """
+  Import the words in `data_json_path` into the group `group_name` (created if missing).
+
+  Words already present with the same kanji and english are not inserted again
+  but are still linked to the group. Everything runs in the caller's transaction;
+  the caller commits. `progress(stats)` is called after every batch.
+  Returns the stats: words read, inserted, skipped as duplicates and linked to the group.
+  """
+  started = time.perf_counter()
+  stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'linked': 0, 'seconds': 0.0}
+
+  cursor.execute('SELECT id FROM groups WHERE name = ?', (group_name,))
+  group = cursor.fetchone()
+  if group:
+    group_id = group[0]
+  else:
+    cursor.execute('INSERT INTO groups (name) VALUES (?)', (group_name,))
+    group_id = cursor.lastrowid
+
+  cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS import_words_stage (
+      position INTEGER PRIMARY KEY,
+      kanji TEXT NOT NULL,
+      romaji TEXT NOT NULL,
+      english TEXT NOT NULL,
+      parts TEXT NOT NULL
+    )
+  ''')
+  cursor.execute('CREATE INDEX IF NOT EXISTS temp.idx_import_words_stage ON import_words_stage(kanji, english)')
+  cursor.execute('DELETE FROM import_words_stage')
+
+  def flush(batch):
+    cursor.executemany('''
+      INSERT INTO import_words_stage (position, kanji, romaji, english, parts) VALUES (?, ?, ?, ?, ?)
+    ''', batch)
+
+    # New words only, the first occurrence wins when a batch repeats a word
+    cursor.execute('''
+      INSERT INTO words (kanji, romaji, english, parts)
+      SELECT s.kanji, s.romaji, s.english, s.parts
+      FROM import_words_stage s
+      WHERE NOT EXISTS (SELECT 1 FROM words w WHERE w.kanji = s.kanji AND w.english = s.english)
+        AND s.position = (
+          SELECT MIN(d.position) FROM import_words_stage d WHERE d.kanji = s.kanji AND d.english = s.english
+        )
+      ORDER BY s.position
+    ''')
+    inserted = cursor.rowcount
+
+    # CROSS JOIN keeps the small staging table as the outer loop, SQLite has no statistics for it
+    cursor.execute('''
+      INSERT INTO word_groups (word_id, group_id)
+      SELECT DISTINCT w.id, ?
+      FROM import_words_stage s
+      CROSS JOIN words w ON w.kanji = s.kanji AND w.english = s.english
+      WHERE NOT EXISTS (SELECT 1 FROM word_groups wg WHERE wg.word_id = w.id AND wg.group_id = ?)
+    ''', (group_id, group_id))
+    linked = cursor.rowcount
+
+    cursor.execute('DELETE FROM import_words_stage')
+    stats['read'] += len(batch)
+    stats['inserted'] += inserted
+    stats['duplicates'] += len(batch) - inserted
+    stats['linked'] += linked
+    stats['seconds'] = time.perf_counter() - started
+    if progress:
+      progress(stats)
+
+  batch = []
+  with open(data_json_path, 'r') as file:
+    for word in iter_json_array(file):
+      batch.append((
+        stats['read'] + len(batch),
+        word['kanji'],
+        word['romaji'],
+        word['english'],
+        json.dumps(word['parts'], ensure_ascii=False)
+      ))
+      if len(batch) >= batch_size:
+        flush(batch)
+        batch = []
+  if batch:
+    flush(batch)
+
+  # groups.words_count is kept up by the word_groups triggers from migration 0012
+
+  stats['group_id'] = group_id
+  stats['seconds'] = time.perf_counter() - started
+  return stats
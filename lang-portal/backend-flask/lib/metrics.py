@@ -0,0 +1,240 @@
+import bisect
+import collections
+import sqlite3
+import threading
+import time
+from flask import g, request
+
+# Upper bounds in seconds, shared by the request and SQL time histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Finished requests are queued and folded into the histograms this many at a time
+FOLD_EVERY = 256
+
+# Bound once, attribute lookups add up at a few per statement
+perf_counter = time.perf_counter
+Cursor = sqlite3.Cursor
+
+class TimedCursor(sqlite3.Cursor):
+  """
+  Cursor that times the statements it runs, handed out by Db.cursor().
+
+  With `totals` ([statements, seconds]) set, it adds every statement and the
+  time spent executing and fetching it. With `slow_queries` set, a statement
+  whose execute plus fetches so far reach the threshold is reported once.
+  """
+  totals = None
+  slow_queries = None
+  _statement = None  # [sql, parameters, seconds] of the statement being fetched
+
+  def execute(self, sql, parameters=()):
+    started = perf_counter()
+    try:
+      return Cursor.execute(self, sql, parameters)
+    finally:
+      self._add(perf_counter() - started, sql, parameters)
+
+  def executemany(self, sql, seq_of_parameters):
+    started = perf_counter()
+    try:
+      return Cursor.executemany(self, sql, seq_of_parameters)
+    finally:
+      self._add(perf_counter() - started, sql, None)
+
+  def executescript(self, sql_script):
+    started = perf_counter()
+    try:
+      return Cursor.executescript(self, sql_script)
+    finally:
+      self._add(perf_counter() - started, sql_script, None)
+
+  # Rows after the first are stepped while fetching, so that time counts too
+  def fetchone(self):
+    started = perf_counter()
+    try:
+      return Cursor.fetchone(self)
+    finally:
+      self._fetched(perf_counter() - started)
+
+  def fetchmany(self, size=None):
+    started = perf_counter()
+    try:
+      return Cursor.fetchmany(self, self.arraysize if size is None else size)
+    finally:
+      self._fetched(perf_counter() - started)
+
+  def fetchall(self):
+    started = perf_counter()
+    try:
+      return Cursor.fetchall(self)
+    finally:
+      self._fetched(perf_counter() - started)
+
+  def _add(self, elapsed, sql, parameters):
+    totals = self.totals
+    if totals is not None:
+      totals[0] += 1
+      totals[1] += elapsed
+    slow_queries = self.slow_queries
+    if slow_queries is not None:
+      statement = self._statement = [sql, parameters, elapsed]
+      self._check(statement, slow_queries)
+
+  def _fetched(self, elapsed):
+    totals = self.totals
+    if totals is not None:
+      totals[1] += elapsed
+    statement = self._statement
+    if statement is not None:
+      statement[2] += elapsed
+      self._check(statement, self.slow_queries)
+
+  def _check(self, statement, slow_queries):
+    if statement[2] >= slow_queries.threshold:
+      self._statement = None
+      slow_queries.record(self.connection, *statement)
+
+class Histogram:
+  def __init__(self, buckets=BUCKETS):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+    self.sum = 0.0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+
+class Metrics:
+  """
+  Per-route request metrics, exported in the Prometheus text format.
+
+  `install(app)` times every request from before_request to after_request and
+  counts it by route rule, method and status. A finished request only queues
+  one tuple; the queue is folded into the histograms every FOLD_EVERY requests
+  and before rendering, so a request pays for two timestamps and an append.
+
+  With `sql=True` the TimedCursors Db.cursor() then hands out add up the
+  statements each request runs and the time spent executing and fetching them,
+  at about a microsecond per statement (`invoke bench-metrics`). Iterating a
+  cursor directly instead of fetching bypasses the timing.
+  """
+  def __init__(self, buckets=BUCKETS, sql=False):
+    self.buckets = buckets
+    self.sql = sql
+    self._routes = {}
+    self._pending = collections.deque()
+    self._lock = threading.Lock()
+
+  def install(self, app):
+    if self.sql:
+      app.db.timed_cursors = True
+    app.before_request(self._start)
+    app.after_request(self._finish)
+
+  def _start(self):
+    # Resolve the g proxy once, every proxy lookup costs a fraction of a microsecond
+    state = g._get_current_object()
+    if self.sql:
+      state.sql_totals = [0, 0.0]
+    state.request_started = perf_counter()
+
+  def _finish(self, response):
+    finished = perf_counter()
+    state = g._get_current_object()
+    started = state.pop('request_started', None)
+    if started is None:
+      return response
+    current = request._get_current_object()
+    rule = current.url_rule
+    pending = self._pending
+    pending.append((current.method, rule.rule if rule is not None else 'unmatched', response.status_code,
+                    finished - started, state.pop('sql_totals', None)))
+    if len(pending) >= FOLD_EVERY:
+      self._fold()
+    return response
+
+  def _fold(self):
+    # deque appends and pops are atomic, requests keep queueing while this runs
+    pending = self._pending
+    with self._lock:
+      while True:
+        try:
+          method, rule, status, elapsed, totals = pending.popleft()
+        except IndexError:
+          return
+        route = self._routes.get((method, rule))
+        if route is None:
+          route = self._routes[(method, rule)] = {
+            'duration': Histogram(self.buckets),
+            'sql_duration': Histogram(self.buckets),
+            'statuses': {},
+            'statements': 0
+          }
+        route['duration'].observe(elapsed)
+        if totals is not None:
+          route['sql_duration'].observe(totals[1])
+          route['statements'] += totals[0]
+        route['statuses'][status] = route['statuses'].get(status, 0) + 1
+
+  def render(self):
+    # Prometheus text exposition format 0.0.4
+    self._fold()
+    with self._lock:
+      routes = sorted(
+        (key, route['duration'].counts[:], route['duration'].sum, route['sql_duration'].counts[:],
+         route['sql_duration'].sum, dict(route['statuses']), route['statements'])
+        for key, route in self._routes.items()
+      )
+    lines = [
+      '# HELP lang_portal_requests_total Requests by route, method and status.',
+      '# TYPE lang_portal_requests_total counter'
+    ]
+    for (method, rule), _, _, _, _, statuses, _ in routes:
+      for status, count in sorted(statuses.items()):
+        lines.append(f'lang_portal_requests_total{labels(method, rule, status=status)} {count}')
+    lines += [
+      '# HELP lang_portal_request_duration_seconds Request latency by route.',
+      '# TYPE lang_portal_request_duration_seconds histogram'
+    ]
+    for (method, rule), counts, total, _, _, _, _ in routes:
+      lines += self._histogram('lang_portal_request_duration_seconds', method, rule, counts, total)
+    if not self.sql:
+      return '\n'.join(lines) + '\n'
+    lines += [
+      '# HELP lang_portal_sql_duration_seconds Time spent in SQLite per request, by route.',
+      '# TYPE lang_portal_sql_duration_seconds histogram'
+    ]
+    for (method, rule), _, _, counts, total, _, _ in routes:
+      lines += self._histogram('lang_portal_sql_duration_seconds', method, rule, counts, total)
+    lines += [
+      '# HELP lang_portal_sql_statements_total SQL statements executed by route.',
+      '# TYPE lang_portal_sql_statements_total counter'
+    ]
+    for (method, rule), _, _, _, _, _, statements in routes:
+      lines.append(f'lang_portal_sql_statements_total{labels(method, rule)} {statements}')
+    return '\n'.join(lines) + '\n'
+
+  def _histogram(self, name, method, rule, counts, total):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(self.buckets + ('+Inf',), counts):
+      cumulative += count
+      lines.append(f'{name}_bucket{labels(method, rule, le=bound)} {cumulative}')
+    lines.append(f'{name}_sum{labels(method, rule)} {total}')
+    lines.append(f'{name}_count{labels(method, rule)} {cumulative}')
+    return lines
+
+def labels(method, rule, **extra):
+  pairs = [('method', method), ('route', rule)] + list(extra.items())
+  return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs) + '}'
+
+def escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def percentile(samples, pct):
+  # Nearest-rank percentile of a list of samples, 0.0 for none
+  if not samples:
+    return 0.0
+  ordered = sorted(samples)
+  index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+  return ordered[index]
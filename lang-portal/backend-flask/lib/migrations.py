@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+from lib import srs, streak
+
+# Versioned migrations: sql/migrations/NNNN_name.sql is applied once, in its own
+# transaction, and recorded in schema_migrations with the checksum of its text.
+
+# `-- include rebuild/x.sql` runs another file under sql/ in its place, so a backfill
+# lives only in the rebuild script. The checksum covers the directive, not the file.
+INCLUDE = re.compile(r'^-- include (\S+)[ \t]*$', re.M)
+# `-- backfill <name>` runs backfills[name](cursor) after the statements, in the same
+# transaction, for derived state that is computed in Python rather than in SQL
+BACKFILL = re.compile(r'^-- backfill (\S+)[ \t]*$', re.M)
+
+CREATE_TABLE = '''
+  CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    duration_ms REAL NOT NULL
+  )
+'''
+
+class MigrationError(Exception):
+  pass
+
+class Migration:
+  def __init__(self, path, sql, include=None):
+    self.name = os.path.basename(path)
+    self.version = int(self.name.split('_', 1)[0])
+    self.checksum = hashlib.sha256(sql.encode()).hexdigest()
+    self.backfills = BACKFILL.findall(sql)
+    self.sql = INCLUDE.sub(lambda match: self._include(include, match.group(1)), sql)
+
+  def _include(self, include, path):
+    if include is None:
+      raise MigrationError(f"{self.name} includes {path} but no include loader was given")
+    return include(path)
+
+def load(files, include=None):
+  # Migrations from a {path: sql} mapping, ordered by version. include(path) returns
+  # the text of a file under sql/ for the `-- include` directives.
+  migrations = sorted((Migration(path, sql, include) for path, sql in files.items()), key=lambda m: m.version)
+  for previous, migration in zip(migrations, migrations[1:]):
+    if previous.version == migration.version:
+      raise MigrationError(f"{previous.name} and {migration.name} share version {migration.version}")
+  return migrations
+
+def load_directory(directory):
+  # `directory` is sql/migrations, included paths are relative to sql/
+  def read(path):
+    with open(path, 'r') as file:
+      return file.read()
+
+  root = os.path.dirname(os.path.normpath(directory))
+  files = {name: read(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith('.sql')}
+  return load(files, include=lambda path: read(os.path.join(root, path)))
+
+def default_backfills(timezone=None):
+  # The `-- backfill` names and what they run, the streak counts days in `timezone`
+  return {
+    'streak': lambda cursor: streak.rebuild(cursor, timezone),
+    'srs': srs.rebuild
+  }
+
+def is_current(connection, migrations):
+  """
+  True if the newest migration is applied with the same checksum.
+
+  This is the startup check: one primary key read. Edits to older
+  migrations are only caught by apply(), which compares every checksum.
+  """
+  if not migrations:
+    return True
+  latest = migrations[-1]
+  try:
+    row = connection.execute('SELECT checksum FROM schema_migrations WHERE version = ?', (latest.version,)).fetchone()
+  except sqlite3.OperationalError:
+    return False  # No schema_migrations yet
+  return row is not None and row[0] == latest.checksum
+
+def applied(connection):
+  connection.execute(CREATE_TABLE)
+  connection.commit()
+  return {version: (name, checksum) for version, name, checksum in
+          connection.execute('SELECT version, name, checksum FROM schema_migrations')}
+
+def apply(connection, migrations, progress=None, backfills=None):
+  """
+  Apply the migrations not recorded in schema_migrations, oldest first, and
+  return the ones applied.
+
+  Each one runs with its schema_migrations row in one transaction, taken with
+  BEGIN IMMEDIATE so two processes starting together apply it once: the second
+  one finds the row after getting the lock and skips it. A failed migration is
+  rolled back entirely and stops the run. A recorded migration whose checksum
+  differs from its file raises MigrationError before anything is applied, a
+  migration that shipped must not be edited, add a new one instead.
+
+  `backfills` maps the `-- backfill` names to functions of a cursor,
+  default_backfills() by default. They only run when the migration is
+  applied, so a database created after it doesn't replay the history.
+  """
+  backfills = default_backfills() if backfills is None else backfills
+  done = applied(connection)
+  for migration in migrations:
+    if migration.version in done and done[migration.version][1] != migration.checksum:
+      raise MigrationError(f"{migration.name} was changed after it was applied (checksum mismatch)")
+
+  ran = []
+  for migration in migrations:
+    if migration.version in done:
+      continue
+    missing = [name for name in migration.backfills if name not in backfills]
+    if missing:
+      raise MigrationError(f"{migration.name} needs the backfill {missing[0]}, which isn't registered")
+    started = time.perf_counter()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+      if connection.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (migration.version,)).fetchone():
+        connection.rollback()
+        continue
+      # executescript() would commit first, so the script runs statement by statement in this transaction
+      for statement in split_statements(migration.sql):
+        connection.execute(statement)
+      for name in migration.backfills:
+        backfills[name](connection.cursor())
+      connection.execute(
+        'INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (?, ?, ?, ?)',
+        (migration.version, migration.name, migration.checksum, (time.perf_counter() - started) * 1000)
+      )
+      connection.commit()
+    except Exception as e:
+      connection.rollback()
+      raise MigrationError(f"{migration.name} failed: {e}") from e
+    ran.append(migration)
+    if progress is not None:
+      progress(migration)
+  return ran
+
+def split_statements(sql):
+  # The complete statements of a script in order, a ; inside a trigger body, string or comment doesn't end one
+  statements = []
+  start = 0
+  end = sql.find(';')
+  while end != -1:
+    if sqlite3.complete_statement(sql[start:end + 1]):
+      statements.append(sql[start:end + 1])
+      start = end + 1
+    end = sql.find(';', end + 1)
+  rest = '\n'.join(line for line in sql[start:].splitlines() if not line.strip().startswith('--'))
+  if rest.strip():
+    raise MigrationError(f"Incomplete statement at the end of the migration: {rest.strip()[:80]}")
+  return statements
@@ -0,0 +1,104 @@
+import threading
+from urllib.parse import urlparse
+from flask import request
+from flask_cors.core import ACL_ORIGIN, get_cors_options, set_cors_headers
+
+# CORS origins allowed by the study_activities URLs, held in memory as a set and
+# reloaded when the table's version changes (see migration 0011).
+
+def origin(url):
+  # https://example.com/app -> https://example.com, None if the URL has no host
+  parsed = urlparse(url)
+  if not parsed.scheme or not parsed.netloc:
+    return None
+  return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+class OriginResolver:
+  """
+  Decides which request origins get CORS headers.
+
+  The allowed set is built from study_activities plus `extra` on the first
+  request that sends an Origin header, and rebuilt whenever the
+  study_activities version differs from the one it was built at, so each CORS
+  request costs one table_versions read and a set lookup. Requests without an
+  Origin header don't touch the database. As before, no activity URLs (or an
+  error reading them) allows every origin.
+
+  Every response goes through here, preflight OPTIONS requests (answered by
+  Flask) included, so no view should set its own CORS headers.
+  """
+  def __init__(self, db, extra=(), methods=None, allow_headers=None):
+    self.db = db
+    self.extra = [value.lower() for value in extra]
+    self._lock = threading.Lock()
+    self._loaded = False
+    self._version = None
+    self._origins = None  # None allows every origin
+    self.methods = methods or ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS']
+    self.allow_headers = allow_headers or ['Content-Type', 'Authorization']
+    self._options = None
+    self._reloads = 0
+
+  def install(self, app):
+    # Origins are matched here, flask_cors only writes the headers
+    self._options = get_cors_options(app, {
+      'origins': '*',
+      'methods': self.methods,
+      'allow_headers': self.allow_headers
+    })
+    app.after_request(self._after_request)
+
+  def allowed(self, value):
+    version = self._current_version()
+    if version != self._version or not self._loaded:
+      self._reload(version)
+    origins = self._origins
+    return origins is None or value.lower() in origins
+
+  def origins(self):
+    # The current allowed set, None when every origin is allowed
+    origins = self._origins
+    return None if origins is None else sorted(origins)
+
+  def stats(self):
+    with self._lock:
+      return {
+        'reloads': self._reloads,
+        'version': self._version,
+        'origins': None if self._origins is None else len(self._origins)
+      }
+
+  def _current_version(self):
+    # On the request's connection directly, a TimedCursor around one primary key read costs more than the read
+    try:
+      row = self.db.get().execute("SELECT version FROM table_versions WHERE name = 'study_activities'").fetchone()
+      return row[0] if row is not None else 0
+    except Exception:
+      return None  # No table_versions yet, _reload falls back as well
+
+  def _reload(self, version):
+    with self._lock:
+      if self._loaded and version == self._version:
+        return  # Another thread reloaded it
+      origins = set()
+      try:
+        cursor = self.db.cursor()
+        cursor.execute('SELECT url FROM study_activities')
+        for row in cursor.fetchall():
+          value = origin(row['url'] or '')
+          if value is not None:
+            origins.add(value)
+      except Exception:
+        origins = set()
+      self._origins = frozenset(origins | set(self.extra)) if origins else None
+      self._version = version
+      self._loaded = True
+      self._reloads += 1
+
+  def _after_request(self, response):
+    value = request.headers.get('Origin')
+    if not value or response.headers.get(ACL_ORIGIN):
+      return response
+    if self.allowed(value):
+      set_cors_headers(response, self._options)
+    return response
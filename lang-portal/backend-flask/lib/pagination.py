@@ -0,0 +1,45 @@
+import base64
+import json
+
+# Keyset (cursor) pagination. A cursor is an opaque token holding the sort key and
+# id of the last row of a page; the next page seeks past it instead of using OFFSET,
+# so every page costs the same no matter how deep it is.
+
+class InvalidCursor(ValueError):
+  pass
+
+def encode_cursor(sort_by, order, value, id):
+  payload = json.dumps([sort_by, order, value, id], separators=(',', ':'))
+  return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, sort_by, order):
+  """
+  Return the (sort value, id) stored in `token`.
+  Raises InvalidCursor if the token is malformed, holds anything but a scalar
+  sort value and an integer id, or was issued for another sort.
+  """
+  try:
+    payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    cursor_sort_by, cursor_order, value, id = json.loads(payload)
+  except (ValueError, TypeError):
+    raise InvalidCursor("Invalid cursor")
+  # Both are bound as query parameters, a list or object would fail in sqlite3 with a 500
+  if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+    raise InvalidCursor("Invalid cursor")
+  if isinstance(id, bool) or not isinstance(id, int):
+    raise InvalidCursor("Invalid cursor")
+  if cursor_sort_by != sort_by or cursor_order != order:
+    raise InvalidCursor("Cursor does not match sort_by and order")
+  return value, id
+
+def seek_clause(column, id_column, order):
+  # Row-value comparison so SQLite can range-scan the (column, rowid) index
+  operator = '>' if order == 'asc' else '<'
+  return f'({column}, {id_column}) {operator} (?, ?)'
+
+def next_cursor(rows, limit, sort_by, order, sort_key, id_key='id'):
+  # Rows are fetched with limit + 1, a cursor is only issued if there is another page
+  if len(rows) <= limit:
+    return None
+  last = rows[limit - 1]
+  return encode_cursor(sort_by, order, last[sort_key], last[id_key])
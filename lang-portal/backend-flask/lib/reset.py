@@ -0,0 +1,182 @@
+import sqlite3
+import threading
+import time
+from lib.db import PRAGMA_PROFILES
+
+# The study history reset. Everything derived from the history is cleared in one
+# short write, the raw rows are then deleted a chunk at a time in the background.
+
+# Raised by the migration 0014 trigger for reviews of sessions being deleted
+IN_PROGRESS = 'study history reset in progress'
+
+def refused(error):
+  # True for a write refused because its session is being reset
+  return isinstance(error, sqlite3.IntegrityError) and IN_PROGRESS in str(error)
+
+# Columns copied to the archive, in the order of sql/archive/schema.sql
+COLUMNS = {
+  'word_review_items': 'id, word_id, study_session_id, correct, created_at',
+  'study_sessions': 'id, group_id, study_activity_id, created_at'
+}
+
+def clear_derived(cursor):
+  # The counter cache and rollups only reflect the history being cleared
+  cursor.execute('''
+    UPDATE word_reviews SET correct_count = 0, wrong_count = 0, last_reviewed = NULL
+    WHERE correct_count > 0 OR wrong_count > 0
+  ''')
+  cursor.execute('DELETE FROM study_daily_stats')
+  cursor.execute('DELETE FROM study_session_summary')
+  cursor.execute('DELETE FROM word_srs')
+  cursor.execute('''
+    DELETE FROM counters
+    WHERE name IN ('study_sessions', 'group_sessions', 'activity_sessions', 'session_words')
+  ''')
+  cursor.execute('UPDATE group_word_due SET due_at = NULL WHERE due_at IS NOT NULL')
+  cursor.execute('UPDATE study_streak SET last_study_date = NULL, current_streak = 0, longest_streak = 0')
+  cursor.execute('''
+    UPDATE study_totals
+    SET sessions_count = 0, reviews_count = 0, correct_count = 0, words_studied = 0, mastered_words = 0
+  ''')
+
+class HistoryReset:
+  """
+  Clears the study history in the background, one reset at a time.
+
+  The first step runs through Db.write(): it takes the newest session id as
+  the cutoff and clears everything derived from the history, so the routes
+  reading those tables show an empty history from then on. The review items
+  of the sessions up to the cutoff, then the sessions themselves, are deleted
+  `chunk` rows per transaction on a connection of the job's own, with a
+  `pause` between chunks, so no transaction holds the write lock for long and
+  the WAL can be checkpointed as it goes. Sessions started during the reset
+  are kept. A `chunk` of -1 deletes everything in one transaction.
+
+  The cutoff is kept in the history_reset table until every row up to it is
+  deleted. Its trigger (migration 0014) refuses new reviews for those
+  sessions, from any writer, so nothing is counted again by the cleared
+  rollups and then deleted from under them. A failed reset keeps refusing
+  them until a reset completes.
+
+  With `archive=True` the rows are first copied to the `archive` database
+  (sql/archive/schema.sql), in the same transaction that deletes them.
+  """
+  def __init__(self, db, archive, chunk=5000, pause=0.01):
+    self.db = db
+    self.archive = archive
+    self.chunk = chunk
+    self.pause = pause
+    self._lock = threading.Lock()
+    self._thread = None
+    self._wal = False
+    self._status = {'state': 'idle'}
+
+  def run(self, archive=False):
+    started = time.perf_counter()
+    self._update(
+      state='running', phase='clearing', archive=self.archive if archive else None, error=None,
+      reviews_deleted=0, sessions_deleted=0, chunks=0, max_chunk_ms=0.0
+    )
+    try:
+      cutoff, sessions, reviews = self.db.write(self._clear)
+      self._update(phase='reviews', cutoff=cutoff, sessions_total=sessions, reviews_total=reviews)
+      connection = self._connect(archive)
+      try:
+        self._drain(connection, 'word_review_items', 'study_session_id', cutoff, archive, 'reviews_deleted')
+        self._update(phase='sessions')
+        self._drain(connection, 'study_sessions', 'id', cutoff, archive, 'sessions_deleted')
+        connection.execute('DELETE FROM history_reset')
+        connection.commit()
+      finally:
+        connection.close()
+    except Exception as e:
+      self._update(state='failed', error=str(e))
+      raise
+    self._update(state='done', phase=None, seconds=time.perf_counter() - started,
+                 finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    return self.status()
+
+  def start(self, archive=False):
+    # False if a reset is already running
+    with self._lock:
+      if self._thread is not None and self._thread.is_alive():
+        return False
+      self._status = {'state': 'running', 'phase': 'clearing'}
+      self._thread = threading.Thread(target=self._run_quietly, args=(archive,), name='history-reset', daemon=True)
+      self._thread.start()
+      return True
+
+  def wait(self, timeout=None):
+    thread = self._thread
+    if thread is not None:
+      thread.join(timeout)
+
+  def status(self):
+    with self._lock:
+      return dict(self._status)
+
+  def _clear(self, cursor):
+    cursor.execute('SELECT MAX(id) FROM study_sessions')
+    cutoff = cursor.fetchone()[0] or 0
+    cursor.execute('SELECT sessions_count, reviews_count FROM study_totals')
+    totals = cursor.fetchone() or (0, 0)
+    clear_derived(cursor)
+    cursor.execute('INSERT OR REPLACE INTO history_reset (id, cutoff) VALUES (1, ?)', (cutoff,))
+    # Only derived tables changed, the responses built on them are cached under the source tables
+    self.db.bump_table_versions(cursor, 'study_sessions', 'word_review_items')
+    return cutoff, totals[0], totals[1]
+
+  def _connect(self, archive):
+    connection = sqlite3.connect(self.db.database)
+    for name, value in PRAGMA_PROFILES[self.db.profile].items():
+      connection.execute(f'PRAGMA {name} = {value}')
+    self._wal = connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    # The ids of the chunk being moved, so the copy and the delete see the same rows
+    connection.execute('CREATE TEMP TABLE reset_chunk (id INTEGER PRIMARY KEY)')
+    if archive:
+      connection.execute('ATTACH DATABASE ? AS archive', (self.archive,))
+      connection.executescript(self.db.sql('archive/schema.sql'))
+    return connection
+
+  def _drain(self, connection, table, column, cutoff, archive, counter):
+    columns = COLUMNS[table]
+    while True:
+      started = time.perf_counter()
+      connection.execute('BEGIN IMMEDIATE')
+      try:
+        connection.execute('DELETE FROM temp.reset_chunk')
+        connection.execute(f'INSERT INTO temp.reset_chunk SELECT id FROM main.{table} WHERE {column} <= ? LIMIT ?',
+                           (cutoff, self.chunk))
+        if archive:
+          connection.execute(f'''
+            INSERT INTO archive.{table} ({columns})
+            SELECT {columns} FROM main.{table} WHERE id IN temp.reset_chunk
+          ''')
+        # The migration 0015 triggers bump the table's version, cached responses go stale with every chunk
+        deleted = connection.execute(f'DELETE FROM main.{table} WHERE id IN temp.reset_chunk').rowcount
+        connection.commit()
+      except Exception:
+        connection.rollback()
+        raise
+      elapsed_ms = (time.perf_counter() - started) * 1000
+      if self._wal:
+        # Readers always in flight keep the automatic checkpoints from ever restarting
+        # the WAL, which would then grow by every page the reset touches
+        connection.execute('PRAGMA wal_checkpoint(RESTART)')
+      with self._lock:
+        self._status[counter] += deleted
+        self._status['chunks'] += 1
+        self._status['max_chunk_ms'] = max(self._status['max_chunk_ms'], elapsed_ms)
+      if self.chunk < 0 or deleted < self.chunk:
+        return
+      time.sleep(self.pause)
+
+  def _run_quietly(self, archive):
+    try:
+      self.run(archive)
+    except Exception:
+      pass  # Reported through status()
+
+  def _update(self, **values):
+    with self._lock:
+      self._status.update(values)
@@ -0,0 +1,283 @@
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from lib import srs
+from lib.metrics import percentile
+from lib.writer import WriterBusy, is_busy
+
+ACK_MODES = ('buffered', 'durable')
+
+# Once the spool is this large it is rewritten with only the reviews not committed yet
+SPOOL_TRIM_BYTES = 1 << 20
+
+def retryable(error):
+  # Lock contention clears up, anything else fails the same way on every retry
+  return isinstance(error, WriterBusy) or is_busy(error)
+
+class ReviewBuffer:
+  """
+  Write-behind queue for single review POSTs.
+
+  Reviews are appended to a spool file and queued; a background thread writes
+  the queue to word_review_items in one transaction every `max_items` reviews
+  or `max_delay` seconds, whichever comes first. `submit()` returns a Pending
+  that a `durable` request waits on until its group commit, a `buffered`
+  request returns as soon as the review is in the spool. A durable review
+  doesn't wait for max_delay: it is flushed as soon as the flusher is free,
+  together with everything that queued up during the previous flush.
+
+  Every review gets a sequence number and the flush records the highest one it
+  committed in review_buffer_state, in the same transaction. After a crash,
+  spool entries past that number are replayed on startup, so each buffered
+  review is written exactly once. The spool is not fsynced, a buffered ack
+  survives a process crash but not a power loss. One process per spool.
+
+  A batch that fails on a busy or locked database is retried with the next
+  flush. Any other failure is retried one review at a time, and a review that
+  fails on its own is appended to `<spool>.failed` with its error and skipped,
+  so one bad review can't hold up the ones behind it.
+  """
+  def __init__(self, db, spool_path, max_items=100, max_delay=0.05, timeout=10.0):
+    self.db = db
+    self.spool_path = spool_path
+    self.max_items = max_items
+    self.max_delay = max_delay
+    self.timeout = timeout
+    self._queue = []
+    self._sequence = 0
+    self._condition = threading.Condition()
+    self._closed = False
+    self._abandon = False
+    self._flush_now = False
+    self._latencies = collections.deque(maxlen=1000)
+    self._metrics = {
+      'submitted': 0,
+      'flushes': 0,
+      'flushed': 0,
+      'errors': 0,
+      'dead_lettered': 0,
+      'recovered': 0,
+      'max_depth': 0
+    }
+    self._spool = None
+    recovered = self._recover()
+    if recovered:
+      # Written before the flusher starts, a busy database leaves them to it
+      self._flush(recovered)
+      self._metrics['recovered'] = sum(1 for pending in recovered if pending.id is not None)
+    self._trim_spool()
+    self._thread = threading.Thread(target=self._run, name='review-buffer', daemon=True)
+    self._thread.start()
+
+  def submit(self, study_session_id, word_id, correct, created_at, durable=False):
+    with self._condition:
+      if self._closed:
+        raise RuntimeError("Review buffer is closed")
+      self._sequence += 1
+      pending = Pending(self._sequence, (study_session_id, word_id, 1 if correct else 0, created_at), durable)
+      self._spool.write(pending.line())
+      self._spool.flush()
+      self._queue.append(pending)
+      self._metrics['submitted'] += 1
+      self._metrics['max_depth'] = max(self._metrics['max_depth'], len(self._queue))
+      if durable:
+        self._flush_now = True
+      if len(self._queue) == 1 or len(self._queue) >= self.max_items or durable:
+        # Start the max_delay clock, or flush now
+        self._condition.notify()
+    return pending
+
+  def close(self, flush=True):
+    # Flush whatever is queued and stop the flusher, safe to call more than once.
+    # With flush=False the queue is only left in the spool, as if the process died.
+    with self._condition:
+      if self._closed:
+        return
+      self._closed = True
+      self._abandon = not flush
+      self._condition.notify()
+    self._thread.join()
+    self._spool.close()
+
+  def stats(self):
+    with self._condition:
+      latencies = list(self._latencies)
+      return dict(
+        self._metrics,
+        depth=len(self._queue),
+        flush_p50_ms=percentile(latencies, 50) * 1000,
+        flush_p95_ms=percentile(latencies, 95) * 1000,
+        flush_max_ms=max(latencies, default=0.0) * 1000
+      )
+
+  def _run(self):
+    while True:
+      with self._condition:
+        # Wait for a full batch, or for max_delay once the first review is queued
+        deadline = None
+        while not self._closed and not self._flush_now and len(self._queue) < self.max_items:
+          if self._queue and deadline is None:
+            deadline = time.monotonic() + self.max_delay
+          remaining = None if deadline is None else deadline - time.monotonic()
+          if remaining is not None and remaining <= 0:
+            break
+          self._condition.wait(remaining)
+        if self._abandon:
+          return
+        batch, self._queue = self._queue[:self.max_items], self._queue[self.max_items:]
+        self._flush_now = any(pending.durable for pending in self._queue)
+        closed = self._closed
+      if batch:
+        flushed = self._flush(batch)
+        self._trim_spool()
+        if not flushed and closed:
+          return  # Left in the spool for the next start
+      elif closed:
+        return
+
+  def _flush(self, batch):
+    # True once every review of the batch is committed or dead-lettered, False if
+    # the rest is back at the front of the queue to retry
+    started = time.perf_counter()
+    try:
+      # Through the db writer when there is one, a failed batch is rolled back
+      first_id = self.db.write(lambda cursor: self._write(cursor, [pending.row for pending in batch], batch[-1].sequence))
+    except Exception as e:
+      if not retryable(e):
+        if len(batch) > 1:
+          # Find the reviews that fail on their own, the others still go in
+          for index, pending in enumerate(batch):
+            if not self._flush([pending]):
+              with self._condition:
+                self._queue[1:1] = batch[index + 1:]
+              return False
+          return True
+        try:
+          self._dead_letter(batch[0], e)
+          batch[0].fail(e)
+          return True
+        except Exception as dead_letter_error:
+          e = dead_letter_error
+      with self._condition:
+        # Put the batch back and retry it with the next flush, the spool still has it
+        self._queue[:0] = batch
+        self._metrics['errors'] += 1
+      for pending in batch:
+        pending.error = e
+      time.sleep(self.max_delay)
+      return False
+
+    with self._condition:
+      self._metrics['flushes'] += 1
+      self._metrics['flushed'] += len(batch)
+      self._latencies.append(time.perf_counter() - started)
+    for index, pending in enumerate(batch):
+      pending.resolve(first_id + index)
+    return True
+
+  def _dead_letter(self, pending, error):
+    # Keep the review and its error in the failed file, then move the committed
+    # sequence past it so it is not replayed either
+    with open(self.spool_path + '.failed', 'a') as failed:
+      failed.write(json.dumps(pending.entry() + [str(error)]) + '\n')
+    self.db.write(lambda cursor: cursor.execute(
+      'UPDATE review_buffer_state SET last_flushed_seq = MAX(last_flushed_seq, ?) WHERE id = 1', (pending.sequence,)
+    ))
+    with self._condition:
+      self._metrics['dead_lettered'] += 1
+
+  def _trim_spool(self):
+    # The spool only needs the reviews that are not committed yet, all of them in the queue
+    # between flushes: emptied when the queue is, rewritten once it outgrows SPOOL_TRIM_BYTES
+    with self._condition:
+      if self._spool is not None and not self._queue:
+        self._spool.truncate(0)
+        return
+      if self._spool is not None and os.fstat(self._spool.fileno()).st_size < SPOOL_TRIM_BYTES:
+        return
+      trimmed = self.spool_path + '.tmp'
+      with open(trimmed, 'w') as file:
+        file.writelines(pending.line() for pending in self._queue)
+      if self._spool is not None:
+        self._spool.close()
+      os.replace(trimmed, self.spool_path)
+      self._spool = open(self.spool_path, 'a')
+
+  def _write(self, cursor, rows, sequence):
+    # Insert a batch and record its last sequence number in one transaction, returns the first id
+    cursor.executemany('''
+      INSERT INTO word_review_items (study_session_id, word_id, correct, created_at)
+      VALUES (?, ?, ?, ?)
+    ''', rows)
+    cursor.execute('SELECT last_insert_rowid()')
+    first_id = cursor.fetchone()[0] - len(rows) + 1
+    srs.record(cursor, [(row[1], row[2] == 1, row[3]) for row in rows])
+    cursor.execute('UPDATE review_buffer_state SET last_flushed_seq = ? WHERE id = 1', (sequence,))
+    return first_id
+
+  def _recover(self):
+    # The spooled reviews a previous process acknowledged but never committed, to
+    # be written before anything new. The sequence continues after the last one.
+    entries = []
+    if os.path.exists(self.spool_path):
+      with open(self.spool_path, 'r') as spool:
+        for line in spool:
+          try:
+            entries.append(json.loads(line))
+          except ValueError:
+            break  # A torn last line, that review was never acknowledged
+    connection = self.db.pool.acquire()
+    try:
+      cursor = connection.cursor()
+      cursor.execute('SELECT last_flushed_seq FROM review_buffer_state WHERE id = 1')
+      flushed = cursor.fetchone()[0]
+    finally:
+      self.db.pool.release(connection)
+    self._sequence = max([flushed] + [entry[0] for entry in entries])
+    return [
+      Pending(sequence, (study_session_id, word_id, correct, datetime.fromisoformat(created_at)))
+      for sequence, study_session_id, word_id, correct, created_at in entries
+      if sequence > flushed
+    ]
+
+class Pending:
+  # A submitted review, resolved with its id once its batch is committed
+  def __init__(self, sequence, row, durable=False):
+    self.sequence = sequence
+    self.row = row
+    self.durable = durable
+    self.id = None
+    self.error = None
+    self._done = threading.Event()
+
+  def entry(self):
+    # The review as stored in the spool
+    study_session_id, word_id, correct, created_at = self.row
+    return [self.sequence, study_session_id, word_id, correct, created_at.isoformat()]
+
+  def line(self):
+    return json.dumps(self.entry()) + '\n'
+
+  def resolve(self, id):
+    self.id = id
+    self.error = None
+    self._done.set()
+
+  def fail(self, error):
+    # Dead-lettered, it will never be committed
+    self.error = error
+    self._done.set()
+
+  def wait(self, timeout):
+    # Returns the review id, raises TimeoutError if the batch wasn't committed in
+    # time, or the error of a review that was dead-lettered
+    if not self._done.wait(timeout):
+      if self.error is not None:
+        raise self.error
+      raise TimeoutError(f"Review was not committed after {timeout}s")
+    if self.id is None:
+      raise self.error
+    return self.id
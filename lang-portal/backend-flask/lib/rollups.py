@@ -0,0 +1,119 @@
+# Consistency checks for the trigger-maintained rollups. Each check pairs the
+# maintained rows with a full recompute from the source tables; any row that
+# appears on only one side is a mismatch.
+
+CHECKS = {
+  'word_reviews': (
+    '''
+    SELECT word_id, correct_count, wrong_count FROM word_reviews
+    ''',
+    '''
+    SELECT word_id, SUM(correct_count), SUM(wrong_count)
+    FROM (
+      SELECT id AS word_id, 0 AS correct_count, 0 AS wrong_count FROM words
+      UNION ALL
+      SELECT word_id, correct = 1, correct = 0 FROM word_review_items
+    )
+    GROUP BY word_id
+    '''
+  ),
+  'study_daily_stats': (
+    '''
+    SELECT study_date, sessions_count, reviews_count, correct_count
+    FROM study_daily_stats
+    WHERE sessions_count > 0 OR reviews_count > 0
+    ''',
+    '''
+    SELECT study_date, SUM(sessions_count), SUM(reviews_count), SUM(correct_count)
+    FROM (
+      SELECT date(created_at) AS study_date, COUNT(*) AS sessions_count, 0 AS reviews_count, 0 AS correct_count
+      FROM study_sessions
+      GROUP BY 1
+      UNION ALL
+      SELECT date(created_at), 0, COUNT(*), SUM(correct = 1)
+      FROM word_review_items
+      GROUP BY 1
+    )
+    GROUP BY study_date
+    '''
+  ),
+  'study_session_summary': (
+    '''
+    SELECT study_session_id, group_id, study_activity_id, start_time, last_activity_time,
+           review_count, correct_count, wrong_count
+    FROM study_session_summary
+    ''',
+    '''
+    SELECT ss.id, ss.group_id, ss.study_activity_id, ss.created_at,
+           MAX(wri.created_at), COUNT(wri.id),
+           COALESCE(SUM(wri.correct = 1), 0), COALESCE(SUM(wri.correct = 0), 0)
+    FROM study_sessions ss
+    LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
+    GROUP BY ss.id
+    '''
+  ),
+  'counters': (
+    '''
+    SELECT name, key, value FROM counters WHERE value <> 0
+    ''',
+    '''
+    SELECT * FROM (
+      SELECT 'words' AS name, 0 AS key, COUNT(*) AS value FROM words
+      UNION ALL
+      SELECT 'groups', 0, COUNT(*) FROM groups
+      UNION ALL
+      SELECT 'study_sessions', 0, COUNT(*) FROM study_sessions
+      UNION ALL
+      SELECT 'group_sessions', group_id, COUNT(*) FROM study_sessions GROUP BY group_id
+      UNION ALL
+      SELECT 'activity_sessions', study_activity_id, COUNT(*) FROM study_sessions GROUP BY study_activity_id
+      UNION ALL
+      SELECT 'session_words', study_session_id, COUNT(DISTINCT word_id) FROM word_review_items GROUP BY study_session_id
+    )
+    WHERE value <> 0
+    '''
+  ),
+  'groups.words_count': (
+    '''
+    SELECT id, words_count FROM groups
+    ''',
+    '''
+    SELECT g.id, COUNT(wg.group_id) FROM groups g LEFT JOIN word_groups wg ON wg.group_id = g.id GROUP BY g.id
+    '''
+  ),
+  'study_totals': (
+    '''
+    SELECT sessions_count, reviews_count, correct_count, words_studied, mastered_words
+    FROM study_totals
+    WHERE id = 1
+    ''',
+    '''
+    WITH per_word AS (
+      SELECT word_id, COUNT(*) AS attempts, SUM(correct = 1) AS correct_count
+      FROM word_review_items
+      GROUP BY word_id
+    )
+    SELECT (SELECT COUNT(*) FROM study_sessions),
+           (SELECT COUNT(*) FROM word_review_items),
+           (SELECT COALESCE(SUM(correct = 1), 0) FROM word_review_items),
+           (SELECT COUNT(*) FROM per_word),
+           (SELECT COUNT(*) FROM per_word WHERE attempts >= 5 AND correct_count * 1.0 / attempts >= 0.8)
+    '''
+  )
+}
+
+def check(cursor, limit=10):
+  """
+  Compare every rollup with a full recompute.
+  Returns {rollup name: {'missing': [...], 'unexpected': [...]}} for the rollups
+  that differ, showing at most `limit` rows on each side. An empty dict means consistent.
+  """
+  mismatches = {}
+  for name, (maintained, recomputed) in CHECKS.items():
+    cursor.execute(f'SELECT * FROM ({recomputed}) EXCEPT SELECT * FROM ({maintained}) LIMIT ?', (limit,))
+    missing = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute(f'SELECT * FROM ({maintained}) EXCEPT SELECT * FROM ({recomputed}) LIMIT ?', (limit,))
+    unexpected = [tuple(row) for row in cursor.fetchall()]
+    if missing or unexpected:
+      mismatches[name] = {'missing': missing, 'unexpected': unexpected}
+  return mismatches
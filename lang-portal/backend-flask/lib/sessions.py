@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta
+
+# How long a study session without any reviews is shown to have lasted
+EMPTY_SESSION_LENGTH = timedelta(minutes=30)
+
+def session_end_time(start_time, last_activity_time):
+  """
+  End of a study session: its last review, or `start_time` + EMPTY_SESSION_LENGTH
+  formatted like SQLite's datetime(start_time, '+30 minutes').
+  """
+  if last_activity_time:
+    return last_activity_time
+  if not start_time:
+    return None
+  try:
+    start = datetime.fromisoformat(start_time) if isinstance(start_time, str) else start_time
+  except ValueError:
+    return None
+  return (start + EMPTY_SESSION_LENGTH).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,138 @@
+import contextlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Per-learner shards: each learner's study data lives in a file of its own under
+# `directory`, with the shared catalog (words, groups, activities) attached
+# read-only as `catalog`. Writes from different learners never share a lock.
+# Only `invoke bench-shards` uses it so far, see lib.bench.shard_router.
+
+LEARNER_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+class ShardRouter:
+  """
+  Routes a learner id to a connection on that learner's shard.
+
+  Every shard gets a small ConnectionPool of its own. The pools are kept in an
+  LRU bounded by `max_open`, the least recently used shard with no connection
+  checked out is closed when a new one is opened. A shard that is in use is
+  never closed, so under load more than `max_open` can be open for a moment.
+
+  Shard files are created on first use with sql/shard/schema.sql. Queries
+  use unqualified table names, the learner's tables are found in the shard
+  and the rest fall through to the catalog, so a join of word_review_items
+  with words works as in the single file layout. The catalog is read-only
+  from a shard connection.
+  """
+  def __init__(self, catalog, directory, schema, make_pool, max_open=64):
+    self.catalog = catalog
+    self.directory = directory
+    self.schema = schema
+    self.make_pool = make_pool  # make_pool(path) -> ConnectionPool
+    self.max_open = max_open
+    self._pools = OrderedDict()  # learner id -> [pool, connections checked out]
+    self._lock = threading.Lock()
+    self._metrics = {
+      'opens': 0,
+      'hits': 0,
+      'evictions': 0
+    }
+    os.makedirs(directory, exist_ok=True)
+
+  def path(self, learner):
+    learner = str(learner)
+    if not LEARNER_ID.match(learner):
+      raise ValueError(f"Invalid learner id: {learner!r}")
+    return os.path.join(self.directory, f'learner-{learner}.db')
+
+  def acquire(self, learner):
+    learner = str(learner)
+    with self._lock:
+      entry = self._pools.get(learner)
+      if entry is None:
+        entry = self._pools[learner] = [self._open(learner), 0]
+        self._metrics['opens'] += 1
+        evicted = self._evict()
+      else:
+        self._pools.move_to_end(learner)
+        self._metrics['hits'] += 1
+        evicted = []
+      # Counted before the lock is released so the pool can't be evicted under us
+      entry[1] += 1
+    for pool in evicted:
+      pool.close_all()
+    try:
+      return entry[0].acquire()
+    except Exception:
+      self._done(entry)
+      raise
+
+  def release(self, learner, connection):
+    with self._lock:
+      entry = self._pools.get(str(learner))
+    if entry is None:
+      connection.close()  # Can't happen while it is checked out, but don't leak it
+      return
+    entry[0].release(connection)
+    self._done(entry)
+
+  @contextlib.contextmanager
+  def connection(self, learner):
+    connection = self.acquire(learner)
+    try:
+      yield connection
+    finally:
+      self.release(learner, connection)
+
+  def close_all(self):
+    with self._lock:
+      pools, self._pools = self._pools, OrderedDict()
+    for pool, _ in pools.values():
+      pool.close_all()
+
+  def stats(self):
+    with self._lock:
+      return dict(
+        self._metrics,
+        max_open=self.max_open,
+        open=len(self._pools),
+        in_use=sum(1 for _, users in self._pools.values() if users)
+      )
+
+  def _open(self, learner):
+    path = self.path(learner)
+    pool = self.make_pool(path)
+    catalog = 'file:' + quote(os.path.abspath(self.catalog)) + '?mode=ro'
+    created = [False]
+
+    def attach(connection):
+      connection.execute('ATTACH DATABASE ? AS catalog', (catalog,))
+      if not created[0]:
+        # Once per pool, and only for a new file: reopening an evicted shard shouldn't re-run the script
+        if not connection.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'word_review_items'").fetchone():
+          connection.executescript(self.schema)
+        created[0] = True
+
+    pool.connect_hooks.append(attach)
+    return pool
+
+  def _evict(self):
+    # Least recently used first, skipping shards that have connections checked out
+    evicted = []
+    for learner in list(self._pools):
+      if len(self._pools) <= self.max_open:
+        break
+      pool, users = self._pools[learner]
+      if users:
+        continue
+      del self._pools[learner]
+      evicted.append(pool)
+      self._metrics['evictions'] += 1
+    return evicted
+
+  def _done(self, entry):
+    with self._lock:
+      entry[1] -= 1
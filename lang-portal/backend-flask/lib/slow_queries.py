@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# String and numeric literals, collapsed to ? so statements differing only in constants share a fingerprint
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+def normalize(sql):
+  sql = LITERALS.sub('?', ' '.join(sql.split()))
+  return PLACEHOLDER_LISTS.sub('(?, ...)', sql)
+
+def fingerprint(normalized):
+  return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+def parameter_shapes(parameters):
+  # Types of the bound values, never the values themselves
+  if parameters is None:
+    return None
+  if isinstance(parameters, dict):
+    return {name: type(value).__name__ for name, value in parameters.items()}
+  return [type(value).__name__ for value in parameters]
+
+def explain(connection, sql, parameters=()):
+  # EXPLAIN QUERY PLAN detail lines, `parameters` are bound like the statement's own
+  return [row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+
+def plan_warnings(plan):
+  # Full table scans and temp B-trees are what the indexes are meant to remove
+  return [line for line in plan
+          if (line.startswith('SCAN ') and 'CONSTANT ROW' not in line) or 'TEMP B-TREE' in line]
+
+class SlowQueryLog:
+  """
+  Logs statements slower than `threshold` seconds as JSON lines to `path`.
+
+  Each entry has the normalized SQL and its fingerprint, the types of the bound
+  parameters, the duration and the EXPLAIN QUERY PLAN output with full scans
+  and temp B-trees flagged. A fingerprint is logged at most once per
+  `interval` seconds, the slow runs in between are only counted and reported
+  with its next entry (`suppressed`, `suppressed_ms`, `suppressed_max_ms`), so
+  the summary still sees them. `flush()` writes out the counts no entry has
+  reported yet, as entries without a duration or plan. Statements run through
+  executemany() or executescript() are logged without a plan.
+  """
+  def __init__(self, path, threshold=0.1, interval=60.0):
+    self.path = path
+    self.threshold = threshold
+    self.interval = interval
+    self._fingerprints = {}
+    self._lock = threading.Lock()
+    self._metrics = {
+      'slow': 0,
+      'logged': 0,
+      'suppressed': 0
+    }
+
+  def record(self, connection, sql, parameters, seconds):
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    now = time.monotonic()
+    with self._lock:
+      self._metrics['slow'] += 1
+      state = self._fingerprints.get(key)
+      if state is not None and now - state[0] < self.interval:
+        # Already logged recently, keep count for the next entry
+        state[1] += 1
+        state[2] += seconds
+        state[3] = max(state[3], seconds)
+        self._metrics['suppressed'] += 1
+        return
+      suppressed = state[1:4] if state is not None else [0, 0.0, 0.0]
+      # When it was last logged, count, total and max seconds of the runs suppressed since, and its SQL
+      self._fingerprints[key] = [now, 0, 0.0, 0.0, normalized]
+      self._metrics['logged'] += 1
+
+    plan = None
+    if parameters is not None:
+      try:
+        plan = explain(connection, sql, parameters)
+      except Exception as e:
+        plan = [f'EXPLAIN failed: {e}']
+    logger.warning("Slow query %s (%.1fms): %s", key, seconds * 1000, normalized[:200])
+    self._write([entry(key, normalized, suppressed, parameter_shapes(parameters), seconds * 1000, plan)])
+
+  def flush(self):
+    # Write the suppressed counts no entry has reported yet, e.g. on shutdown
+    with self._lock:
+      pending = []
+      for key, state in self._fingerprints.items():
+        if state[1]:
+          pending.append(entry(key, state[4], state[1:4]))
+          state[1:4] = [0, 0.0, 0.0]
+    try:
+      self._write(pending)
+    except OSError as e:
+      # Runs at exit, when a temporary database may already be gone
+      logger.warning("Could not write the slow query counts: %s", e)
+
+  def _write(self, entries):
+    if not entries:
+      return
+    lines = ''.join(json.dumps(item) + '\n' for item in entries)
+    with self._lock:
+      with open(self.path, 'a') as file:
+        file.write(lines)
+
+  def stats(self):
+    with self._lock:
+      return dict(self._metrics, threshold_ms=self.threshold * 1000, fingerprints=len(self._fingerprints))
+
+def entry(key, normalized, suppressed, parameters=None, duration_ms=None, plan=None):
+  return {
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'fingerprint': key,
+    'sql': normalized,
+    'parameters': parameters,
+    'duration_ms': duration_ms,
+    'plan': plan,
+    'warnings': plan_warnings(plan) if plan else [],
+    'suppressed': suppressed[0],
+    'suppressed_ms': suppressed[1] * 1000,
+    'suppressed_max_ms': suppressed[2] * 1000
+  }
+
+def summarize(path):
+  # Aggregate a slow query log per fingerprint, worst total time first
+  statements = {}
+  with open(path, 'r') as file:
+    for line in file:
+      try:
+        item = json.loads(line)
+      except ValueError:
+        continue
+      summary = statements.setdefault(item['fingerprint'], {
+        'fingerprint': item['fingerprint'],
+        'sql': item['sql'],
+        'count': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'plan': None,
+        'warnings': []
+      })
+      summary['count'] += item['suppressed']
+      summary['total_ms'] += item['suppressed_ms']
+      summary['max_ms'] = max(summary['max_ms'], item['suppressed_max_ms'])
+      summary['last_seen'] = item['time']
+      if item['duration_ms'] is None:
+        continue  # Only counts, written by flush()
+      summary['count'] += 1
+      summary['total_ms'] += item['duration_ms']
+      summary['max_ms'] = max(summary['max_ms'], item['duration_ms'])
+      # The latest plan wins, it reflects the current indexes
+      summary['plan'] = item['plan']
+      summary['warnings'] = item['warnings']
+  return sorted(statements.values(), key=lambda summary: summary['total_ms'], reverse=True)
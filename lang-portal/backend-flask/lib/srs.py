@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+# Spaced repetition state per word (a simplified SM-2), advanced by every write path
+# that records reviews. A correct answer counts as grade 4: the interval grows to 1
+# day, 6 days, then interval * ease, and the ease stays. A wrong answer restarts the
+# run, lowers the ease and brings the word back after RELEARN_DELAY.
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+LAPSE_PENALTY = 0.2
+RELEARN_DELAY = timedelta(minutes=10)
+MAX_INTERVAL_DAYS = 36500  # Intervals grow geometrically, keep due_at a valid date
+
+def format_time(moment):
+  # Same text as SQLite's datetime(), so due_at compares with the other timestamps
+  return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def schedule(state, correct, reviewed_at):
+  """
+  Return the (repetitions, interval_days, ease, due_at) state after a review.
+  `state` is (repetitions, interval_days, ease), or None for a word never reviewed.
+  """
+  repetitions, interval, ease = state or (0, 0, INITIAL_EASE)
+  if not correct:
+    return 0, 0, max(MIN_EASE, round(ease - LAPSE_PENALTY, 2)), reviewed_at + RELEARN_DELAY
+  if repetitions == 0:
+    interval = 1
+  elif repetitions == 1:
+    interval = 6
+  else:
+    interval = min(round(interval * ease), MAX_INTERVAL_DAYS)
+  return repetitions + 1, interval, ease, reviewed_at + timedelta(days=interval)
+
+def save(cursor, states):
+  # states: {word_id: (repetitions, interval_days, ease, due_at, last_reviewed)}
+  cursor.executemany('''
+    INSERT INTO word_srs (word_id, repetitions, interval_days, ease, due_at, last_reviewed)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(word_id) DO UPDATE SET
+      repetitions = excluded.repetitions,
+      interval_days = excluded.interval_days,
+      ease = excluded.ease,
+      due_at = excluded.due_at,
+      last_reviewed = excluded.last_reviewed
+  ''', [
+    (word_id, repetitions, interval, ease, format_time(due_at), format_time(last_reviewed))
+    for word_id, (repetitions, interval, ease, due_at, last_reviewed) in states.items()
+  ])
+
+def record(cursor, reviews):
+  """
+  Advance the state of every reviewed word, in the transaction that inserts the reviews.
+  `reviews` is a list of (word_id, correct, reviewed_at) in the order they were given.
+  """
+  word_ids = sorted({word_id for word_id, _, _ in reviews})
+  placeholders = ','.join('?' * len(word_ids))
+  cursor.execute(f'''
+    SELECT word_id, repetitions, interval_days, ease FROM word_srs WHERE word_id IN ({placeholders})
+  ''', word_ids)
+  states = {row[0]: tuple(row[1:]) + (None, None) for row in cursor.fetchall()}
+  for word_id, correct, reviewed_at in reviews:
+    state = states.get(word_id)
+    states[word_id] = schedule(state[:3] if state else None, correct, reviewed_at) + (reviewed_at,)
+  save(cursor, {word_id: states[word_id] for word_id in word_ids})
+
+def rebuild(cursor, batch_size=10000):
+  # Replay the whole review log in created_at order, for backfills
+  cursor.execute('DELETE FROM word_srs')
+  cursor.execute('UPDATE group_word_due SET due_at = NULL WHERE due_at IS NOT NULL')
+  reviews = cursor.connection.execute('''
+    SELECT word_id, correct, created_at FROM word_review_items
+    WHERE created_at IS NOT NULL
+    ORDER BY word_id, created_at, id
+  ''')
+  states = {}
+  words = 0
+  current_word = None
+  state = None
+  for word_id, correct, created_at in reviews:
+    if word_id != current_word:
+      if current_word is not None:
+        states[current_word] = state
+      if len(states) >= batch_size:
+        save(cursor, states)
+        words += len(states)
+        states = {}
+      current_word = word_id
+      state = None
+    reviewed_at = datetime.fromisoformat(created_at)
+    state = schedule(state[:3] if state else None, correct == 1, reviewed_at) + (reviewed_at,)
+  if current_word is not None:
+    states[current_word] = state
+  save(cursor, states)
+  return words + len(states)
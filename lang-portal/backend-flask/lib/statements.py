@@ -0,0 +1,72 @@
+import itertools
+import os
+
+# sqlite3 keeps a per-connection LRU of prepared statements keyed by the exact SQL
+# text. Building queries with f-strings per request still produces a handful of
+# distinct texts, but only if every caller renders them the same way. The registry
+# renders each allowed variant once at startup and hands out those exact strings.
+
+# Room for the inline statements that do not go through the registry
+STATEMENT_CACHE_HEADROOM = 64
+
+class StatementRegistry:
+  """
+  SQL files under `directory` plus named statements with pre-rendered variants.
+
+  `define(name, template, **choices)` calls `template(**variant)` for every
+  combination of the choices and stores the resulting text. `execute()` runs the
+  text for one variant. sqlite3 doesn't report its statement cache hits, so the
+  registry only sizes the cache (see cache_size) and doesn't count them.
+  """
+  def __init__(self, directory='sql'):
+    self.directory = directory
+    self._files = {}
+    self._statements = {}
+    self._variants = {}
+    self.load()
+
+  def load(self):
+    # Read every .sql file once, keyed by its path relative to `directory`
+    for root, _, filenames in os.walk(self.directory):
+      for filename in filenames:
+        if filename.endswith('.sql'):
+          path = os.path.join(root, filename)
+          with open(path, 'r') as file:
+            self._files[os.path.relpath(path, self.directory).replace(os.sep, '/')] = file.read()
+
+  def file(self, path):
+    try:
+      return self._files[path]
+    except KeyError:
+      raise FileNotFoundError(f"No SQL file {self.directory}/{path}")
+
+  def files(self, prefix):
+    # Paths of the loaded files under `prefix`, sorted
+    return sorted(path for path in self._files if path.startswith(prefix))
+
+  def define(self, name, template, **choices):
+    keys = sorted(choices)
+    self._variants[name] = keys
+    for values in itertools.product(*(choices[key] for key in keys)):
+      self._statements[(name, values)] = template(**dict(zip(keys, values)))
+
+  def get(self, name, **variant):
+    values = tuple(variant[key] for key in self._variants[name])
+    try:
+      return self._statements[(name, values)]
+    except KeyError:
+      raise ValueError(f"Statement {name} has no variant {variant}")
+
+  def execute(self, cursor, name, params=(), **variant):
+    return cursor.execute(self.get(name, **variant), params)
+
+  def cache_size(self):
+    # Enough statement cache slots for every variant plus the inline queries
+    return len(self._statements) + STATEMENT_CACHE_HEADROOM
+
+  def stats(self):
+    return {
+      'statements': len(self._statements),
+      'files': len(self._files),
+      'cache_size': self.cache_size()
+    }
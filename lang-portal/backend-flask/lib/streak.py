@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# Incremental study streak. The state is a single row (last study date, current
+# run, longest run) advanced once per new session, so reading it is constant time.
+
+def get_timezone(name=None):
+  # None means the server's local timezone, which is what created_at is written in
+  return ZoneInfo(name) if name else None
+
+def local_date(moment, timezone=None):
+  # Naive datetimes are server local time, like the created_at values the routes write
+  if isinstance(moment, str):
+    moment = datetime.fromisoformat(moment)
+  return moment.astimezone(timezone).date()
+
+def advance(state, day):
+  """
+  Return the (last_study_date, current_streak, longest_streak) state after
+  studying on `day`. Days at or before the last study date don't change the run.
+  """
+  last, current, longest = state
+  if last is None or day > last + timedelta(days=1):
+    current = 1
+  elif day == last + timedelta(days=1):
+    current += 1
+  else:
+    return state
+  return day, current, max(longest, current)
+
+def load(cursor):
+  cursor.execute('SELECT last_study_date, current_streak, longest_streak FROM study_streak WHERE id = 1')
+  row = cursor.fetchone()
+  if not row:
+    return None, 0, 0
+  last = date.fromisoformat(row[0]) if row[0] else None
+  return last, row[1], row[2]
+
+def save(cursor, state):
+  last, current, longest = state
+  cursor.execute('''
+    INSERT INTO study_streak (id, last_study_date, current_streak, longest_streak) VALUES (1, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+      last_study_date = excluded.last_study_date,
+      current_streak = excluded.current_streak,
+      longest_streak = excluded.longest_streak
+  ''', (last.isoformat() if last else None, current, longest))
+
+def record(cursor, moment, timezone=None):
+  # Call inside the transaction that inserts the session, after the INSERT took the write lock
+  state = load(cursor)
+  new_state = advance(state, local_date(moment, timezone))
+  if new_state != state:
+    save(cursor, new_state)
+
+def current(cursor, today):
+  """
+  Return (current_streak, longest_streak) as of `today`.
+  The run is still alive if the last study day was today or yesterday.
+  """
+  last, current_streak, longest = load(cursor)
+  if last is None or last < today - timedelta(days=1):
+    current_streak = 0
+  return current_streak, longest
+
+def rebuild(cursor, timezone=None):
+  # Replay every session in created_at order, for backfills
+  state = (None, 0, 0)
+  cursor.execute('SELECT created_at FROM study_sessions WHERE created_at IS NOT NULL ORDER BY created_at')
+  for row in cursor.fetchall():
+    state = advance(state, local_date(row[0], timezone))
+  save(cursor, state)
+  return state
@@ -0,0 +1,97 @@
+import json
+import os
+import random
+from flask import Flask
+from lib.db import Db
+from lib import srs, streak
+
+# Synthetic lang-portal databases for benchmarks. Rows are generated inside SQLite
+# with recursive CTEs so millions of review items take seconds, not minutes.
+
+SEQUENCE = 'WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?) '
+
+def generate(path, words=50000, groups=20, sessions=100000, reviews=2000000, days=365, skew=1.5, seed=None, migrate=True):
+  """
+  Create a database at `path` with the lang-portal schema and synthetic data.
+
+  Sessions are spread over the last `days` days in id order and every session
+  owns a contiguous run of review items, like the real write path. Activity is
+  skewed by a power law: with `skew` above 1 a few words, groups and study
+  activities get most of the reviews and sessions, and sessions get denser
+  towards the present (1 is uniform). `seed` makes the data reproducible.
+  With `migrate` the migrations run after the data is loaded, the same way an
+  existing database is upgraded.
+  """
+  if os.path.exists(path):
+    raise FileExistsError(f"{path} already exists")
+  rng = random.Random(seed)
+  app = Flask(__name__)
+  db = Db(database=path, pool_size=1, profile='bulk')
+  with app.app_context():
+    cursor = db.cursor()
+    db.setup_tables(cursor)
+
+    # Seeded random functions for the generating queries, SQLite's random() can't be seeded.
+    # pick(n) is an id in 1..n, low ids are the popular ones.
+    connection = db.get()
+    connection.create_function('pick', 1, lambda n: int(n * rng.random() ** skew) + 1)
+    connection.create_function('chance', 1, lambda p: rng.random() < p)
+    # Seconds before now of the n-th of `count` sessions, decreasing with n
+    connection.create_function('age', 2, lambda n, count: int(days * 86400 * ((count - n) / count) ** skew))
+
+    parts = json.dumps([{"kanji": "食", "romaji": ["ta"]}, {"kanji": "べる", "romaji": ["be", "ru"]}])
+    cursor.execute(SEQUENCE + '''
+      INSERT INTO words (kanji, romaji, english, parts)
+      SELECT 'k' || printf('%06x', (n * 2654435761) % 16777216) || n,
+             printf('%08x', (n * 2246822519) % 4294967296) || n,
+             'to ' || printf('%06x', (n * 3266489917) % 16777216) || ' ' || n,
+             ?
+      FROM seq
+    ''', (words, parts))
+
+    cursor.execute(SEQUENCE + '''
+      INSERT INTO groups (name) SELECT 'Group ' || n FROM seq
+    ''', (groups,))
+    cursor.execute('''
+      INSERT INTO word_groups (word_id, group_id) SELECT id, (id % ?) + 1 FROM words
+    ''', (groups,))
+    cursor.execute('''
+      UPDATE groups SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id)
+    ''')
+
+    activities = db.load_json('seed/study_activities.json') + [
+      {'name': 'Flashcards', 'url': 'http://localhost:8081', 'preview_url': None},
+      {'name': 'Listening', 'url': 'http://localhost:8082', 'preview_url': None}
+    ]
+    cursor.executemany('''
+      INSERT INTO study_activities (name, url, preview_url) VALUES (?, ?, ?)
+    ''', [(a['name'], a['url'], a['preview_url']) for a in activities])
+    cursor.execute('SELECT COUNT(*) FROM study_activities')
+    activities = cursor.fetchone()[0]
+
+    cursor.execute(SEQUENCE + '''
+      INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+      SELECT pick(?), pick(?), datetime('now', '-' || age(n, ?) || ' seconds')
+      FROM seq
+    ''', (sessions, groups, activities, sessions))
+
+    per_session = reviews / max(sessions, 1)
+    cursor.execute(SEQUENCE + '''
+      INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+      SELECT pick(?),
+             CAST((n - 1) / ? AS INTEGER) + 1,
+             chance(0.7),
+             datetime((SELECT created_at FROM study_sessions WHERE id = CAST((n - 1) / ? AS INTEGER) + 1),
+                      '+' || (n % 600) || ' seconds')
+      FROM seq
+    ''', (reviews, words, per_session, per_session))
+    db.commit()
+
+    if migrate:
+      db.migrate(cursor)
+      streak.rebuild(cursor)
+      srs.rebuild(cursor)
+    cursor.execute('ANALYZE')
+    db.commit()
+    db.close()
+  db.pool.close_all()
@@ -0,0 +1,149 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+# Error codes that mean another connection holds the lock, worth retrying
+BUSY_CODES = (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+def is_busy(error):
+  # Extended codes such as SQLITE_BUSY_SNAPSHOT carry the primary code in the low byte
+  return (getattr(error, 'sqlite_errorcode', 0) & 0xff) in BUSY_CODES
+
+class WriterBusy(Exception):
+  pass
+
+class WriterStopped(WriterBusy):
+  # The writer thread is gone, nothing queued will run
+  pass
+
+class WriterTimeout(WriterBusy):
+  # Queued for longer than wait_timeout, the transaction was withdrawn before it ran
+  pass
+
+class Writer:
+  """
+  Serializes write transactions through one thread and one connection.
+
+  `run(fn)` queues `fn`, which the writer calls with a cursor inside BEGIN
+  IMMEDIATE and commits, and returns its result or raises its exception. The
+  queue holds at most `max_queue` transactions, a request that can't enqueue
+  within `timeout` seconds gets WriterBusy instead of piling up. A transaction
+  that fails because another connection holds the lock (a backup, the CLI) is
+  rolled back and run again up to `retries` times with a growing pause, so
+  `fn` must do nothing but database work.
+
+  `fn` gets its cursor from `cursor(connection)` when run() is given one, so
+  the caller decides how statements are timed and logged (see Db.write). A
+  caller waiting on its transaction checks every `poll` seconds that the
+  writer thread is still running, and gets WriterStopped once it is not.
+  With `wait_timeout`, a transaction still queued after that many seconds is
+  withdrawn and the caller gets WriterTimeout. One that has started is always
+  waited for, so a timeout never leaves the caller unsure whether it committed.
+
+  The writer holds one connection of `pool` for as long as it runs.
+  """
+  def __init__(self, pool, max_queue=256, timeout=5.0, retries=3, backoff=0.05, poll=1.0, wait_timeout=None):
+    self.pool = pool
+    self.poll = poll
+    self.timeout = timeout
+    self.wait_timeout = wait_timeout
+    self.retries = retries
+    self.backoff = backoff
+    self._queue = queue.Queue(maxsize=max_queue)
+    self._lock = threading.Lock()
+    self._metrics = {
+      'committed': 0,
+      'failed': 0,
+      'retries': 0,
+      'rejected': 0,
+      'timeouts': 0,
+      'max_depth': 0,
+      'wait_seconds': 0.0,
+      'max_wait_seconds': 0.0
+    }
+    self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+    self._thread.start()
+
+  def run(self, fn, cursor=None):
+    future = Future()
+    if not self._thread.is_alive():
+      raise WriterStopped("Writer is not running")
+    try:
+      self._queue.put((fn, cursor, future, time.perf_counter()), timeout=self.timeout)
+    except queue.Full:
+      with self._lock:
+        self._metrics['rejected'] += 1
+      raise WriterBusy(f"Write queue full for {self.timeout}s")
+    with self._lock:
+      self._metrics['max_depth'] = max(self._metrics['max_depth'], self._queue.qsize())
+    deadline = None if self.wait_timeout is None else time.monotonic() + self.wait_timeout
+    while True:
+      try:
+        wait = self.poll if deadline is None else max(0.0, min(self.poll, deadline - time.monotonic()))
+        return future.result(timeout=wait)
+      except FutureTimeout:
+        # Queued behind a close() or a writer that died, nothing will resolve it
+        if not self._thread.is_alive() and not future.done():
+          future.cancel()
+          raise WriterStopped("Writer stopped before running the transaction")
+        if deadline is not None and time.monotonic() >= deadline:
+          # cancel() fails once the writer has picked it up, then wait for the outcome
+          deadline = None
+          if future.cancel():
+            with self._lock:
+              self._metrics['timeouts'] += 1
+            raise WriterTimeout(f"Write not started within {self.wait_timeout}s")
+
+  def close(self):
+    # Finish what is queued and stop, safe to call more than once
+    if self._thread.is_alive():
+      self._queue.put(None)
+      self._thread.join()
+
+  def stats(self):
+    with self._lock:
+      return dict(self._metrics, depth=self._queue.qsize())
+
+  def _run(self):
+    connection = self.pool.acquire()
+    try:
+      while True:
+        item = self._queue.get()
+        if item is None:
+          return
+        fn, cursor, future, queued = item
+        waited = time.perf_counter() - queued
+        with self._lock:
+          self._metrics['wait_seconds'] += waited
+          self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], waited)
+        if future.set_running_or_notify_cancel():
+          self._execute(connection, fn, cursor, future)
+    finally:
+      self.pool.release(connection)
+
+  def _execute(self, connection, fn, cursor, future):
+    attempt = 0
+    while True:
+      try:
+        connection.execute('BEGIN IMMEDIATE')
+        result = fn(connection.cursor() if cursor is None else cursor(connection))
+        connection.commit()
+      except Exception as e:
+        if connection.in_transaction:
+          connection.rollback()
+        if attempt < self.retries and is_busy(e):
+          attempt += 1
+          with self._lock:
+            self._metrics['retries'] += 1
+          time.sleep(self.backoff * 2 ** (attempt - 1))
+          continue
+        with self._lock:
+          self._metrics['failed'] += 1
+        future.set_exception(e)
+        return
+      with self._lock:
+        self._metrics['committed'] += 1
+      future.set_result(result)
+      return
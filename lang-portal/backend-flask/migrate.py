@@ -1,31 +1,28 @@
 import sqlite3
 import os
+import sys
 
-def run_migrations():
-    # Connect to the database
-    db_path = os.path.join(os.path.dirname(__file__), 'word_bank.db')
+from lib import migrations
+
+def run_migrations(db_path=None):
+    # Apply the migrations in sql/migrations that the database hasn't recorded in schema_migrations
+    db_path = db_path or os.path.join(os.path.dirname(__file__), 'words.db')
     conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
     
     try:
-        # Get list of migration files
         migrations_dir = os.path.join(os.path.dirname(__file__), 'sql', 'migrations')
-        migration_files = sorted([f for f in os.listdir(migrations_dir) if f.endswith('.sql')])
-        
-        # Run each migration
-        for migration_file in migration_files:
-            print(f"Running migration: {migration_file}")
-            with open(os.path.join(migrations_dir, migration_file)) as f:
-                migration_sql = f.read()
-                conn.executescript(migration_sql)
-                conn.commit()
-        
-        print("Migrations completed successfully")
-    except Exception as e:
+        pending = migrations.load_directory(migrations_dir)
+        if migrations.is_current(conn, pending):
+            print("Schema is up to date")
+            return
+
+        applied = migrations.apply(conn, pending, progress=lambda m: print(f"Applied migration: {m.name}"))
+        print(f"Migrations completed successfully ({len(applied)} applied)")
+    except migrations.MigrationError as e:
         print(f"Error running migrations: {str(e)}")
-        conn.rollback()
+        sys.exit(1)
     finally:
         conn.close()
 
 if __name__ == '__main__':
-    run_migrations()
+    run_migrations(sys.argv[1] if len(sys.argv) > 1 else None)
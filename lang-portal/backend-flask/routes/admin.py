@@ -0,0 +1,77 @@
+import functools
+import hmac
+from flask import Response, jsonify, request
+
+# Addresses of requests made from this host
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def load(app):
+    def admin(view):
+        # Only local requests, or with ADMIN_TOKEN set, only requests carrying it as a bearer token
+        @functools.wraps(view)
+        def restricted(*args, **kwargs):
+            token = app.config['ADMIN_TOKEN']
+            if token is None:
+                allowed = request.remote_addr in LOCAL_ADDRESSES
+            else:
+                allowed = hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+            if not allowed:
+                return jsonify({"error": "Admin endpoints are restricted"}), 403
+            return view(*args, **kwargs)
+        return restricted
+
+    @app.route('/admin/cache', methods=['GET'])
+    @admin
+    def get_cache_stats():
+        # Hit ratio, saved latency and size of the response cache
+        return jsonify(app.cache.stats())
+
+    @app.route('/admin/statements', methods=['GET'])
+    @admin
+    def get_statement_stats():
+        # Registered statement variants, loaded SQL files and the statement cache size
+        return jsonify(app.db.statements.stats())
+
+    @app.route('/admin/review-buffer', methods=['GET'])
+    @admin
+    def get_review_buffer_stats():
+        # Queue depth and flush latency of the write-behind review buffer
+        if app.review_buffer is None:
+            return jsonify({"enabled": False})
+        return jsonify(dict(app.review_buffer.stats(), enabled=True))
+
+    @app.route('/admin/writer', methods=['GET'])
+    @admin
+    def get_writer_stats():
+        # Queue depth, waits and busy retries of the single writer
+        if app.db.writer is None:
+            return jsonify({"enabled": False})
+        return jsonify(dict(app.db.writer.stats(), enabled=True))
+
+    @app.route('/admin/backup', methods=['POST'])
+    @admin
+    def start_backup():
+        # Back up the database in the background, GET /admin/backup reports the progress
+        if not app.backups.start():
+            return jsonify({"error": "A backup is already running"}), 409
+        return jsonify(app.backups.status()), 202
+
+    @app.route('/admin/backup', methods=['GET'])
+    @admin
+    def get_backup_status():
+        return jsonify(app.backups.status())
+
+    @app.route('/admin/slow-queries', methods=['GET'])
+    @admin
+    def get_slow_query_stats():
+        # How many statements crossed the slow query threshold and how many were logged
+        if app.db.slow_queries is None:
+            return jsonify({"enabled": False})
+        return jsonify(dict(app.db.slow_queries.stats(), enabled=True))
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        # Per-route request latency, status codes and SQL time in the Prometheus text format
+        if app.metrics is None:
+            return jsonify({"error": "Metrics are disabled"}), 404
+        return Response(app.metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -1,28 +1,26 @@
 from flask import jsonify
-from flask_cors import cross_origin
 from datetime import datetime, timedelta
+from lib import streak
 
 def load(app):
     @app.route('/dashboard/recent-session', methods=['GET'])
-    @cross_origin()
+    @app.cache.cached('study_sessions', 'word_review_items', 'study_activities')
     def get_recent_session():
         try:
             cursor = app.db.cursor()
             
-            # Get the most recent study session with activity name and results
+            # Get the most recent study session with activity name and results from the per-session summary
             cursor.execute('''
                 SELECT 
-                    ss.id,
-                    ss.group_id,
+                    s.study_session_id as id,
+                    s.group_id,
                     sa.name as activity_name,
-                    ss.created_at,
-                    COUNT(CASE WHEN wri.correct = 1 THEN 1 END) as correct_count,
-                    COUNT(CASE WHEN wri.correct = 0 THEN 1 END) as wrong_count
-                FROM study_sessions ss
-                JOIN study_activities sa ON ss.study_activity_id = sa.id
-                LEFT JOIN word_review_items wri ON ss.id = wri.study_session_id
-                GROUP BY ss.id
-                ORDER BY ss.created_at DESC
+                    s.start_time as created_at,
+                    s.correct_count,
+                    s.wrong_count
+                FROM study_session_summary s
+                JOIN study_activities sa ON s.study_activity_id = sa.id
+                ORDER BY s.start_time DESC, s.study_session_id DESC
                 LIMIT 1
             ''')
             
@@ -44,53 +42,24 @@ def load(app):
             return jsonify({"error": str(e)}), 500
 
     @app.route('/dashboard/stats', methods=['GET'])
-    @cross_origin()
     def get_study_stats():
         try:
             cursor = app.db.cursor()
             
             # Get total vocabulary count
-            cursor.execute('SELECT COUNT(*) as total_vocabulary FROM words')
-            total_vocabulary = cursor.fetchone()["total_vocabulary"]
+            total_vocabulary = app.db.counter(cursor, 'words')
 
-            # Get total unique words studied
+            # Review and session totals come from the study_totals rollup, maintained on every write
             cursor.execute('''
-                SELECT COUNT(DISTINCT word_id) as total_words
-                FROM word_review_items wri
-                JOIN study_sessions ss ON wri.study_session_id = ss.id
+                SELECT sessions_count, reviews_count, correct_count, words_studied, mastered_words
+                FROM study_totals
+                WHERE id = 1
             ''')
-            total_words = cursor.fetchone()["total_words"]
-            
-            # Get mastered words (words with >80% success rate and at least 5 attempts)
-            cursor.execute('''
-                WITH word_stats AS (
-                    SELECT 
-                        word_id,
-                        COUNT(*) as total_attempts,
-                        SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) as success_rate
-                    FROM word_review_items wri
-                    JOIN study_sessions ss ON wri.study_session_id = ss.id
-                    GROUP BY word_id
-                    HAVING total_attempts >= 5
-                )
-                SELECT COUNT(*) as mastered_words
-                FROM word_stats
-                WHERE success_rate >= 0.8
-            ''')
-            mastered_words = cursor.fetchone()["mastered_words"]
-            
-            # Get overall success rate
-            cursor.execute('''
-                SELECT 
-                    SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) as success_rate
-                FROM word_review_items wri
-                JOIN study_sessions ss ON wri.study_session_id = ss.id
-            ''')
-            success_rate = cursor.fetchone()["success_rate"] or 0
-            
-            # Get total number of study sessions
-            cursor.execute('SELECT COUNT(*) as total_sessions FROM study_sessions')
-            total_sessions = cursor.fetchone()["total_sessions"]
+            totals = cursor.fetchone()
+            total_words = totals["words_studied"]
+            mastered_words = totals["mastered_words"]
+            success_rate = totals["correct_count"] * 1.0 / totals["reviews_count"] if totals["reviews_count"] else 0
+            total_sessions = totals["sessions_count"]
             
             # Get number of groups with activity in the last 30 days
             cursor.execute('''
@@ -100,30 +69,9 @@ def load(app):
             ''')
             active_groups = cursor.fetchone()["active_groups"]
             
-            # Calculate current streak (consecutive days with at least one study session)
-            cursor.execute('''
-                WITH daily_sessions AS (
-                    SELECT 
-                        date(created_at) as study_date,
-                        COUNT(*) as session_count
-                    FROM study_sessions
-                    GROUP BY date(created_at)
-                ),
-                streak_calc AS (
-                    SELECT 
-                        study_date,
-                        julianday(study_date) - julianday(lag(study_date, 1) over (order by study_date)) as days_diff
-                    FROM daily_sessions
-                )
-                SELECT COUNT(*) as streak
-                FROM (
-                    SELECT study_date
-                    FROM streak_calc
-                    WHERE days_diff = 1 OR days_diff IS NULL
-                    ORDER BY study_date DESC
-                )
-            ''')
-            current_streak = cursor.fetchone()["streak"]
+            # Current streak from the persisted streak state, in the configured timezone
+            timezone = streak.get_timezone(app.config.get('STREAK_TIMEZONE'))
+            current_streak, longest_streak = streak.current(cursor, datetime.now(timezone).date())
             
             return jsonify({
                 "total_vocabulary": total_vocabulary,
@@ -132,7 +80,8 @@ def load(app):
                 "success_rate": success_rate,
                 "total_sessions": total_sessions,
                 "active_groups": active_groups,
-                "current_streak": current_streak
+                "current_streak": current_streak,
+                "longest_streak": longest_streak
             })
             
         except Exception as e:
@@ -1,10 +1,83 @@
-from flask import request, jsonify, g
-from flask_cors import cross_origin
+from flask import Response, request, jsonify, g
 import json
+from datetime import datetime
+from lib.pagination import InvalidCursor, decode_cursor, next_cursor, seek_clause
+from lib.sessions import session_end_time
+from lib import srs
+from lib.export import FORMATS, encode_word, stream_rows
+
+# Sort expressions and the id that breaks ties, so every row has a unique position.
+# The counts come from the word_reviews counter cache.
+WORD_SORT_COLUMNS = {
+  'kanji': ('w.kanji', 'w.id'),
+  'romaji': ('w.romaji', 'w.id'),
+  'english': ('w.english', 'w.id'),
+  'correct_count': ('wr.correct_count', 'wr.word_id'),
+  'wrong_count': ('wr.wrong_count', 'wr.word_id')
+}
+
+def list_groups_sql(sort_by, order):
+  return f'''
+    SELECT id, name, words_count
+    FROM groups
+    ORDER BY {sort_by} {order}
+    LIMIT ? OFFSET ?
+  '''
+
+def group_words_sql(sort_by, order, seek):
+  sort_column, id_column = WORD_SORT_COLUMNS[sort_by]
+  where = 'AND ' + seek_clause(sort_column, id_column, order) if seek else ''
+  return f'''
+    SELECT w.*, 
+           COALESCE(wr.correct_count, 0) as correct_count,
+           COALESCE(wr.wrong_count, 0) as wrong_count
+    FROM words w
+    JOIN word_groups wg ON w.id = wg.word_id
+    JOIN word_reviews wr ON w.id = wr.word_id
+    WHERE wg.group_id = ? {where}
+    ORDER BY {sort_column} {order}, {id_column} {order}
+    LIMIT ? OFFSET ?
+  '''
+
+# Map frontend sort keys to study_session_summary columns
+SESSION_SORT_COLUMNS = {
+  'startTime': 's.start_time',
+  'endTime': 's.last_activity_time',
+  'activityName': 'a.name',
+  'groupName': 'g.name',
+  'reviewItemsCount': 's.review_count'
+}
+
+def group_study_sessions_sql(sort_by, order):
+  # Unknown sort keys fall back to the start time
+  sort_column = SESSION_SORT_COLUMNS.get(sort_by, 's.start_time')
+  return f'''
+    SELECT 
+      s.study_session_id as id,
+      s.group_id,
+      s.study_activity_id,
+      s.start_time,
+      s.last_activity_time,
+      a.name as activity_name,
+      g.name as group_name,
+      s.review_count
+    FROM study_session_summary s
+    JOIN study_activities a ON s.study_activity_id = a.id
+    JOIN groups g ON s.group_id = g.id
+    WHERE s.group_id = ?
+    ORDER BY {sort_column} {order}, s.study_session_id {order}
+    LIMIT ? OFFSET ?
+  '''
 
 def load(app):
+  # One fixed statement text per sort, order and pagination mode
+  app.db.define('groups.list', list_groups_sql, sort_by=('name', 'words_count'), order=('asc', 'desc'))
+  app.db.define('groups.words', group_words_sql, sort_by=WORD_SORT_COLUMNS, order=('asc', 'desc'), seek=(False, True))
+  app.db.define('groups.study_sessions', group_study_sessions_sql,
+    sort_by=list(SESSION_SORT_COLUMNS) + ['created_at'], order=('asc', 'desc'))
+
   @app.route('/groups', methods=['GET'])
-  @cross_origin()
+  @app.cache.cached('groups')
   def get_groups():
     try:
       cursor = app.db.cursor()
@@ -26,18 +99,12 @@ def load(app):
         order = 'asc'
 
       # Query to fetch groups with sorting and the cached word count
-      cursor.execute(f'''
-        SELECT id, name, words_count
-        FROM groups
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (groups_per_page, offset))
+      app.db.execute(cursor, 'groups.list', (groups_per_page, offset), sort_by=sort_by, order=order)
 
       groups = cursor.fetchall()
 
       # Query the total number of groups
-      cursor.execute('SELECT COUNT(*) FROM groups')
-      total_groups = cursor.fetchone()[0]
+      total_groups = app.db.counter(cursor, 'groups')
       total_pages = (total_groups + groups_per_page - 1) // groups_per_page
 
       # Format the response
@@ -59,7 +126,6 @@ def load(app):
       return jsonify({"error": str(e)}), 500
 
   @app.route('/groups/<int:id>', methods=['GET'])
-  @cross_origin()
   def get_group(id):
     try:
       cursor = app.db.cursor()
@@ -84,7 +150,7 @@ def load(app):
       return jsonify({"error": str(e)}), 500
 
   @app.route('/groups/<int:id>/words', methods=['GET'])
-  @cross_origin()
+  @app.cache.cached('words', 'groups', 'word_groups', 'word_review_items')
   def get_group_words(id):
     try:
       cursor = app.db.cursor()
@@ -105,39 +171,33 @@ def load(app):
       if order not in ['asc', 'desc']:
         order = 'asc'
 
-      # First, check if the group exists
-      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+      # First, check if the group exists, words_count is kept up by the word_groups triggers
+      cursor.execute('SELECT name, words_count FROM groups WHERE id = ?', (id,))
       group = cursor.fetchone()
       if not group:
         return jsonify({"error": "Group not found"}), 404
 
-      # Query to fetch words with pagination and sorting
-      cursor.execute(f'''
-        SELECT w.*, 
-               COALESCE(wr.correct_count, 0) as correct_count,
-               COALESCE(wr.wrong_count, 0) as wrong_count
-        FROM words w
-        JOIN word_groups wg ON w.id = wg.word_id
-        LEFT JOIN word_reviews wr ON w.id = wr.word_id
-        WHERE wg.group_id = ?
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (id, words_per_page, offset))
+      # A cursor switches to keyset pagination (an empty cursor starts at the first row)
+      page_cursor = request.args.get('cursor')
+      params = [id]
+      if page_cursor:
+        try:
+          params += decode_cursor(page_cursor, sort_by, order)
+        except InvalidCursor as e:
+          return jsonify({"error": str(e)}), 400
+      if page_cursor is not None:
+        offset = 0
+
+      # Query to fetch words with pagination and sorting, plus one row to detect a next page
+      app.db.execute(cursor, 'groups.words', params + [words_per_page + 1, offset],
+        sort_by=sort_by, order=order, seek=bool(page_cursor))
       
       words = cursor.fetchall()
-
-      # Get total words count for pagination
-      cursor.execute('''
-        SELECT COUNT(*) 
-        FROM word_groups 
-        WHERE group_id = ?
-      ''', (id,))
-      total_words = cursor.fetchone()[0]
-      total_pages = (total_words + words_per_page - 1) // words_per_page
+      cursor_token = next_cursor(words, words_per_page, sort_by, order, sort_by)
 
       # Format the response
       words_data = []
-      for word in words:
+      for word in words[:words_per_page]:
         words_data.append({
           "id": word["id"],
           "kanji": word["kanji"],
@@ -147,18 +207,109 @@ def load(app):
           "wrong_count": word["wrong_count"]
         })
 
+      # Keyset pages skip the COUNT(*) entirely
+      if page_cursor is not None:
+        return jsonify({
+          'words': words_data,
+          'next_cursor': cursor_token
+        })
+
+      # Get total words count for pagination
+      total_words = group['words_count']
+      total_pages = (total_words + words_per_page - 1) // words_per_page
+
       return jsonify({
         'words': words_data,
         'total_pages': total_pages,
-        'current_page': page
+        'current_page': page,
+        'next_cursor': cursor_token
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/groups/<int:id>/words/due', methods=['GET'])
+  def get_group_words_due(id):
+    try:
+      cursor = app.db.cursor()
+
+      # Number of words to return, 20 by default and at most 100
+      limit = min(max(1, int(request.args.get('limit', 20))), 100)
+
+      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+      if not cursor.fetchone():
+        return jsonify({"error": "Group not found"}), 404
+
+      # Words whose review is due, most overdue first, on the (group_id, due_at) index
+      now = srs.format_time(datetime.now())
+      cursor.execute('''
+        SELECT w.id, w.kanji, w.romaji, w.english, d.due_at
+        FROM group_word_due d
+        JOIN words w ON w.id = d.word_id
+        WHERE d.group_id = ? AND d.due_at <= ?
+        ORDER BY d.due_at
+        LIMIT ?
+      ''', (id, now, limit))
+      words = cursor.fetchall()
+
+      # Fill up with words that were never reviewed
+      if len(words) < limit:
+        cursor.execute('''
+          SELECT w.id, w.kanji, w.romaji, w.english, d.due_at
+          FROM group_word_due d
+          JOIN words w ON w.id = d.word_id
+          WHERE d.group_id = ? AND d.due_at IS NULL
+          ORDER BY d.word_id
+          LIMIT ?
+        ''', (id, limit - len(words)))
+        words += cursor.fetchall()
+
+      return jsonify({
+        'words': [{
+          "id": word["id"],
+          "kanji": word["kanji"],
+          "romaji": word["romaji"],
+          "english": word["english"],
+          "due_at": word["due_at"],
+          "new": word["due_at"] is None
+        } for word in words],
+        'now': now
       })
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
-  # todo GET /groups/:id/words/raw
+  @app.route('/groups/<int:id>/words/raw', methods=['GET'])
+  def get_group_words_raw(id):
+    # Every word of the group with its parts, as one JSON array (default) or NDJSON with format=ndjson
+    format = request.args.get('format', 'json')
+    if format not in FORMATS:
+      return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}"}), 400
+    # Teardown runs before a streamed body is sent, so the stream gets a connection of its own
+    try:
+      cursor = app.db.stream_cursor()
+    except TimeoutError:
+      return jsonify({"error": "Too many exports in progress, try again later"}), 503
+    try:
+      cursor.execute('SELECT id FROM groups WHERE id = ?', (id,))
+      if not cursor.fetchone():
+        app.db.release_cursor(cursor)
+        return jsonify({"error": "Group not found"}), 404
+
+      cursor.execute('''
+        SELECT w.id, w.kanji, w.romaji, w.english, w.parts
+        FROM word_groups wg
+        JOIN words w ON w.id = wg.word_id
+        WHERE wg.group_id = ?
+        ORDER BY wg.word_id
+      ''', (id,))
+      response = Response(stream_rows(cursor, encode_word, format), mimetype=FORMATS[format])
+      # Called by the server once the response is sent or the client went away
+      response.call_on_close(lambda: app.db.release_cursor(cursor))
+      return response
+    except Exception as e:
+      app.db.release_cursor(cursor)
+      return jsonify({"error": str(e)}), 500
 
   @app.route('/groups/<int:id>/study_sessions', methods=['GET'])
-  @cross_origin()
   def get_group_study_sessions(id):
     try:
       cursor = app.db.cursor()
@@ -172,63 +323,26 @@ def load(app):
       sort_by = request.args.get('sort_by', 'created_at')
       order = request.args.get('order', 'desc')  # Default to newest first
 
-      # Map frontend sort keys to database columns
-      sort_mapping = {
-        'startTime': 'created_at',
-        'endTime': 'last_activity_time',
-        'activityName': 'a.name',
-        'groupName': 'g.name',
-        'reviewItemsCount': 'review_count'
-      }
-
-      # Use mapped sort column or default to created_at
-      sort_column = sort_mapping.get(sort_by, 'created_at')
+      # Validate sort parameters, unknown keys sort by created_at
+      if sort_by not in SESSION_SORT_COLUMNS:
+        sort_by = 'created_at'
+      if order not in ['asc', 'desc']:
+        order = 'desc'
 
       # Get total count for pagination
-      cursor.execute('''
-        SELECT COUNT(*)
-        FROM study_sessions
-        WHERE group_id = ?
-      ''', (id,))
-      total_sessions = cursor.fetchone()[0]
+      total_sessions = app.db.counter(cursor, 'group_sessions', id)
       total_pages = (total_sessions + sessions_per_page - 1) // sessions_per_page
 
-      # Get study sessions for this group with dynamic calculations
-      cursor.execute(f'''
-        SELECT 
-          s.id,
-          s.group_id,
-          s.study_activity_id,
-          s.created_at as start_time,
-          (
-            SELECT MAX(created_at)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as last_activity_time,
-          a.name as activity_name,
-          g.name as group_name,
-          (
-            SELECT COUNT(*)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as review_count
-        FROM study_sessions s
-        JOIN study_activities a ON s.study_activity_id = a.id
-        JOIN groups g ON s.group_id = g.id
-        WHERE s.group_id = ?
-        ORDER BY {sort_column} {order}
-        LIMIT ? OFFSET ?
-      ''', (id, sessions_per_page, offset))
+      # Get study sessions for this group from the per-session summary
+      app.db.execute(cursor, 'groups.study_sessions', (id, sessions_per_page, offset), sort_by=sort_by, order=order)
       
       sessions = cursor.fetchall()
       sessions_data = []
       
       for session in sessions:
         # If there's no last_activity_time, use start_time + 30 minutes
-        end_time = session["last_activity_time"]
-        if not end_time:
-            end_time = cursor.execute('SELECT datetime(?, "+30 minutes")', (session["start_time"],)).fetchone()[0]
-        
+        end_time = session_end_time(session["start_time"], session["last_activity_time"])
+
         sessions_data.append({
           "id": session["id"],
           "group_id": session["group_id"],
@@ -1,10 +1,10 @@
 from flask import jsonify, request
-from flask_cors import cross_origin
 import math
+from lib.sessions import session_end_time
 
 def load(app):
     @app.route('/api/study-activities', methods=['GET'])
-    @cross_origin()
+    @app.cache.cached('study_activities')
     def get_study_activities():
         cursor = app.db.cursor()
         cursor.execute('SELECT id, name, url, preview_url FROM study_activities')
@@ -18,7 +18,6 @@ def load(app):
         } for activity in activities])
 
     @app.route('/api/study-activities/<int:id>', methods=['GET'])
-    @cross_origin()
     def get_study_activity(id):
         cursor = app.db.cursor()
         cursor.execute('SELECT id, name, url, preview_url FROM study_activities WHERE id = ?', (id,))
@@ -35,7 +34,6 @@ def load(app):
         })
 
     @app.route('/api/study-activities/<int:id>/sessions', methods=['GET'])
-    @cross_origin()
     def get_study_activity_sessions(id):
         cursor = app.db.cursor()
         
@@ -50,31 +48,25 @@ def load(app):
         offset = (page - 1) * per_page
 
         # Get total count
-        cursor.execute('''
-            SELECT COUNT(*) as count 
-            FROM study_sessions ss
-            JOIN groups g ON g.id = ss.group_id
-            WHERE ss.study_activity_id = ?
-        ''', (id,))
-        total_count = cursor.fetchone()['count']
+        total_count = app.db.counter(cursor, 'activity_sessions', id)
 
         # Get paginated sessions
+        # Review counts come from the per-session summary, newest first on its (activity, start_time) index
         cursor.execute('''
             SELECT 
-                ss.id,
-                ss.group_id,
+                s.study_session_id as id,
+                s.group_id,
                 g.name as group_name,
                 sa.name as activity_name,
-                ss.created_at,
-                ss.study_activity_id as activity_id,
-                COUNT(wri.id) as review_items_count
-            FROM study_sessions ss
-            JOIN groups g ON g.id = ss.group_id
-            JOIN study_activities sa ON sa.id = ss.study_activity_id
-            LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-            WHERE ss.study_activity_id = ?
-            GROUP BY ss.id, ss.group_id, g.name, sa.name, ss.created_at, ss.study_activity_id
-            ORDER BY ss.created_at DESC
+                s.start_time as created_at,
+                s.last_activity_time,
+                s.study_activity_id as activity_id,
+                s.review_count as review_items_count
+            FROM study_session_summary s
+            JOIN groups g ON g.id = s.group_id
+            JOIN study_activities sa ON sa.id = s.study_activity_id
+            WHERE s.study_activity_id = ?
+            ORDER BY s.start_time DESC, s.study_session_id DESC
             LIMIT ? OFFSET ?
         ''', (id, per_page, offset))
         sessions = cursor.fetchall()
@@ -87,7 +79,7 @@ def load(app):
                 'activity_id': session['activity_id'],
                 'activity_name': session['activity_name'],
                 'start_time': session['created_at'],
-                'end_time': session['created_at'],  # For now, just use the same time since we don't track end time
+                'end_time': session_end_time(session['created_at'], session['last_activity_time']),
                 'review_items_count': session['review_items_count']
             } for session in sessions],
             'total': total_count,
@@ -97,7 +89,6 @@ def load(app):
         })
 
     @app.route('/api/study-activities/<int:id>/launch', methods=['GET'])
-    @cross_origin()
     def get_study_activity_launch_data(id):
         cursor = app.db.cursor()
         
@@ -1,17 +1,47 @@
 from flask import request, jsonify, g
-from flask_cors import cross_origin
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import math
 import unittest
-from unittest.mock import MagicMock
 import sqlite3
 import json
-from flask import Flask
+import os
+import shutil
+import tempfile
+from lib.pagination import InvalidCursor, decode_cursor, next_cursor, seek_clause
+from lib import reset, srs, streak
+from lib.sessions import session_end_time
+from lib.review_buffer import ACK_MODES, ReviewBuffer
+from lib.writer import WriterBusy
+
+# Upper bound on the number of items accepted by the bulk review endpoint
+MAX_BULK_REVIEWS = 1000
+
+def list_study_sessions_sql(seek):
+  # Review counts come from study_session_summary, walked newest first on its start_time index
+  where = 'WHERE ' + seek_clause('s.start_time', 's.study_session_id', 'desc') if seek else ''
+  return f'''
+    SELECT 
+      s.study_session_id as id,
+      s.group_id,
+      g.name as group_name,
+      sa.id as activity_id,
+      sa.name as activity_name,
+      s.start_time as created_at,
+      s.last_activity_time,
+      s.review_count as review_items_count
+    FROM study_session_summary s
+    JOIN groups g ON g.id = s.group_id
+    JOIN study_activities sa ON sa.id = s.study_activity_id
+    {where}
+    ORDER BY s.start_time DESC, s.study_session_id DESC
+    LIMIT ? OFFSET ?
+  '''
 
 def load(app):
+  app.db.define('study_sessions.list', list_study_sessions_sql, seek=(False, True))
+
   # Add POST route for creating study sessions
   @app.route('/api/study-sessions', methods=['POST'])
-  @cross_origin()
   def create_study_session():
     """
     Creates a new study session.
@@ -34,25 +64,34 @@ def load(app):
         return jsonify({"error": "group_id and activity_id must be integers"}), 400
 
       # Insert data into the database
-      cursor = app.db.cursor()
-      cursor.execute('''
-          INSERT INTO study_sessions (group_id, study_activity_id, created_at)
-          VALUES (?, ?, ?)
-      ''', (group_id, activity_id, datetime.now()))
-      app.db.commit()
+      current_time = datetime.now()
+      timezone = streak.get_timezone(app.config.get('STREAK_TIMEZONE'))
+
+      def write(cursor):
+        cursor.execute('''
+            INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+            VALUES (?, ?, ?)
+        ''', (group_id, activity_id, current_time))
 
-      # Get the ID of the newly created study session
-      study_session_id = cursor.lastrowid
+        # Get the ID of the newly created study session
+        study_session_id = cursor.lastrowid
+
+        # Advance the study streak in the same transaction
+        streak.record(cursor, current_time, timezone)
+        return study_session_id
+
+      study_session_id = app.db.write(write)
 
       # Return success response
       return jsonify({"message": "Study session created", "id": study_session_id}), 201
 
+    except WriterBusy as e:
+      return jsonify({"error": str(e)}), 503
     except Exception as e:
       # Handle errors
       return jsonify({"error": str(e)}), 500
 
   @app.route('/api/study-sessions', methods=['GET'])
-  @cross_origin()
   def get_study_sessions():
     try:
       cursor = app.db.cursor()
@@ -62,56 +101,55 @@ def load(app):
       per_page = request.args.get('per_page', 10, type=int)
       offset = (page - 1) * per_page
 
-      # Get total count
-      cursor.execute('''
-        SELECT COUNT(*) as count 
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-      ''')
-      total_count = cursor.fetchone()['count']
-
-      # Get paginated sessions
-      cursor.execute('''
-        SELECT 
-          ss.id,
-          ss.group_id,
-          g.name as group_name,
-          sa.id as activity_id,
-          sa.name as activity_name,
-          ss.created_at,
-          COUNT(wri.id) as review_items_count
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-        GROUP BY ss.id
-        ORDER BY ss.created_at DESC
-        LIMIT ? OFFSET ?
-      ''', (per_page, offset))
+      # A cursor switches to keyset pagination on (created_at, id), newest first
+      page_cursor = request.args.get('cursor')
+      params = []
+      if page_cursor:
+        try:
+          params = list(decode_cursor(page_cursor, 'created_at', 'desc'))
+        except InvalidCursor as e:
+          return jsonify({"error": str(e)}), 400
+      if page_cursor is not None:
+        offset = 0
+
+      # Get paginated sessions, plus one row to detect a next page
+      app.db.execute(cursor, 'study_sessions.list', params + [per_page + 1, offset], seek=bool(page_cursor))
       sessions = cursor.fetchall()
+      cursor_token = next_cursor(sessions, per_page, 'created_at', 'desc', 'created_at')
+
+      items = [{
+        'id': session['id'],
+        'group_id': session['group_id'],
+        'group_name': session['group_name'],
+        'activity_id': session['activity_id'],
+        'activity_name': session['activity_name'],
+        'start_time': session['created_at'],
+        'end_time': session_end_time(session['created_at'], session['last_activity_time']),
+        'review_items_count': session['review_items_count']
+      } for session in sessions[:per_page]]
+
+      # Keyset pages skip the COUNT(*) entirely
+      if page_cursor is not None:
+        return jsonify({
+          'items': items,
+          'next_cursor': cursor_token
+        })
+
+      # Get total count
+      total_count = app.db.counter(cursor, 'study_sessions')
 
       return jsonify({
-        'items': [{
-          'id': session['id'],
-          'group_id': session['group_id'],
-          'group_name': session['group_name'],
-          'activity_id': session['activity_id'],
-          'activity_name': session['activity_name'],
-          'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time since we don't track end time
-          'review_items_count': session['review_items_count']
-        } for session in sessions],
+        'items': items,
         'total': total_count,
         'page': page,
         'per_page': per_page,
-        'total_pages': math.ceil(total_count / per_page)
+        'total_pages': math.ceil(total_count / per_page),
+        'next_cursor': cursor_token
       })
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
-  @app.route('/api/study-sessions/<id>', methods=['GET'])
-  @cross_origin()
+  @app.route('/api/study-sessions/<int:id>', methods=['GET'])
   def get_study_session(id):
     try:
       cursor = app.db.cursor()
@@ -119,19 +157,18 @@ def load(app):
       # Get session details
       cursor.execute('''
         SELECT 
-          ss.id,
-          ss.group_id,
+          s.study_session_id as id,
+          s.group_id,
           g.name as group_name,
           sa.id as activity_id,
           sa.name as activity_name,
-          ss.created_at,
-          COUNT(wri.id) as review_items_count
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-        WHERE ss.id = ?
-        GROUP BY ss.id
+          s.start_time as created_at,
+          s.last_activity_time,
+          s.review_count as review_items_count
+        FROM study_session_summary s
+        JOIN groups g ON g.id = s.group_id
+        JOIN study_activities sa ON sa.id = s.study_activity_id
+        WHERE s.study_session_id = ?
       ''', (id,))
       
       session = cursor.fetchone()
@@ -160,14 +197,7 @@ def load(app):
       words = cursor.fetchall()
 
       # Get total count of words
-      cursor.execute('''
-        SELECT COUNT(DISTINCT w.id) as count
-        FROM words w
-        JOIN word_review_items wri ON wri.word_id = w.id
-        WHERE wri.study_session_id = ?
-      ''', (id,))
-      
-      total_count = cursor.fetchone()['count']
+      total_count = app.db.counter(cursor, 'session_words', session['id'])
 
       return jsonify({
         'session': {
@@ -177,7 +207,7 @@ def load(app):
           'activity_id': session['activity_id'],
           'activity_name': session['activity_name'],
           'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time
+          'end_time': session_end_time(session['created_at'], session['last_activity_time']),
           'review_items_count': session['review_items_count']
         },
         'words': [{
@@ -196,8 +226,7 @@ def load(app):
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
-  @app.route('/api/study-sessions/<id>/review', methods=['POST'])
-  @cross_origin()
+  @app.route('/api/study-sessions/<int:id>/review', methods=['POST'])
   def create_study_session_review(id):
     """
     Records a word review result for a specific study session.
@@ -208,10 +237,16 @@ def load(app):
     Request Body:
         {
             "word_id": integer,  # ID of the word being reviewed
-            "correct": boolean   # Whether the review was correct
+            "correct": boolean,  # Whether the review was correct
+            "ack": string        # Optional, "durable" (default) or "buffered", also accepted as ?ack=
         }
+
+    With REVIEW_BUFFER enabled the review goes through the write-behind buffer.
+    A durable ack waits for the batch to be committed, a buffered ack returns
+    202 without an id as soon as the review is spooled.
     
     Returns:
+        202: Review buffered, same body without "id" and with "status": "buffered"
         201: Review created successfully
         {
             "id": integer,           # ID of the created review
@@ -226,6 +261,7 @@ def load(app):
             - Missing required fields (word_id or correct)
             - Invalid data types
         404: Study session not found
+        409: The session is being deleted by a study history reset
         500: Server error
             - Database errors
             - Other internal errors
@@ -257,9 +293,12 @@ def load(app):
       # Validate data types
       try:
         word_id = int(data['word_id'])
-        correct = bool(data['correct'])
       except (ValueError, TypeError):
         return jsonify({"error": "Invalid data types: word_id must be integer, correct must be boolean"}), 400
+      # bool() would take any non-empty string as true
+      correct = data['correct']
+      if not isinstance(correct, bool):
+        return jsonify({"error": "Invalid data types: word_id must be integer, correct must be boolean"}), 400
       
       # Check if study session exists
       cursor = app.db.cursor()
@@ -269,18 +308,38 @@ def load(app):
       if not session:
         return jsonify({"error": "Study session not found"}), 404
 
-      # Insert the review data
+      # With the write-behind buffer enabled the review is committed by the next group commit
       current_time = datetime.now()
-      cursor.execute('''
-        INSERT INTO word_review_items (study_session_id, word_id, correct, created_at)
-        VALUES (?, ?, ?, ?)
-      ''', (id, word_id, 1 if correct else 0, current_time))
-      
-      # Get the ID of the newly created review
-      review_id = cursor.lastrowid
-      
-      # Commit the transaction
-      app.db.commit()
+      if app.review_buffer is not None:
+        ack = request.args.get('ack', data.get('ack', 'durable'))
+        if ack not in ACK_MODES:
+          return jsonify({"error": f"ack must be one of {', '.join(ACK_MODES)}"}), 400
+        pending = app.review_buffer.submit(id, word_id, correct, current_time, durable=ack == 'durable')
+        review = {
+          "study_session_id": id,
+          "word_id": word_id,
+          "correct": correct,
+          "created_at": current_time.isoformat()
+        }
+        if ack == 'buffered':
+          return jsonify(dict(review, status="buffered")), 202
+        return jsonify(dict(review, id=pending.wait(app.review_buffer.timeout))), 201
+
+      def write(cursor):
+        # Insert the review data
+        cursor.execute('''
+          INSERT INTO word_review_items (study_session_id, word_id, correct, created_at)
+          VALUES (?, ?, ?, ?)
+        ''', (id, word_id, 1 if correct else 0, current_time))
+
+        # Get the ID of the newly created review
+        review_id = cursor.lastrowid
+
+        # Schedule the word's next review in the same transaction
+        srs.record(cursor, [(word_id, correct, current_time)])
+        return review_id
+
+      review_id = app.db.write(write)
       
       # Return the created review item
       return jsonify({
@@ -291,78 +350,208 @@ def load(app):
         "created_at": current_time.isoformat()
       }), 201
       
+    except WriterBusy as e:
+      return jsonify({"error": str(e)}), 503
     except sqlite3.Error as e:
       app.db.rollback()
+      if reset.refused(e):
+        return jsonify({"error": "Study history reset in progress, this session is being deleted"}), 409
+      return jsonify({"error": f"Database error: {str(e)}"}), 500
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/api/study-sessions/<int:id>/reviews', methods=['POST'])
+  def create_study_session_reviews(id):
+    """
+    Records a batch of word review results for a specific study session.
+
+    The whole array is validated first; if any item is invalid nothing is
+    inserted. Valid batches are written with a single executemany in one
+    transaction.
+
+    Parameters:
+        id (int): The ID of the study session
+
+    Request Body:
+        [
+            {
+                "word_id": integer,    # ID of the word being reviewed
+                "correct": boolean,    # Whether the review was correct
+                "created_at": string   # Optional ISO format timestamp, defaults to now. One
+                                       # with an offset is stored in server local time.
+            },
+            ...
+        ]
+
+    Returns:
+        201: Reviews created successfully
+        {
+            "study_session_id": integer,
+            "created": integer,        # Number of reviews inserted
+            "results": [
+                {"index": 0, "id": integer, "word_id": integer, "correct": boolean, "created_at": string},
+                ...
+            ]
+        }
+
+    Error Responses:
+        400: Invalid request, nothing was inserted
+            - Body is not a non-empty array or has more than MAX_BULK_REVIEWS items
+            - Per-item errors, including unknown word ids:
+              {"error": ..., "results": [{"index": 0, "error": "..."}, ...]}
+        404: Study session not found
+        409: The session is being deleted by a study history reset
+        500: Server error
+    """
+    try:
+      data = request.get_json(silent=True)
+      if not isinstance(data, list) or not data:
+        return jsonify({"error": "Request body must be a non-empty array of reviews"}), 400
+      if len(data) > MAX_BULK_REVIEWS:
+        return jsonify({"error": f"At most {MAX_BULK_REVIEWS} reviews per request"}), 400
+
+      # Validate the fields of every item, then their words with a single query
+      current_time = datetime.now()
+      rows = []
+      indexes = []
+      errors = []
+      for index, item in enumerate(data):
+        if not isinstance(item, dict) or 'word_id' not in item or 'correct' not in item:
+          errors.append({"index": index, "error": "Missing required fields: word_id and correct"})
+          continue
+        word_id = item['word_id']
+        correct = item['correct']
+        if isinstance(word_id, bool) or not isinstance(word_id, int):
+          errors.append({"index": index, "error": "word_id must be integer"})
+          continue
+        if not isinstance(correct, bool):
+          errors.append({"index": index, "error": "correct must be boolean"})
+          continue
+        created_at = current_time
+        if item.get('created_at') is not None:
+          try:
+            created_at = datetime.fromisoformat(item['created_at'])
+          except (ValueError, TypeError):
+            errors.append({"index": index, "error": "created_at must be an ISO format timestamp"})
+            continue
+          if created_at.tzinfo is not None:
+            # Every created_at is naive server local time
+            created_at = created_at.astimezone().replace(tzinfo=None)
+        rows.append((id, word_id, 1 if correct else 0, created_at))
+        indexes.append(index)
+
+      # Unknown words are item errors too, looked up with one query for the whole batch
+      cursor = app.db.cursor()
+      if rows:
+        cursor.execute('SELECT id FROM words WHERE id IN (SELECT value FROM json_each(?))',
+                       (json.dumps(sorted({row[1] for row in rows})),))
+        known = {row[0] for row in cursor.fetchall()}
+        errors.extend({"index": index, "error": "Word not found"}
+                      for index, row in zip(indexes, rows) if row[1] not in known)
+        errors.sort(key=lambda error: error['index'])
+
+      if errors:
+        return jsonify({"error": "Invalid reviews, nothing was recorded", "results": errors}), 400
+
+      # Check if study session exists
+      cursor.execute('SELECT id FROM study_sessions WHERE id = ?', (id,))
+      if not cursor.fetchone():
+        return jsonify({"error": "Study session not found"}), 404
+
+      # Insert the whole batch in one transaction
+      def write(cursor):
+        cursor.executemany('''
+          INSERT INTO word_review_items (study_session_id, word_id, correct, created_at)
+          VALUES (?, ?, ?, ?)
+        ''', rows)
+
+        # The batch was written by a single transaction, so its ids are consecutive
+        cursor.execute('SELECT last_insert_rowid()')
+        first_id = cursor.fetchone()[0] - len(rows) + 1
+
+        srs.record(cursor, [(row[1], row[2] == 1, row[3]) for row in rows])
+        return first_id
+
+      first_id = app.db.write(write)
+
+      return jsonify({
+        "study_session_id": id,
+        "created": len(rows),
+        "results": [{
+          "index": index,
+          "id": first_id + index,
+          "word_id": row[1],
+          "correct": bool(row[2]),
+          "created_at": row[3].isoformat()
+        } for index, row in enumerate(rows)]
+      }), 201
+
+    except WriterBusy as e:
+      return jsonify({"error": str(e)}), 503
+    except sqlite3.Error as e:
+      app.db.rollback()
+      if reset.refused(e):
+        return jsonify({"error": "Study history reset in progress, this session is being deleted"}), 409
       return jsonify({"error": f"Database error: {str(e)}"}), 500
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
   @app.route('/api/study-sessions/reset', methods=['POST'])
-  @cross_origin()
   def reset_study_sessions():
+    """
+    Starts clearing the study history in the background, see lib/reset.py.
+    Expects an optional JSON payload with 'archive' (bool) to keep the deleted rows
+    in the archive database. GET /api/study-sessions/reset reports the progress.
+    """
     try:
-      cursor = app.db.cursor()
-      
-      # First delete all word review items since they have foreign key constraints
-      cursor.execute('DELETE FROM word_review_items')
-      
-      # Then delete all study sessions
-      cursor.execute('DELETE FROM study_sessions')
-      
-      app.db.commit()
-      
-      return jsonify({"message": "Study history cleared successfully"}), 200
+      data = request.get_json(silent=True) or {}
+      archive = data.get('archive', False)
+      if not isinstance(archive, bool):
+        return jsonify({"error": "archive must be a boolean"}), 400
+
+      if not app.history_reset.start(archive=archive):
+        return jsonify({"error": "A reset is already running"}), 409
+
+      return jsonify(dict(app.history_reset.status(), message="Study history reset started")), 202
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
+  @app.route('/api/study-sessions/reset', methods=['GET'])
+  def get_reset_status():
+    return jsonify(app.history_reset.status())
+
 class StudySessionTestCase(unittest.TestCase):
     def setUp(self):
-        # Create a test app and configure it
-        self.app = Flask(__name__)
-        self.app.config['TESTING'] = True
-        self.app.config['DEBUG'] = False
-        # Use an in-memory SQLite database for testing
-        self.app.config['DATABASE'] = 'test.db'  
+        # Create a test app backed by a fresh database with the full schema
+        from app import create_app
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app({
+            'TESTING': True,
+            'DEBUG': False,
+            'DATABASE': os.path.join(self.directory, 'test.db')
+        })
+        with self.app.app_context():
+            cursor = self.app.db.cursor()
+            self.app.db.setup_tables(cursor)
+            self.app.db.migrate(cursor)
+
+        # Separate connection for inspecting what the routes wrote
         self.db = sqlite3.connect(self.app.config['DATABASE'])
-        self.app.db = self.db  # Attach the database connection to the app
-        
-        # Load the routes
-        load(self.app)
-        
+
         # Create a test client
         self.client = self.app.test_client()
 
-        # Create the study_sessions table
-        cursor = self.db.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS study_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id INTEGER NOT NULL,
-                study_activity_id INTEGER NOT NULL,
-                created_at DATETIME
-            )
-        ''')
-        self.db.commit()
-        cursor.close()
-
-        # Create the word_review_items table
-        cursor = self.db.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS word_review_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                study_session_id INTEGER NOT NULL,
-                word_id INTEGER NOT NULL,
-                correct INTEGER NOT NULL,
-                created_at DATETIME,
-                FOREIGN KEY (study_session_id) REFERENCES study_sessions(id)
-            )
-        ''')
-        self.db.commit()
-        cursor.close()
-
     def tearDown(self):
         # Clean up resources after each test
+        if self.app.review_buffer is not None:
+            self.app.review_buffer.close()
+        if self.app.db.writer is not None:
+            self.app.db.writer.close()
         self.db.close()
+        self.app.db.pool.close_all()
+        if self.app.db.read_pool is not None:
+            self.app.db.read_pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
 
     def test_create_study_session_success(self):
         # Send a POST request to create a study session
@@ -475,5 +664,177 @@ class StudySessionTestCase(unittest.TestCase):
         })
         self.assertEqual(response.status_code, 400)
 
+    def test_create_reviews_bulk_success(self):
+        self.db.executemany("INSERT INTO words (kanji, romaji, english, parts) VALUES (?, '', '', '[]')",
+                            [('一',), ('二',), ('三',)])
+        self.db.commit()
+        # Create session first
+        response = self.client.post('/api/study-sessions', json={
+            'group_id': 1,
+            'activity_id': 1
+        })
+        session_id = json.loads(response.get_data(as_text=True))['id']
+
+        reviews = [
+            {'word_id': 1, 'correct': True},
+            {'word_id': 2, 'correct': False, 'created_at': '2024-03-21T10:00:00'},
+            {'word_id': 3, 'correct': True}
+        ]
+        response = self.client.post(f'/api/study-sessions/{session_id}/reviews', json=reviews)
+
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['created'], 3)
+        self.assertEqual([r['word_id'] for r in data['results']], [1, 2, 3])
+        self.assertEqual([r['correct'] for r in data['results']], [True, False, True])
+        self.assertEqual(data['results'][1]['created_at'], '2024-03-21T10:00:00')
+
+        # Returned ids match the inserted rows
+        cursor = self.db.cursor()
+        cursor.execute('SELECT id, word_id FROM word_review_items WHERE study_session_id = ? ORDER BY id', (session_id,))
+        self.assertEqual(cursor.fetchall(), [(r['id'], r['word_id']) for r in data['results']])
+
+        # A timestamp with an offset is stored in server local time, like the rest
+        utc = datetime(2024, 3, 21, 10, 0, tzinfo=timezone.utc)
+        response = self.client.post(f'/api/study-sessions/{session_id}/reviews', json=[
+            {'word_id': 1, 'correct': True, 'created_at': utc.isoformat()}
+        ])
+        self.assertEqual(response.status_code, 201)
+        local = utc.astimezone().replace(tzinfo=None)
+        self.assertEqual(response.get_json()['results'][0]['created_at'], local.isoformat())
+
+    def test_create_reviews_bulk_invalid_item(self):
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '一', '', '', '[]')")
+        self.db.commit()
+        # Create session first
+        response = self.client.post('/api/study-sessions', json={
+            'group_id': 1,
+            'activity_id': 1
+        })
+        session_id = json.loads(response.get_data(as_text=True))['id']
+
+        response = self.client.post(f'/api/study-sessions/{session_id}/reviews', json=[
+            {'word_id': 1, 'correct': True},
+            {'word_id': 'not a number', 'correct': True},
+            {'word_id': 3, 'correct': 'not a boolean'},
+            {'word_id': 404, 'correct': True}
+        ])
+
+        # Every invalid item is reported, unknown words included, and nothing is inserted
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual([r['index'] for r in data['results']], [1, 2, 3])
+        self.assertEqual(data['results'][2]['error'], 'Word not found')
+        cursor = self.db.cursor()
+        cursor.execute('SELECT COUNT(*) FROM word_review_items WHERE study_session_id = ?', (session_id,))
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_create_reviews_bulk_invalid_session(self):
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '一', '', '', '[]')")
+        self.db.commit()
+        response = self.client.post('/api/study-sessions/999/reviews', json=[
+            {'word_id': 1, 'correct': True}
+        ])
+        self.assertEqual(response.status_code, 404)
+
+        # Empty batches are rejected, and the body must be the array itself
+        response = self.client.post('/api/study-sessions/999/reviews', json=[])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/study-sessions/999/reviews', json={'reviews': [{'word_id': 1, 'correct': True}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_study_session_advances_streak(self):
+        response = self.client.post('/api/study-sessions', json={
+            'group_id': 1,
+            'activity_id': 1
+        })
+        self.assertEqual(response.status_code, 201)
+
+        cursor = self.db.cursor()
+        cursor.execute('SELECT last_study_date, current_streak, longest_streak FROM study_streak')
+        self.assertEqual(cursor.fetchone(), (datetime.now().date().isoformat(), 1, 1))
+
+        # Consecutive days extend the run, a gap restarts it, the same day changes nothing
+        state = (None, 0, 0)
+        for day in ['2024-03-01', '2024-03-02', '2024-03-02', '2024-03-03', '2024-03-05']:
+            state = streak.advance(state, datetime.fromisoformat(day).date())
+        self.assertEqual(state, (datetime.fromisoformat('2024-03-05').date(), 1, 3))
+
+    def test_review_invalidates_cached_responses(self):
+        self.db.execute("INSERT INTO study_activities (name, url) VALUES ('Typing Tutor', 'http://localhost:8080')")
+        self.db.commit()
+        response = self.client.post('/api/study-sessions', json={
+            'group_id': 1,
+            'activity_id': 1
+        })
+        session_id = json.loads(response.get_data(as_text=True))['id']
+
+        # The second read is served from the cache and answers the conditional request with 304
+        response = self.client.get('/dashboard/recent-session')
+        etag = response.headers['ETag']
+        response = self.client.get('/dashboard/recent-session', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A review bumps the word_review_items version, so the next read is fresh
+        self.client.post(f'/api/study-sessions/{session_id}/review', json={
+            'word_id': 1,
+            'correct': True
+        })
+        response = self.client.get('/dashboard/recent-session', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['correct_count'], 1)
+
+    def test_study_session_summary_tracks_reviews(self):
+        self.db.execute("INSERT INTO groups (name) VALUES ('Core Verbs')")
+        self.db.executemany("INSERT INTO words (kanji, romaji, english, parts) VALUES (?, '', '', '[]')", [('一',), ('二',)])
+        self.db.execute("INSERT INTO study_activities (name, url) VALUES ('Typing', 'http://localhost:8081')")
+        self.db.commit()
+        session_id = self.client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1}).get_json()['id']
+
+        # Without reviews the end time falls back to start + 30 minutes
+        data = self.client.get('/groups/1/study_sessions').get_json()['study_sessions'][0]
+        start = datetime.fromisoformat(data['start_time'])
+        self.assertEqual(data['end_time'], (start + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M:%S'))
+
+        self.client.post(f'/api/study-sessions/{session_id}/reviews', json=[
+            {'word_id': 1, 'correct': True},
+            {'word_id': 2, 'correct': False, 'created_at': '2030-01-01T10:00:00'}
+        ])
+        row = self.db.execute('''
+            SELECT review_count, correct_count, wrong_count, last_activity_time
+            FROM study_session_summary WHERE study_session_id = ?
+        ''', (session_id,)).fetchone()
+        self.assertEqual(row, (2, 1, 1, '2030-01-01 10:00:00'))
+
+        data = self.client.get(f'/api/study-sessions/{session_id}').get_json()['session']
+        self.assertEqual(data['review_items_count'], 2)
+        self.assertEqual(data['end_time'], '2030-01-01 10:00:00')
+
+    def test_buffered_and_durable_review_acks(self):
+        self.app.review_buffer = ReviewBuffer(
+            self.app.db, os.path.join(self.directory, 'reviews.spool'), max_items=10, max_delay=0.01
+        )
+        session_id = self.client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1}).get_json()['id']
+
+        response = self.client.post(f'/api/study-sessions/{session_id}/review?ack=buffered', json={
+            'word_id': 1,
+            'correct': True
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['status'], 'buffered')
+
+        # A durable ack returns after the group commit, which includes the buffered review before it
+        response = self.client.post(f'/api/study-sessions/{session_id}/review', json={
+            'word_id': 2,
+            'correct': False,
+            'ack': 'durable'
+        })
+        self.assertEqual(response.status_code, 201)
+        rows = self.db.execute('SELECT id, word_id FROM word_review_items ORDER BY id').fetchall()
+        self.assertEqual([row[1] for row in rows], [1, 2])
+        self.assertEqual(response.get_json()['id'], rows[1][0])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
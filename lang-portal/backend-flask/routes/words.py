@@ -1,11 +1,76 @@
 from flask import request, jsonify, g
-from flask_cors import cross_origin
 import json
+import re
+from lib.pagination import InvalidCursor, decode_cursor, next_cursor, seek_clause
+
+# Sort expressions and the id that breaks ties, so every row has a unique position.
+# The counts come from the word_reviews counter cache and are sorted on its indexes.
+SORT_COLUMNS = {
+  'kanji': ('w.kanji', 'w.id'),
+  'romaji': ('w.romaji', 'w.id'),
+  'english': ('w.english', 'w.id'),
+  'correct_count': ('r.correct_count', 'r.word_id'),
+  'wrong_count': ('r.wrong_count', 'r.word_id')
+}
+
+def list_words_sql(sort_by, order, seek):
+  # One fixed statement text per sort, order and pagination mode
+  sort_column, id_column = SORT_COLUMNS[sort_by]
+  where = 'WHERE ' + seek_clause(sort_column, id_column, order) if seek else ''
+  return f'''
+    SELECT w.id, w.kanji, w.romaji, w.english, 
+        COALESCE(r.correct_count, 0) AS correct_count,
+        COALESCE(r.wrong_count, 0) AS wrong_count
+    FROM words w
+    JOIN word_reviews r ON w.id = r.word_id
+    {where}
+    ORDER BY {sort_column} {order}, {id_column} {order}
+    LIMIT ? OFFSET ?
+  '''
+
+# Searches matching more words than this skip bm25 ranking
+MAX_RANKED_MATCHES = 20000
+
+def search_words_sql(ranked):
+  # bm25 weighs kanji and romaji matches over english ones
+  score = 'bm25(words_fts, 2.0, 2.0, 1.0)' if ranked else 'rowid'
+  return f'''
+    SELECT w.id, w.kanji, w.romaji, w.english,
+        COALESCE(r.correct_count, 0) AS correct_count,
+        COALESCE(r.wrong_count, 0) AS wrong_count
+    FROM (
+      SELECT rowid, {score} AS score
+      FROM words_fts
+      WHERE words_fts MATCH ?
+      ORDER BY score, rowid
+      LIMIT ? OFFSET ?
+    ) f
+    JOIN words w ON w.id = f.rowid
+    JOIN word_reviews r ON w.id = r.word_id
+    ORDER BY f.score, w.id
+  '''
+
+def match_query(q):
+  """
+  Turn a search box string into an FTS5 MATCH expression.
+  Every term is a quoted prefix query, so partial romaji like "tabe" finds "taberu".
+  Several terms are also tried as one romaji prefix, for romaji typed with spaces.
+  """
+  terms = re.findall(r'\w+', q)
+  if not terms:
+    return None
+  expression = ' '.join(f'"{term}"*' for term in terms)
+  if len(terms) > 1:
+    expression = f'({expression}) OR romaji : "{"".join(terms)}"*'
+  return expression
 
 def load(app):
-  # Endpoint: GET /words with pagination (50 words per page)
+  app.db.define('words.list', list_words_sql, sort_by=SORT_COLUMNS, order=('asc', 'desc'), seek=(False, True))
+  app.db.define('words.search', search_words_sql, ranked=(True, False))
+
+  # Endpoint: GET /words with pagination (50 words per page), by page or by cursor
   @app.route('/words', methods=['GET'])
-  @cross_origin()
+  @app.cache.cached('words', 'word_review_items')
   def get_words():
     try:
       cursor = app.db.cursor()
@@ -28,27 +93,27 @@ def load(app):
       if order not in ['asc', 'desc']:
         order = 'asc'
 
-      # Query to fetch words with sorting
-      cursor.execute(f'''
-        SELECT w.id, w.kanji, w.romaji, w.english, 
-            COALESCE(r.correct_count, 0) AS correct_count,
-            COALESCE(r.wrong_count, 0) AS wrong_count
-        FROM words w
-        LEFT JOIN word_reviews r ON w.id = r.word_id
-        ORDER BY {sort_by} {order}
-        LIMIT ? OFFSET ?
-      ''', (words_per_page, offset))
+      # A cursor switches to keyset pagination (an empty cursor starts at the first row)
+      page_cursor = request.args.get('cursor')
+      params = []
+      if page_cursor:
+        try:
+          params = list(decode_cursor(page_cursor, sort_by, order))
+        except InvalidCursor as e:
+          return jsonify({"error": str(e)}), 400
+      if page_cursor is not None:
+        offset = 0
 
-      words = cursor.fetchall()
+      # Query to fetch words with sorting, one extra row tells whether there is a next page
+      app.db.execute(cursor, 'words.list', params + [words_per_page + 1, offset],
+        sort_by=sort_by, order=order, seek=bool(page_cursor))
 
-      # Query the total number of words
-      cursor.execute('SELECT COUNT(*) FROM words')
-      total_words = cursor.fetchone()[0]
-      total_pages = (total_words + words_per_page - 1) // words_per_page
+      words = cursor.fetchall()
+      cursor_token = next_cursor(words, words_per_page, sort_by, order, sort_by)
 
       # Format the response
       words_data = []
-      for word in words:
+      for word in words[:words_per_page]:
         words_data.append({
           "id": word["id"],
           "kanji": word["kanji"],
@@ -58,21 +123,77 @@ def load(app):
           "wrong_count": word["wrong_count"]
         })
 
+      # Keyset pages skip the COUNT(*) entirely
+      if page_cursor is not None:
+        return jsonify({
+          "words": words_data,
+          "next_cursor": cursor_token
+        })
+
+      # The total number of words, from the trigger-maintained counter
+      total_words = app.db.counter(cursor, 'words')
+      total_pages = (total_words + words_per_page - 1) // words_per_page
+
       return jsonify({
         "words": words_data,
         "total_pages": total_pages,
         "current_page": page,
-        "total_words": total_words
+        "total_words": total_words,
+        "next_cursor": cursor_token
+      })
+
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Endpoint: GET /words/search?q= full-text search over kanji, romaji and english, best matches first
+  @app.route('/words/search', methods=['GET'])
+  @app.cache.cached('words', 'word_review_items')
+  def search_words():
+    try:
+      q = request.args.get('q', '').strip()
+      if not q:
+        return jsonify({"error": "Missing search query q"}), 400
+
+      page = max(1, int(request.args.get('page', 1)))
+      words_per_page = 50
+      offset = (page - 1) * words_per_page
+
+      expression = match_query(q)
+      if expression is None:
+        return jsonify({"words": [], "total_pages": 0, "current_page": page, "total_words": 0, "ranked": True})
+
+      cursor = app.db.cursor()
+
+      cursor.execute('SELECT COUNT(*) FROM words_fts WHERE words_fts MATCH ?', (expression,))
+      total_words = cursor.fetchone()[0]
+      total_pages = (total_words + words_per_page - 1) // words_per_page
+
+      # bm25 has to score every match, past MAX_RANKED_MATCHES the results come in id order instead.
+      # Only the page is joined with words, words_fts is kept in sync with it by triggers.
+      ranked = total_words <= MAX_RANKED_MATCHES
+      app.db.execute(cursor, 'words.search', (expression, words_per_page, offset), ranked=ranked)
+      words = cursor.fetchall()
+
+      return jsonify({
+        "words": [{
+          "id": word["id"],
+          "kanji": word["kanji"],
+          "romaji": word["romaji"],
+          "english": word["english"],
+          "correct_count": word["correct_count"],
+          "wrong_count": word["wrong_count"]
+        } for word in words],
+        "total_pages": total_pages,
+        "current_page": page,
+        "total_words": total_words,
+        "ranked": ranked
       })
 
     except Exception as e:
       return jsonify({"error": str(e)}), 500
-    finally:
-      app.db.close()
 
   # Endpoint: GET /words/:id to get a single word with its details
   @app.route('/words/<int:word_id>', methods=['GET'])
-  @cross_origin()
   def get_word(word_id):
     try:
       cursor = app.db.cursor()
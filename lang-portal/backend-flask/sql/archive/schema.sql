@@ -0,0 +1,18 @@
+-- Study history moved out by the reset endpoint, in a database attached as `archive`.
+-- Rows keep their ids, which AUTOINCREMENT never reuses, so every reset appends.
+CREATE TABLE IF NOT EXISTS archive.study_sessions (
+  id INTEGER PRIMARY KEY,
+  group_id INTEGER NOT NULL,
+  study_activity_id INTEGER NOT NULL,
+  created_at DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS archive.word_review_items (
+  id INTEGER PRIMARY KEY,
+  word_id INTEGER NOT NULL,
+  study_session_id INTEGER NOT NULL,
+  correct BOOLEAN NOT NULL,
+  created_at DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS archive.idx_word_review_items_session ON word_review_items(study_session_id);
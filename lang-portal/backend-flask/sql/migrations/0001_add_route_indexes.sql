@@ -0,0 +1,35 @@
+-- Secondary indexes for the access pattern of each route.
+-- Every statement is idempotent so the migration can be re-applied safely.
+
+-- /words and /groups/:id/words: ORDER BY kanji, romaji or english
+CREATE INDEX IF NOT EXISTS idx_words_kanji ON words(kanji);
+CREATE INDEX IF NOT EXISTS idx_words_romaji ON words(romaji);
+CREATE INDEX IF NOT EXISTS idx_words_english ON words(english);
+
+-- /groups: ORDER BY name or words_count
+CREATE INDEX IF NOT EXISTS idx_groups_name ON groups(name);
+CREATE INDEX IF NOT EXISTS idx_groups_words_count ON groups(words_count);
+
+-- /groups/:id/words and its COUNT(*): group -> words, covering
+CREATE INDEX IF NOT EXISTS idx_word_groups_group_word ON word_groups(group_id, word_id);
+-- /words/:id: word -> groups, covering
+CREATE INDEX IF NOT EXISTS idx_word_groups_word_group ON word_groups(word_id, group_id);
+
+-- LEFT JOIN word_reviews ON word_id in every word listing
+CREATE INDEX IF NOT EXISTS idx_word_reviews_word ON word_reviews(word_id);
+
+-- Per-session aggregates (review counts, correct/wrong, distinct words), covering
+CREATE INDEX IF NOT EXISTS idx_word_review_items_session_word ON word_review_items(study_session_id, word_id, correct);
+-- MAX(created_at) per session for the last activity time
+CREATE INDEX IF NOT EXISTS idx_word_review_items_session_created ON word_review_items(study_session_id, created_at);
+-- Per-word statistics on the dashboard, covering the join back to study_sessions
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word ON word_review_items(word_id, correct, study_session_id);
+
+-- /api/study-sessions and /dashboard/recent-session: newest first
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created ON study_sessions(created_at);
+-- /groups/:id/study_sessions and the active groups window on the dashboard
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created ON study_sessions(group_id, created_at);
+-- /api/study-activities/:id/sessions
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created ON study_sessions(study_activity_id, created_at);
+
+PRAGMA optimize;
@@ -0,0 +1,36 @@
+-- Keep word_reviews as a counter cache of the review log: one row per word,
+-- created with the word and updated by a trigger on every review item.
+
+-- Collapse duplicate rows before the unique index goes in
+DELETE FROM word_reviews WHERE id NOT IN (SELECT MIN(id) FROM word_reviews GROUP BY word_id);
+DROP INDEX IF EXISTS idx_word_reviews_word;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_word_unique ON word_reviews(word_id);
+
+-- /words and /groups/:id/words sorted by correct_count or wrong_count
+CREATE INDEX IF NOT EXISTS idx_word_reviews_correct ON word_reviews(correct_count, word_id);
+CREATE INDEX IF NOT EXISTS idx_word_reviews_wrong ON word_reviews(wrong_count, word_id);
+
+-- Every word has a row, so listings can inner join and sort on the indexes above
+CREATE TRIGGER IF NOT EXISTS words_insert_word_reviews AFTER INSERT ON words
+BEGIN
+  INSERT OR IGNORE INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+  VALUES (NEW.id, 0, 0, NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_delete_word_reviews AFTER DELETE ON words
+BEGIN
+  DELETE FROM word_reviews WHERE word_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_word_reviews AFTER INSERT ON word_review_items
+BEGIN
+  INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+  VALUES (NEW.word_id, NEW.correct = 1, NEW.correct = 0, NEW.created_at)
+  ON CONFLICT(word_id) DO UPDATE SET
+    correct_count = correct_count + excluded.correct_count,
+    wrong_count = wrong_count + excluded.wrong_count,
+    last_reviewed = COALESCE(max(last_reviewed, excluded.last_reviewed), excluded.last_reviewed);
+END;
+
+-- Backfill from the existing review log
+-- include rebuild/word_reviews.sql
@@ -0,0 +1,80 @@
+-- Rollups behind /dashboard/stats, maintained by triggers as sessions and reviews are written.
+-- Per-word attempt and correct totals are the word_reviews counter cache (0002).
+
+-- Per-day session and review counts
+CREATE TABLE IF NOT EXISTS study_daily_stats (
+  study_date TEXT PRIMARY KEY,  -- date(created_at)
+  sessions_count INTEGER NOT NULL DEFAULT 0,
+  reviews_count INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- Global totals, a single row
+CREATE TABLE IF NOT EXISTS study_totals (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  sessions_count INTEGER NOT NULL DEFAULT 0,
+  reviews_count INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,  -- Words with at least one review
+  mastered_words INTEGER NOT NULL DEFAULT 0  -- Words with >= 5 reviews and >= 80% correct
+);
+INSERT OR IGNORE INTO study_totals (id) VALUES (1);
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_insert_rollups AFTER INSERT ON study_sessions
+BEGIN
+  INSERT INTO study_daily_stats (study_date, sessions_count)
+  VALUES (date(NEW.created_at), 1)
+  ON CONFLICT(study_date) DO UPDATE SET sessions_count = sessions_count + 1;
+  UPDATE study_totals SET sessions_count = sessions_count + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_rollups AFTER INSERT ON word_review_items
+BEGIN
+  INSERT INTO study_daily_stats (study_date, reviews_count, correct_count)
+  VALUES (date(NEW.created_at), 1, NEW.correct = 1)
+  ON CONFLICT(study_date) DO UPDATE SET
+    reviews_count = reviews_count + 1,
+    correct_count = correct_count + excluded.correct_count;
+  UPDATE study_totals
+  SET reviews_count = reviews_count + 1,
+      correct_count = correct_count + (NEW.correct = 1)
+  WHERE id = 1;
+END;
+
+-- words_studied and mastered_words follow the per-word totals across their thresholds
+CREATE TRIGGER IF NOT EXISTS word_reviews_insert_rollups AFTER INSERT ON word_reviews
+BEGIN
+  UPDATE study_totals
+  SET words_studied = words_studied + (NEW.correct_count + NEW.wrong_count > 0),
+      mastered_words = mastered_words + (
+        NEW.correct_count + NEW.wrong_count >= 5
+        AND NEW.correct_count * 1.0 / (NEW.correct_count + NEW.wrong_count) >= 0.8)
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_reviews_update_rollups AFTER UPDATE OF correct_count, wrong_count ON word_reviews
+BEGIN
+  UPDATE study_totals
+  SET words_studied = words_studied
+        + (NEW.correct_count + NEW.wrong_count > 0)
+        - (OLD.correct_count + OLD.wrong_count > 0),
+      mastered_words = mastered_words
+        + (NEW.correct_count + NEW.wrong_count >= 5
+           AND NEW.correct_count * 1.0 / (NEW.correct_count + NEW.wrong_count) >= 0.8)
+        - (OLD.correct_count + OLD.wrong_count >= 5
+           AND OLD.correct_count * 1.0 / (OLD.correct_count + OLD.wrong_count) >= 0.8)
+  WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_reviews_delete_rollups AFTER DELETE ON word_reviews
+BEGIN
+  UPDATE study_totals
+  SET words_studied = words_studied - (OLD.correct_count + OLD.wrong_count > 0),
+      mastered_words = mastered_words - (
+        OLD.correct_count + OLD.wrong_count >= 5
+        AND OLD.correct_count * 1.0 / (OLD.correct_count + OLD.wrong_count) >= 0.8)
+  WHERE id = 1;
+END;
+
+-- Backfill from existing history
+-- include rebuild/rollups.sql
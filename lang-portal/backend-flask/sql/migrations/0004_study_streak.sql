@@ -0,0 +1,11 @@
+-- Persisted study streak, advanced by the write path when a study session is created.
+-- Days are calendar days in the configured STREAK_TIMEZONE, so the state is computed
+-- in Python (lib/streak.py), which also replays the existing sessions below.
+CREATE TABLE IF NOT EXISTS study_streak (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_study_date TEXT,  -- Last local date with a study session (YYYY-MM-DD)
+  current_streak INTEGER NOT NULL DEFAULT 0,  -- Consecutive days ending at last_study_date
+  longest_streak INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO study_streak (id) VALUES (1);
+-- backfill streak
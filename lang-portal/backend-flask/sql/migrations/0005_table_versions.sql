@@ -0,0 +1,14 @@
+-- Version counter per source table, bumped in the same transaction as every write path.
+-- The response cache compares these to decide whether a cached response is still current.
+CREATE TABLE IF NOT EXISTS table_versions (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO table_versions (name) VALUES
+  ('words'),
+  ('groups'),
+  ('word_groups'),
+  ('study_activities'),
+  ('study_sessions'),
+  ('word_review_items');
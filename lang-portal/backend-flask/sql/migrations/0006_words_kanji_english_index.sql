@@ -0,0 +1,2 @@
+-- The word importer deduplicates on kanji + english
+CREATE INDEX IF NOT EXISTS idx_words_kanji_english ON words(kanji, english);
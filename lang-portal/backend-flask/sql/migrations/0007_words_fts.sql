@@ -0,0 +1,36 @@
+-- Full-text index over words for GET /words/search. External content table, the
+-- text lives in words only. Prefix indexes make short as-you-type queries cheap.
+CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+  kanji,
+  romaji,
+  english,
+  content='words',
+  content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2',
+  prefix='1 2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS words_insert_words_fts AFTER INSERT ON words
+BEGIN
+  INSERT INTO words_fts (rowid, kanji, romaji, english)
+  VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_delete_words_fts AFTER DELETE ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english)
+  VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_update_words_fts AFTER UPDATE OF kanji, romaji, english ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english)
+  VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+  INSERT INTO words_fts (rowid, kanji, romaji, english)
+  VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+-- Backfill existing words, only while the index is still empty
+INSERT INTO words_fts (rowid, kanji, romaji, english)
+SELECT id, kanji, romaji, english FROM words
+WHERE NOT EXISTS (SELECT 1 FROM words_fts_docsize);
@@ -0,0 +1,58 @@
+-- One row per study session with its review totals, so session listings don't
+-- aggregate word_review_items. Maintained by triggers as sessions and reviews are
+-- written; the reset endpoint clears it together with the sessions.
+CREATE TABLE IF NOT EXISTS study_session_summary (
+  study_session_id INTEGER PRIMARY KEY,
+  group_id INTEGER NOT NULL,
+  study_activity_id INTEGER NOT NULL,
+  start_time DATETIME,  -- study_sessions.created_at
+  last_activity_time DATETIME,  -- Latest review, NULL until the first one
+  review_count INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  wrong_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- /api/study-sessions and /dashboard/recent-session, newest first
+CREATE INDEX IF NOT EXISTS idx_study_session_summary_start ON study_session_summary(start_time);
+-- /groups/:id/study_sessions sorted by start, end or review count
+CREATE INDEX IF NOT EXISTS idx_study_session_summary_group_start ON study_session_summary(group_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_study_session_summary_group_last ON study_session_summary(group_id, last_activity_time);
+CREATE INDEX IF NOT EXISTS idx_study_session_summary_group_reviews ON study_session_summary(group_id, review_count);
+-- /api/study-activities/:id/sessions
+CREATE INDEX IF NOT EXISTS idx_study_session_summary_activity_start ON study_session_summary(study_activity_id, start_time);
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_insert_summary AFTER INSERT ON study_sessions
+BEGIN
+  INSERT OR IGNORE INTO study_session_summary (study_session_id, group_id, study_activity_id, start_time)
+  VALUES (NEW.id, NEW.group_id, NEW.study_activity_id, NEW.created_at);
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_summary AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE study_session_summary
+  SET review_count = review_count + 1,
+      correct_count = correct_count + (NEW.correct = 1),
+      wrong_count = wrong_count + (NEW.correct = 0),
+      last_activity_time = COALESCE(max(last_activity_time, NEW.created_at), NEW.created_at)
+  WHERE study_session_id = NEW.study_session_id;
+END;
+
+-- Backfill from existing history (same as sql/rebuild/study_session_summary.sql), only while empty
+INSERT INTO study_session_summary
+  (study_session_id, group_id, study_activity_id, start_time, last_activity_time, review_count, correct_count, wrong_count)
+SELECT ss.id, ss.group_id, ss.study_activity_id, ss.created_at,
+       reviews.last_activity_time,
+       COALESCE(reviews.review_count, 0),
+       COALESCE(reviews.correct_count, 0),
+       COALESCE(reviews.wrong_count, 0)
+FROM study_sessions ss
+LEFT JOIN (
+  SELECT study_session_id,
+         MAX(created_at) AS last_activity_time,
+         COUNT(*) AS review_count,
+         SUM(correct = 1) AS correct_count,
+         SUM(correct = 0) AS wrong_count
+  FROM word_review_items
+  GROUP BY study_session_id
+) AS reviews ON reviews.study_session_id = ss.id
+WHERE NOT EXISTS (SELECT 1 FROM study_session_summary);
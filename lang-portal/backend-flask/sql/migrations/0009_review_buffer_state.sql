@@ -0,0 +1,7 @@
+-- Last spool sequence number committed by the write-behind review buffer
+-- (lib/review_buffer.py), written in the same transaction as each batch.
+CREATE TABLE IF NOT EXISTS review_buffer_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_flushed_seq INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO review_buffer_state (id) VALUES (1);
@@ -0,0 +1,58 @@
+-- Spaced repetition state per word, advanced in Python (lib/srs.py) by every write
+-- path that records reviews. The existing reviews are replayed at the end.
+CREATE TABLE IF NOT EXISTS word_srs (
+  word_id INTEGER PRIMARY KEY,
+  repetitions INTEGER NOT NULL DEFAULT 0,  -- Correct answers in a row
+  interval_days INTEGER NOT NULL DEFAULT 0,
+  ease REAL NOT NULL DEFAULT 2.5,
+  due_at DATETIME,  -- When the word should be reviewed next
+  last_reviewed DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_word_srs_due ON word_srs(due_at);
+
+-- due_at copied to every group the word is in, so /groups/:id/words/due is a range
+-- scan of (group_id, due_at). Words that were never reviewed have a NULL due_at.
+CREATE TABLE IF NOT EXISTS group_word_due (
+  group_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  due_at DATETIME,
+  PRIMARY KEY (group_id, word_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_group_word_due_due ON group_word_due(group_id, due_at);
+CREATE INDEX IF NOT EXISTS idx_group_word_due_word ON group_word_due(word_id);
+
+CREATE TRIGGER IF NOT EXISTS word_groups_insert_group_word_due AFTER INSERT ON word_groups
+BEGIN
+  INSERT OR IGNORE INTO group_word_due (group_id, word_id, due_at)
+  VALUES (NEW.group_id, NEW.word_id, (SELECT due_at FROM word_srs WHERE word_id = NEW.word_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_delete_group_word_due AFTER DELETE ON word_groups
+BEGIN
+  DELETE FROM group_word_due WHERE group_id = OLD.group_id AND word_id = OLD.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_srs_insert_group_word_due AFTER INSERT ON word_srs
+BEGIN
+  UPDATE group_word_due SET due_at = NEW.due_at WHERE word_id = NEW.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_srs_update_group_word_due AFTER UPDATE OF due_at ON word_srs
+BEGIN
+  UPDATE group_word_due SET due_at = NEW.due_at WHERE word_id = NEW.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_delete_word_srs AFTER DELETE ON words
+BEGIN
+  DELETE FROM word_srs WHERE word_id = OLD.id;
+END;
+
+-- Backfill the group memberships, only while empty
+INSERT OR IGNORE INTO group_word_due (group_id, word_id, due_at)
+SELECT wg.group_id, wg.word_id, s.due_at
+FROM word_groups wg
+LEFT JOIN word_srs s ON s.word_id = wg.word_id
+WHERE NOT EXISTS (SELECT 1 FROM group_word_due);
+
+-- Replay the review log into word_srs, which copies due_at to group_word_due
+-- backfill srs
@@ -0,0 +1,16 @@
+-- Bump the study_activities version on every write, including ones made outside
+-- the app, so the CORS origin set in lib.origins reloads without a restart.
+CREATE TRIGGER IF NOT EXISTS study_activities_insert_version AFTER INSERT ON study_activities
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_activities';
+END;
+
+CREATE TRIGGER IF NOT EXISTS study_activities_update_version AFTER UPDATE ON study_activities
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_activities';
+END;
+
+CREATE TRIGGER IF NOT EXISTS study_activities_delete_version AFTER DELETE ON study_activities
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_activities';
+END;
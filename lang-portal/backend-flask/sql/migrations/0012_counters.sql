@@ -0,0 +1,68 @@
+-- Row counts behind total_pages, read from counters instead of a COUNT(*) per page.
+-- `key` is 0 for table totals, otherwise the group, activity or session id.
+CREATE TABLE IF NOT EXISTS counters (
+  name TEXT NOT NULL,
+  key INTEGER NOT NULL DEFAULT 0,
+  value INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS words_insert_counters AFTER INSERT ON words
+BEGIN
+  INSERT INTO counters (name, key, value) VALUES ('words', 0, 1)
+  ON CONFLICT(name, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_delete_counters AFTER DELETE ON words
+BEGIN
+  UPDATE counters SET value = value - 1 WHERE name = 'words' AND key = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS groups_insert_counters AFTER INSERT ON groups
+BEGIN
+  INSERT INTO counters (name, key, value) VALUES ('groups', 0, 1)
+  ON CONFLICT(name, key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS groups_delete_counters AFTER DELETE ON groups
+BEGIN
+  UPDATE counters SET value = value - 1 WHERE name = 'groups' AND key = 0;
+END;
+
+-- groups.words_count follows every word_groups change, not just the importer's
+CREATE TRIGGER IF NOT EXISTS word_groups_insert_words_count AFTER INSERT ON word_groups
+BEGIN
+  UPDATE groups SET words_count = words_count + 1 WHERE id = NEW.group_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_delete_words_count AFTER DELETE ON word_groups
+BEGIN
+  UPDATE groups SET words_count = words_count - 1 WHERE id = OLD.group_id;
+END;
+
+-- Study history is only deleted wholesale by the reset, which clears these counters
+-- itself, so there are no delete triggers to slow it down
+CREATE TRIGGER IF NOT EXISTS study_sessions_insert_counters AFTER INSERT ON study_sessions
+BEGIN
+  INSERT INTO counters (name, key, value) VALUES
+    ('study_sessions', 0, 1),
+    ('group_sessions', NEW.group_id, 1),
+    ('activity_sessions', NEW.study_activity_id, 1)
+  ON CONFLICT(name, key) DO UPDATE SET value = value + 1;
+END;
+
+-- Distinct words per session: counted on the first review of a word in the session,
+-- found on idx_word_review_items_session_word
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_counters AFTER INSERT ON word_review_items
+BEGIN
+  INSERT INTO counters (name, key, value)
+  SELECT 'session_words', NEW.study_session_id, 1
+  WHERE NOT EXISTS (
+    SELECT 1 FROM word_review_items
+    WHERE study_session_id = NEW.study_session_id AND word_id = NEW.word_id AND id <> NEW.id
+  )
+  ON CONFLICT(name, key) DO UPDATE SET value = value + 1;
+END;
+
+-- Backfill
+-- include rebuild/counters.sql
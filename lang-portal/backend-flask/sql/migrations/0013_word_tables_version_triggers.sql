@@ -0,0 +1,48 @@
+-- Bump the words, groups and word_groups versions on every write, including ones made
+-- outside the app (SQL shells, scripts), so cached word and group responses never
+-- outlive the rows they were built from. Same as 0011 for study_activities.
+
+CREATE TRIGGER IF NOT EXISTS words_insert_version AFTER INSERT ON words
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'words';
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_update_version AFTER UPDATE ON words
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'words';
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_delete_version AFTER DELETE ON words
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'words';
+END;
+
+CREATE TRIGGER IF NOT EXISTS groups_insert_version AFTER INSERT ON groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'groups';
+END;
+
+CREATE TRIGGER IF NOT EXISTS groups_update_version AFTER UPDATE ON groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'groups';
+END;
+
+CREATE TRIGGER IF NOT EXISTS groups_delete_version AFTER DELETE ON groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'groups';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_insert_version AFTER INSERT ON word_groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_groups';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_update_version AFTER UPDATE ON word_groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_groups';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_delete_version AFTER DELETE ON word_groups
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_groups';
+END;
@@ -0,0 +1,13 @@
+-- The cutoff of a history reset while its review items are being deleted (lib/reset.py).
+-- A review added to one of those sessions meanwhile would be counted by the rollups that
+-- were just cleared and then deleted with its session, so it is refused instead.
+CREATE TABLE IF NOT EXISTS history_reset (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  cutoff INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_history_reset BEFORE INSERT ON word_review_items
+WHEN NEW.study_session_id <= (SELECT cutoff FROM history_reset WHERE id = 1)
+BEGIN
+  SELECT RAISE(ABORT, 'study history reset in progress');
+END;
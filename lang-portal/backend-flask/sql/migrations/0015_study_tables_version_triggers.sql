@@ -0,0 +1,33 @@
+-- Bump the study_sessions and word_review_items versions on every write, so the
+-- reset, the review buffer and writes made outside the app all invalidate cached
+-- responses without bumping them by hand. Same as 0013 for the word tables.
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_insert_version AFTER INSERT ON study_sessions
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_update_version AFTER UPDATE ON study_sessions
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS study_sessions_delete_version AFTER DELETE ON study_sessions
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'study_sessions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_version AFTER INSERT ON word_review_items
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_review_items';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_update_version AFTER UPDATE ON word_review_items
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_review_items';
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_delete_version AFTER DELETE ON word_review_items
+BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'word_review_items';
+END;
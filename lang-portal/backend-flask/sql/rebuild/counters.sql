@@ -0,0 +1,17 @@
+-- Recompute counters and groups.words_count from the source tables.
+DELETE FROM counters;
+
+INSERT INTO counters (name, key, value)
+SELECT 'words', 0, COUNT(*) FROM words
+UNION ALL
+SELECT 'groups', 0, COUNT(*) FROM groups
+UNION ALL
+SELECT 'study_sessions', 0, COUNT(*) FROM study_sessions
+UNION ALL
+SELECT 'group_sessions', group_id, COUNT(*) FROM study_sessions GROUP BY group_id
+UNION ALL
+SELECT 'activity_sessions', study_activity_id, COUNT(*) FROM study_sessions GROUP BY study_activity_id
+UNION ALL
+SELECT 'session_words', study_session_id, COUNT(DISTINCT word_id) FROM word_review_items GROUP BY study_session_id;
+
+UPDATE groups SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = groups.id);
@@ -0,0 +1,26 @@
+-- Recompute the dashboard rollups (study_daily_stats, study_totals) from the source tables.
+-- Per-word totals live in word_reviews, see sql/rebuild/word_reviews.sql.
+DELETE FROM study_daily_stats;
+
+INSERT INTO study_daily_stats (study_date, sessions_count, reviews_count, correct_count)
+SELECT study_date, SUM(sessions_count), SUM(reviews_count), SUM(correct_count)
+FROM (
+  SELECT date(created_at) AS study_date, COUNT(*) AS sessions_count, 0 AS reviews_count, 0 AS correct_count
+  FROM study_sessions
+  GROUP BY 1
+  UNION ALL
+  SELECT date(created_at), 0, COUNT(*), SUM(correct = 1)
+  FROM word_review_items
+  GROUP BY 1
+)
+GROUP BY study_date;
+
+INSERT OR REPLACE INTO study_totals (id, sessions_count, reviews_count, correct_count, words_studied, mastered_words)
+SELECT 1,
+       (SELECT COUNT(*) FROM study_sessions),
+       (SELECT COUNT(*) FROM word_review_items),
+       (SELECT COALESCE(SUM(correct = 1), 0) FROM word_review_items),
+       (SELECT COUNT(*) FROM word_reviews WHERE correct_count + wrong_count > 0),
+       (SELECT COUNT(*) FROM word_reviews
+        WHERE correct_count + wrong_count >= 5
+          AND correct_count * 1.0 / (correct_count + wrong_count) >= 0.8);
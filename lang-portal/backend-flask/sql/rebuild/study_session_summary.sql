@@ -0,0 +1,20 @@
+-- Recompute study_session_summary from study_sessions and word_review_items.
+DELETE FROM study_session_summary;
+
+INSERT INTO study_session_summary
+  (study_session_id, group_id, study_activity_id, start_time, last_activity_time, review_count, correct_count, wrong_count)
+SELECT ss.id, ss.group_id, ss.study_activity_id, ss.created_at,
+       reviews.last_activity_time,
+       COALESCE(reviews.review_count, 0),
+       COALESCE(reviews.correct_count, 0),
+       COALESCE(reviews.wrong_count, 0)
+FROM study_sessions ss
+LEFT JOIN (
+  SELECT study_session_id,
+         MAX(created_at) AS last_activity_time,
+         COUNT(*) AS review_count,
+         SUM(correct = 1) AS correct_count,
+         SUM(correct = 0) AS wrong_count
+  FROM word_review_items
+  GROUP BY study_session_id
+) AS reviews ON reviews.study_session_id = ss.id;
@@ -0,0 +1,19 @@
+-- Recompute word_reviews from the review log (one row per word).
+INSERT OR IGNORE INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+SELECT id, 0, 0, NULL FROM words;
+
+UPDATE word_reviews SET correct_count = 0, wrong_count = 0, last_reviewed = NULL;
+
+UPDATE word_reviews
+SET correct_count = totals.correct_count,
+    wrong_count = totals.wrong_count,
+    last_reviewed = totals.last_reviewed
+FROM (
+  SELECT word_id,
+         SUM(correct = 1) AS correct_count,
+         SUM(correct = 0) AS wrong_count,
+         MAX(created_at) AS last_reviewed
+  FROM word_review_items
+  GROUP BY word_id
+) AS totals
+WHERE totals.word_id = word_reviews.word_id;
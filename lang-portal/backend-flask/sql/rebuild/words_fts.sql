@@ -0,0 +1,2 @@
+-- Reindex words_fts from the words table.
+INSERT INTO words_fts (words_fts) VALUES ('rebuild');
@@ -0,0 +1,42 @@
+-- Study data of one learner. Words, groups and activities live in the catalog
+-- database attached as `catalog`, unqualified names fall through to it.
+CREATE TABLE IF NOT EXISTS study_sessions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  group_id INTEGER NOT NULL,  -- catalog.groups
+  study_activity_id INTEGER NOT NULL,  -- catalog.study_activities
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS word_review_items (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  word_id INTEGER NOT NULL,  -- catalog.words
+  study_session_id INTEGER NOT NULL REFERENCES study_sessions(id),
+  correct BOOLEAN NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Counter cache of the review log as in migration 0002, without a row per catalog word:
+-- a word without a row has never been reviewed by this learner
+CREATE TABLE IF NOT EXISTS word_reviews (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  word_id INTEGER NOT NULL,
+  correct_count INTEGER DEFAULT 0,
+  wrong_count INTEGER DEFAULT 0,
+  last_reviewed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_word_unique ON word_reviews(word_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_session_word ON word_review_items(study_session_id, word_id, correct);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word ON word_review_items(word_id, correct, study_session_id);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created ON study_sessions(created_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created ON study_sessions(group_id, created_at);
+
+CREATE TRIGGER IF NOT EXISTS word_review_items_insert_word_reviews AFTER INSERT ON word_review_items
+BEGIN
+  INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+  VALUES (NEW.word_id, NEW.correct = 1, NEW.correct = 0, NEW.created_at)
+  ON CONFLICT(word_id) DO UPDATE SET
+    correct_count = correct_count + excluded.correct_count,
+    wrong_count = wrong_count + excluded.wrong_count,
+    last_reviewed = COALESCE(max(last_reviewed, excluded.last_reviewed), excluded.last_reviewed);
+END;
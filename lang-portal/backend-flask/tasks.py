@@ -1,3 +1,4 @@
+import os
 from invoke import task
 from lib.db import db
 
@@ -6,4 +7,682 @@ def init_db(c):
   from flask import Flask
   app = Flask(__name__)
   db.init(app)
-  print("Database initialized successfully.")
\ No newline at end of file
+  print("Database initialized successfully.")
+
+@task
+def bench_pool(c, requests=2000, threads=4, path='/words', profile='balanced'):
+  """
+  Compare opening a connection per request with the pooled Db.get().
+  """
+  from app import create_app
+  from lib import bench
+
+  with bench.temp_database() as database:
+    for label, pool_size in (('per-request connect', 0), ('pooled', threads)):
+      app = create_app({'DATABASE': database, 'DB_POOL_SIZE': pool_size, 'DB_PROFILE': profile, 'CACHE_MAX_BYTES': 0})
+      bench.run_requests(app, path, 50, threads)  # warm up
+      samples, elapsed = bench.run_requests(app, path, requests, threads)
+      print(bench.format_summary(label, bench.summarize(samples, elapsed)))
+      print(f"{'':<24} pool: {app.db.pool_stats()}")
+      app.db.pool.close_all()
+
+@task
+def bench_queries(c, words=50000, sessions=200000, reviews=2000000, indexes=True, output=None, repeat=5):
+  """
+  Record EXPLAIN QUERY PLAN output and latency for every route query on a synthetic database.
+  """
+  import json
+  from app import create_app
+  from lib import bench, synthetic
+
+  with bench.temp_database(seed=False) as database:
+    print(f"Generating {words} words, {sessions} sessions, {reviews} review items...")
+    synthetic.generate(database, words=words, sessions=sessions, reviews=reviews, migrate=indexes)
+    app = create_app({'DATABASE': database, 'DB_POOL_SIZE': 1, 'CACHE_MAX_BYTES': 0, 'MIGRATE_ON_START': indexes})
+    report = bench.profile_routes(app, database, repeat=repeat)
+    app.db.pool.close_all()
+
+  for entry in report:
+    print(bench.format_summary(entry['route'], entry['latency']))
+    for statement in entry['statements']:
+      print(f"    {statement['latency']['p50_ms']:9.3f}ms  {statement['sql'][:110]}")
+      for line in statement['plan']:
+        marker = '!' if line in statement['warnings'] else ' '
+        print(f"      {marker} {line}")
+  if output:
+    with open(output, 'w') as file:
+      json.dump(report, file, indent=2)
+    print(f"Report written to {output}")
+
+@task
+def generate(c, path='synthetic.db', words=50000, groups=20, sessions=100000, reviews=2000000, days=365, skew=1.5, seed=None):
+  """
+  Create a database with synthetic words, groups, sessions and review items.
+  """
+  import time
+  from lib import synthetic
+
+  if os.path.exists(path):
+    raise SystemExit(f"{path} already exists")
+  started = time.perf_counter()
+  synthetic.generate(
+    path, words=words, groups=groups, sessions=sessions, reviews=reviews,
+    days=days, skew=skew, seed=None if seed is None else int(seed)
+  )
+  print(f"Generated {path} in {time.perf_counter() - started:.1f}s")
+
+@task
+def bench_routes(c, database=None, words=50000, groups=20, sessions=100000, reviews=2000000, skew=1.5, seed=1,
+                 repeat=20, output=None, compare=None):
+  """
+  p50/p95/p99 latency and queries per request of every endpoint, optionally written to JSON and compared with a previous run.
+  """
+  import json
+  import shutil
+  import sqlite3
+  import time
+  from app import create_app
+  from lib import bench, synthetic
+
+  params = dict(words=words, groups=groups, sessions=sessions, reviews=reviews, skew=skew, seed=seed)
+  with bench.temp_database(seed=False) as path:
+    if database:
+      # Benchmark a copy, the write routes change the data
+      shutil.copyfile(database, path)
+      params = {'database': database}
+    else:
+      print(f"Generating {words} words, {sessions} sessions, {reviews} review items...")
+      synthetic.generate(path, words=words, groups=groups, sessions=sessions, reviews=reviews, skew=skew, seed=int(seed))
+    app = create_app({'DATABASE': path, 'DB_POOL_SIZE': 1, 'CACHE_MAX_BYTES': 0})
+    routes = [('get', route, {}) for route in bench.ROUTES] + bench.WRITE_ROUTES
+    results = bench.run_suite(app, routes, repeat=repeat)
+    app.db.pool.close_all()
+
+  for result in results:
+    print(f"{result['method']:<5} {result['route'][:48]:<48} {result['status']} p50={result['p50_ms']:.3f}ms "
+          f"p95={result['p95_ms']:.3f}ms p99={result['p99_ms']:.3f}ms queries={result['queries']:g}")
+  report = {
+    'meta': {
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+      'sqlite_version': sqlite3.sqlite_version,
+      'repeat': repeat,
+      'params': params
+    },
+    'results': results
+  }
+  if output:
+    with open(output, 'w') as file:
+      json.dump(report, file, indent=2)
+    print(f"Report written to {output}")
+  if compare:
+    with open(compare, 'r') as file:
+      previous = json.load(file)
+    print(f"Compared with {compare} ({previous['meta']['time']}):")
+    for line in bench.compare_results(previous['results'], results):
+      print(line)
+
+@task
+def bench_pagination(c, words=1000000, repeat=20):
+  """
+  Compare page=N (LIMIT/OFFSET + COUNT) with cursor pagination at increasing depth of /words.
+  """
+  import sqlite3
+  from app import create_app
+  from lib import bench, synthetic
+  from lib.pagination import encode_cursor
+
+  with bench.temp_database(seed=False) as database:
+    print(f"Generating {words} words...")
+    synthetic.generate(database, words=words, sessions=1000, reviews=10000)
+    app = create_app({'DATABASE': database, 'CACHE_MAX_BYTES': 0})
+    client = app.test_client()
+    probe = sqlite3.connect(database)
+    per_page = 50
+    page = 1
+    while (page - 1) * per_page < words:
+      # Build the cursor the previous page would have returned
+      token = ''
+      if page > 1:
+        value, id = probe.execute(
+          'SELECT kanji, id FROM words ORDER BY kanji, id LIMIT 1 OFFSET ?', ((page - 1) * per_page - 1,)
+        ).fetchone()
+        token = encode_cursor('kanji', 'asc', value, id)
+      offset_samples = bench.time_calls(lambda: client.get(f'/words?page={page}'), repeat)
+      cursor_samples = bench.time_calls(lambda: client.get(f'/words?cursor={token}'), repeat)
+      print(bench.format_summary(f'page={page}', bench.summarize(offset_samples)))
+      print(bench.format_summary(f'cursor (page {page})', bench.summarize(cursor_samples)))
+      page *= 10
+    probe.close()
+    app.db.pool.close_all()
+
+@task
+def bench_search(c, words=500000, repeat=20):
+  """
+  Latency of GET /words/search (FTS5) against a LIKE '%q%' scan over the same columns.
+  """
+  import sqlite3
+  from app import create_app
+  from lib import bench, synthetic
+  from routes.words import match_query
+
+  like_sql = '''
+    SELECT id, kanji, romaji, english FROM words
+    WHERE kanji LIKE ?1 OR romaji LIKE ?1 OR english LIKE ?1
+    ORDER BY id LIMIT 50
+  '''
+  like_count_sql = 'SELECT COUNT(*) FROM words WHERE kanji LIKE ?1 OR romaji LIKE ?1 OR english LIKE ?1'
+
+  with bench.temp_database(seed=False) as database:
+    print(f"Generating {words} words...")
+    synthetic.generate(database, words=words, sessions=1000, reviews=10000)
+    app = create_app({'DATABASE': database, 'CACHE_MAX_BYTES': 0})
+    client = app.test_client()
+    probe = sqlite3.connect(database)
+    kanji, romaji, english = probe.execute(
+      'SELECT kanji, romaji, english FROM words WHERE id = ?', (words // 2,)
+    ).fetchone()
+    # From a single keystroke to a full word, plus a term that matches every row
+    queries = [romaji[:1], romaji[:2], romaji[:4], romaji, kanji[:4], english.split()[1], 'to']
+    for q in queries:
+      matches = probe.execute('SELECT COUNT(*) FROM words_fts WHERE words_fts MATCH ?', (match_query(q),)).fetchone()[0]
+      print(f"q={q!r} ({matches} matches)")
+      fts_samples = bench.time_calls(lambda: client.get('/words/search', query_string={'q': q}), repeat)
+      like_samples = bench.time_calls(
+        lambda: (probe.execute(like_sql, (f'%{q}%',)).fetchall(), probe.execute(like_count_sql, (f'%{q}%',)).fetchone()),
+        repeat
+      )
+      print(bench.format_summary('  /words/search', bench.summarize(fts_samples)))
+      print(bench.format_summary("  LIKE '%q%' (SQL only)", bench.summarize(like_samples)))
+    probe.close()
+    app.db.pool.close_all()
+
+@task
+def bench_export(c, words=200000):
+  """
+  Time to first byte and peak RSS of GET /groups/:id/words/raw on a group of `words` words, against a buffered fetchall().
+  """
+  import multiprocessing
+  from lib import bench, export, synthetic
+
+  with bench.temp_database(seed=False) as database:
+    print(f"Generating a group of {words} words...")
+    synthetic.generate(database, words=words, groups=1, sessions=1000, reviews=10000)
+    print(f"Encoder: {'orjson' if export.orjson is not None else 'json'}")
+    # A fresh process per run, so the peak RSS of one run doesn't hide the next
+    context = multiprocessing.get_context('spawn')
+    for label, path in [('buffered fetchall()', None),
+                        ('stream json', '/groups/1/words/raw'),
+                        ('stream ndjson', '/groups/1/words/raw?format=ndjson')]:
+      queue = context.Queue()
+      process = context.Process(target=bench.export_run, args=(database, path, queue))
+      process.start()
+      result = queue.get()
+      process.join()
+      print(f"{label:<20} ttfb={result['ttfb_ms']:8.1f}ms total={result['total_ms']:8.1f}ms "
+            f"size={result['bytes'] / 1048576:.1f}MB peak RSS +{result['peak_rss_growth_mb']:.1f}MB")
+
+@task
+def bench_backup(c, database=None, words=50000, sessions=200000, reviews=20000000, threads=4, seconds=10, pages=256,
+                 pause_ms=5, profile='balanced'):
+  """
+  Read and write latency without a backup, during a stepped online backup and during a single-step copy.
+  """
+  import shutil
+  import threading
+  import time
+  from app import create_app
+  from lib import bench, synthetic
+
+  # Mostly reads, and one thread's worth of review writes
+  routes = [('get', route, {}) for route in bench.ROUTES] + [
+    ('post', '/api/study-sessions/1/review', {'json': {'word_id': 1, 'correct': True}})
+  ]
+  with bench.temp_database(seed=False) as path:
+    if database:
+      # A copy, the reviews written during the run change the data
+      shutil.copyfile(database, path)
+    else:
+      print(f"Generating {words} words, {sessions} sessions, {reviews} review items...")
+      synthetic.generate(path, words=words, sessions=sessions, reviews=reviews)
+    print(f"Database size: {os.path.getsize(path) / 1048576:.0f}MB")
+    app = create_app({
+      'DATABASE': path,
+      'DB_POOL_SIZE': threads,
+      'DB_PROFILE': profile,
+      'CACHE_MAX_BYTES': 0,
+      'SLOW_QUERY_MS': None,
+      'BACKUP_DIR': os.path.join(os.path.dirname(path), 'backups'),
+      'BACKUP_KEEP': 1,
+      'BACKUP_PAUSE_MS': pause_ms
+    })
+
+    def measure(label, during=None):
+      stop = threading.Event()
+      results = []
+      errors = []
+
+      def run_load():
+        try:
+          results.append(bench.run_until(app, routes, stop, threads))
+        except Exception as e:
+          errors.append(e)
+
+      load = threading.Thread(target=run_load)
+      load.start()
+      if during is None:
+        time.sleep(seconds)
+        stats = None
+      else:
+        time.sleep(1)  # Let the load settle first
+        stats = during()
+      stop.set()
+      load.join()
+      if errors:
+        raise errors[0]
+      print(label)
+      print(bench.format_summary('  reads', bench.summarize(results[0].get('get', []))))
+      print(bench.format_summary('  writes', bench.summarize(results[0].get('post', []))))
+      if stats:
+        print(f"  backup: {stats['seconds']:.1f}s, {stats['steps']} steps, {stats['restarts']} restarts, "
+              f"snapshot={stats['snapshot']}, single_step={stats['single_step']}")
+
+    measure('no backup')
+    app.backups.pages = pages
+    measure(f'backup, {pages} pages/step', app.backups.run)
+    app.backups.pages = -1
+    measure('backup, one step', app.backups.run)
+    app.db.pool.close_all()
+
+@task
+def bench_reset(c, database=None, words=50000, sessions=200000, reviews=5000000, threads=4, chunk=5000, pause_ms=10,
+                profile='balanced'):
+  """
+  Read and write latency during a history reset in one transaction, in chunks, and in chunks with the archive.
+  """
+  import shutil
+  import threading
+  import time
+  from app import create_app
+  from lib import bench, synthetic
+
+  # Mostly reads, and new sessions, which the reset keeps
+  routes = [('get', route, {}) for route in bench.ROUTES] + [
+    ('post', '/api/study-sessions', {'json': {'group_id': 1, 'activity_id': 1}})
+  ]
+  with bench.temp_database(seed=False) as source:
+    if database:
+      shutil.copyfile(database, source)
+    else:
+      print(f"Generating {words} words, {sessions} sessions, {reviews} review items...")
+      synthetic.generate(source, words=words, sessions=sessions, reviews=reviews)
+    print(f"Database size: {os.path.getsize(source) / 1048576:.0f}MB")
+    path = os.path.join(os.path.dirname(source), 'reset.db')
+    for label, rows, archive in (('one transaction', -1, False), (f'{chunk} rows/chunk', chunk, False),
+                                 (f'{chunk} rows/chunk, archived', chunk, True)):
+      # Every reset starts from a fresh copy of the history
+      for suffix in ('', '-wal', '-shm', '.archive.db'):
+        if os.path.exists(path + suffix):
+          os.remove(path + suffix)
+      shutil.copyfile(source, path)
+      app = create_app({
+        'DATABASE': path,
+        'DB_POOL_SIZE': threads,
+        'DB_PROFILE': profile,
+        'CACHE_MAX_BYTES': 0,
+        'SLOW_QUERY_MS': None,
+        'RESET_CHUNK': rows,
+        'RESET_PAUSE_MS': pause_ms
+      })
+      stop = threading.Event()
+      failures = {}
+      wal = [0]
+
+      def watch_wal():
+        while not stop.is_set():
+          if os.path.exists(path + '-wal'):
+            wal[0] = max(wal[0], os.path.getsize(path + '-wal'))
+          time.sleep(0.05)
+
+      watcher = threading.Thread(target=watch_wal)
+      watcher.start()
+      def reset():
+        time.sleep(1)  # Let the load settle first
+        try:
+          app.history_reset.run(archive)
+        finally:
+          stop.set()
+
+      resetting = threading.Thread(target=reset)
+      resetting.start()
+      samples = bench.run_until(app, routes, stop, threads, failures)
+      resetting.join()
+      watcher.join()
+      status = app.history_reset.status()
+      print(label)
+      print(bench.format_summary('  reads', bench.summarize(samples.get('get', []))))
+      print(bench.format_summary('  writes', bench.summarize(samples.get('post', []))))
+      print(f"  reset: {status['seconds']:.1f}s, {status['chunks']} chunks, longest {status['max_chunk_ms']:.0f}ms, "
+            f"peak WAL {wal[0] / 1048576:.0f}MB")
+      for message, count in sorted(failures.items(), key=lambda item: -item[1]):
+        print(f"  {count} failed: {message[:100]}")
+      app.db.writer.close()
+      app.db.pool.close_all()
+      app.db.read_pool.close_all()
+
+@task
+def bench_contention(c, database=None, words=50000, sessions=200000, reviews=2000000, threads=8, seconds=10,
+                     profile='safe'):
+  """
+  Mixed read/write load with one shared pool against read-only connections and a single writer.
+  """
+  import shutil
+  import threading
+  import time
+  from app import create_app
+  from lib import bench, synthetic
+
+  # Mostly reads, review and session writes from every thread
+  routes = [('get', route, {}) for route in bench.ROUTES] + [
+    ('post', '/api/study-sessions/1/review', {'json': {'word_id': 1, 'correct': True}}),
+    ('post', '/api/study-sessions/1/reviews', {'json': [{'word_id': n, 'correct': n % 2 == 0} for n in range(1, 51)]}),
+    ('post', '/api/study-sessions', {'json': {'group_id': 1, 'activity_id': 1}})
+  ]
+  with bench.temp_database(seed=False) as path:
+    if database:
+      shutil.copyfile(database, path)
+    else:
+      print(f"Generating {words} words, {sessions} sessions, {reviews} review items...")
+      synthetic.generate(path, words=words, sessions=sessions, reviews=reviews)
+    for label, read_pool_size, writer in (('shared pool', 0, False), ('read-only pool + writer', threads, True)):
+      app = create_app({
+        'DATABASE': path,
+        'DB_POOL_SIZE': threads,
+        'DB_PROFILE': profile,
+        'DB_READ_POOL_SIZE': read_pool_size,
+        'DB_WRITER': writer,
+        'CACHE_MAX_BYTES': 0,
+        'SLOW_QUERY_MS': None
+      })
+      stop = threading.Event()
+      failures = {}
+      timer = threading.Timer(seconds, stop.set)
+      timer.start()
+      samples = bench.run_until(app, routes, stop, threads, failures)
+      print(f"{label} ({profile})")
+      print(bench.format_summary('  reads', bench.summarize(samples.get('get', []), seconds)))
+      print(bench.format_summary('  writes', bench.summarize(samples.get('post', []), seconds)))
+      for message, count in sorted(failures.items(), key=lambda item: -item[1]):
+        print(f"  {count} failed: {message[:100]}")
+      if app.db.writer is not None:
+        print(f"  writer: {app.db.writer.stats()}")
+        app.db.writer.close()
+      app.db.pool.close_all()
+      if app.db.read_pool is not None:
+        app.db.read_pool.close_all()
+
+@task
+def bench_shards(c, learners=64, threads=8, seconds=5, max_open=64, profile='balanced'):
+  """
+  Review write throughput from many learners: one shared file against a shard per learner.
+  """
+  from lib import bench
+  from lib.db import Db
+
+  with bench.temp_database() as path:
+    db = Db(database=path, pool_size=1, profile=profile)
+    ids = [f'bench{n}' for n in range(learners)]
+    runs = (
+      # Same schema and attached catalog, only the lock is shared
+      ('one shared file', threads, lambda shards: lambda learner: shards.connection('shared')),
+      (f'{learners} shards, {max_open} open', 2, lambda shards: shards.connection)
+    )
+    for label, pool_size, route in runs:
+      shards = bench.shard_router(db, os.path.join(os.path.dirname(path), label.split()[0]), max_open=max_open, pool_size=pool_size)
+      bench.shard_writes(route(shards), ids, 0.5, threads)  # Creates the shard files
+      samples = bench.shard_writes(route(shards), ids, seconds, threads)
+      print(bench.format_summary(label, bench.summarize(samples, seconds)))
+      print(f"{'':<24} shards: {shards.stats()}")
+      shards.close_all()
+
+@task
+def bench_metrics(c, requests=2000, rounds=5, path='/groups/1'):
+  """
+  Per-request cost of lib.metrics: the same route with METRICS off, on, and on with METRICS_SQL.
+  """
+  from app import create_app
+  from lib import bench
+
+  with bench.temp_database() as database:
+    route, parts = bench.metrics_overhead(
+      lambda config: create_app(dict(config, DATABASE=database)), path, requests, rounds
+    )
+  for label, seconds in route.items():
+    print(f"GET {path:<20} METRICS {label:<9} {seconds * 1e6:8.1f}us/request "
+          f"({(seconds - route['off']) * 1e6:+.1f}us)")
+  print(f"hooks alone:        {parts['hooks'] * 1e6:.2f}us/request, {parts['hooks + sql'] * 1e6:.2f}us with METRICS_SQL")
+  print(f"one statement:      {parts['statement'] * 1e6:.2f}us plain, {parts['timed statement'] * 1e6:.2f}us timed")
+
+@task
+def bench_migrations(c, count=100, repeat=200):
+  """
+  Startup migration check with `count` migrations applied, against replaying every script.
+  """
+  import sqlite3
+  import tempfile
+  import shutil
+  import time
+  from lib import bench, migrations
+
+  directory = tempfile.mkdtemp(prefix='lang-portal-bench-')
+  try:
+    files = {
+      f'{n:04d}_bench_{n}.sql': f'''
+        CREATE TABLE IF NOT EXISTS bench_{n} (id INTEGER PRIMARY KEY, value TEXT);
+        CREATE INDEX IF NOT EXISTS idx_bench_{n}_value ON bench_{n}(value);
+        CREATE TRIGGER IF NOT EXISTS bench_{n}_insert AFTER INSERT ON bench_{n}
+        BEGIN
+          UPDATE bench_{n} SET value = lower(NEW.value) WHERE id = NEW.id;
+        END;
+      '''
+      for n in range(1, count + 1)
+    }
+    connection = sqlite3.connect(os.path.join(directory, 'words.db'))
+    connection.execute('PRAGMA journal_mode = WAL')
+
+    started = time.perf_counter()
+    loaded = migrations.load(files)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    migrations.apply(connection, loaded)
+    print(f"Loaded and hashed {count} migrations in {load_seconds * 1000:.2f}ms, "
+          f"applied them in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    check = bench.time_calls(lambda: migrations.is_current(connection, loaded), repeat)
+    noop = bench.time_calls(lambda: migrations.apply(connection, loaded), repeat)
+    replay = bench.time_calls(lambda: [connection.executescript(sql) for sql in files.values()], max(repeat // 20, 1))
+    print(bench.format_summary('startup check', bench.summarize(check)))
+    print(bench.format_summary('no-op apply()', bench.summarize(noop)))
+    print(bench.format_summary('replay all scripts', bench.summarize(replay)))
+    connection.close()
+  finally:
+    shutil.rmtree(directory, ignore_errors=True)
+
+@task
+def rebuild_words_fts(c):
+  """
+  Reindex the words_fts full-text index from the words table.
+  """
+  from flask import Flask
+  app = Flask(__name__)
+  db.rebuild(app, 'words_fts')
+  print("words_fts rebuilt successfully.")
+
+@task
+def bench_reviews(c, reviews=2000, batch=50, profile='balanced', threads=8):
+  """
+  Reviews per second through POST .../review (one per request), POST .../reviews (batches)
+  and concurrent POST .../review with and without the write-behind buffer.
+  """
+  import time
+  from app import create_app
+  from lib import bench
+
+  with bench.temp_database() as database:
+    app = create_app({'DATABASE': database, 'DB_PROFILE': profile})
+    client = app.test_client()
+    session_id = client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1}).get_json()['id']
+
+    started = time.perf_counter()
+    for i in range(reviews):
+      client.post(f'/api/study-sessions/{session_id}/review', json={'word_id': i % 100 + 1, 'correct': i % 3 != 0})
+    elapsed = time.perf_counter() - started
+    print(f"{'single':<24} {reviews} reviews in {elapsed:.2f}s, {reviews / elapsed:.0f} reviews/s")
+
+    started = time.perf_counter()
+    for start in range(0, reviews, batch):
+      items = [{'word_id': i % 100 + 1, 'correct': i % 3 != 0} for i in range(start, min(start + batch, reviews))]
+      client.post(f'/api/study-sessions/{session_id}/reviews', json=items)
+    elapsed = time.perf_counter() - started
+    print(f"{f'bulk ({batch} per request)':<24} {reviews} reviews in {elapsed:.2f}s, {reviews / elapsed:.0f} reviews/s")
+    app.db.pool.close_all()
+
+    # Concurrent single review POSTs, committed one by one and through the write-behind buffer
+    for label, config, ack in (
+      ('single, no buffer', {}, 'durable'),
+      ('buffer, durable ack', {'REVIEW_BUFFER': True}, 'durable'),
+      ('buffer, buffered ack', {'REVIEW_BUFFER': True}, 'buffered')
+    ):
+      app = create_app(dict(config, DATABASE=database, DB_PROFILE=profile, DB_POOL_SIZE=threads + 1))
+      path = f'/api/study-sessions/{session_id}/review?ack={ack}'
+      samples, elapsed = bench.run_requests(app, path, reviews, threads, method='post', json={'word_id': 1, 'correct': True})
+      print(bench.format_summary(f'{label} ({threads}t)', bench.summarize(samples, elapsed)))
+      if app.review_buffer is not None:
+        app.review_buffer.close()
+        print(f"{'':<24} buffer: {app.review_buffer.stats()}")
+      app.db.pool.close_all()
+
+@task
+def rebuild_word_reviews(c):
+  """
+  Recompute the word_reviews counter cache from word_review_items (for backfills).
+  """
+  from flask import Flask
+  app = Flask(__name__)
+  db.rebuild(app, 'word_reviews')
+  print("word_reviews rebuilt successfully.")
+
+@task
+def check_rollups(c):
+  """
+  Compare the dashboard rollups and word_reviews with a full recompute.
+  """
+  from flask import Flask
+  from lib import rollups
+  app = Flask(__name__)
+  with app.app_context():
+    mismatches = rollups.check(db.cursor())
+    db.close()
+  if not mismatches:
+    print("Rollups are consistent.")
+    return
+  for name, rows in mismatches.items():
+    print(f"{name}: expected but missing {rows['missing']}")
+    print(f"{name}: present but unexpected {rows['unexpected']}")
+  raise SystemExit(1)
+
+@task
+def rebuild_rollups(c):
+  """
+  Recompute word_reviews, the dashboard rollups, study_session_summary and the counters from the source tables.
+  """
+  from flask import Flask
+  app = Flask(__name__)
+  db.rebuild(app, 'word_reviews')
+  db.rebuild(app, 'rollups')
+  db.rebuild(app, 'study_session_summary')
+  db.rebuild(app, 'counters')
+  print("Rollups rebuilt successfully.")
+
+@task
+def rebuild_streak(c, timezone=None):
+  """
+  Recompute the persisted study streak from every study session.
+  """
+  from flask import Flask
+  from lib import streak
+  app = Flask(__name__)
+  with app.app_context():
+    last, current, longest = streak.rebuild(db.cursor(), streak.get_timezone(timezone))
+    db.commit()
+    db.close()
+  print(f"Streak rebuilt: last study date {last}, current {current}, longest {longest}.")
+
+@task
+def rebuild_srs(c):
+  """
+  Recompute the spaced repetition state of every word from the review log.
+  """
+  from flask import Flask
+  from lib import srs
+  app = Flask(__name__)
+  with app.app_context():
+    words = srs.rebuild(db.cursor())
+    db.commit()
+    db.close()
+  print(f"Spaced repetition state rebuilt for {words} words.")
+
+@task
+def import_words(c, group, path, batch_size=1000):
+  """
+  Stream a JSON array of words into a group, e.g. invoke import-words --group "Core Verbs" --path seed/data_verbs.json
+  """
+  from flask import Flask
+
+  def progress(stats):
+    rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"\r{stats['read']} read, {stats['inserted']} inserted, {stats['duplicates']} duplicates, {rate:.0f} rows/s", end='', flush=True)
+
+  app = Flask(__name__)
+  with app.app_context():
+    stats = db.import_word_json(
+      cursor=db.cursor(),
+      group_name=group,
+      data_json_path=path,
+      batch_size=batch_size,
+      progress=progress
+    )
+    db.close()
+  rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+  print(f"{stats['read']} words in {stats['seconds']:.2f}s ({rate:.0f} rows/s), {stats['linked']} linked to the group.")
+
+@task
+def slow_queries(c, path='words.db.slow-queries.jsonl', top=10):
+  """
+  Summarize the slow query log: the statements with the most total slow time, with their latest plan.
+  """
+  from lib.slow_queries import summarize
+
+  if not os.path.exists(path):
+    print(f"No slow queries logged ({path} doesn't exist)")
+    return
+  for summary in summarize(path)[:top]:
+    print(f"{summary['total_ms']:10.1f}ms total  n={summary['count']:<6} max={summary['max_ms']:.1f}ms  "
+          f"last={summary['last_seen']}  {summary['fingerprint']}")
+    print(f"    {summary['sql'][:160]}")
+    for line in summary['plan'] or []:
+      marker = '!' if line in summary['warnings'] else ' '
+      print(f"      {marker} {line}")
+
+@task
+def backup(c, database='words.db', directory='backups', keep=7, compress=False, pages=256, pause_ms=5):
+  """
+  Back up the database while the app keeps serving, see lib/backup.py.
+  """
+  from lib.backup import Backups
+
+  backups = Backups(database, directory, keep=keep, compress=compress, pages=pages, pause=pause_ms / 1000.0)
+  stats = backups.run()
+  print(f"Backed up {database} to {stats['path']} ({stats['bytes'] / 1048576:.1f}MB) in {stats['seconds']:.1f}s, "
+        f"{stats['steps']} steps, {stats['restarts']} restarts")
+  for name in stats['removed']:
+    print(f"Removed {name}")
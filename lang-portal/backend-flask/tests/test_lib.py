@@ -0,0 +1,724 @@
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from lib import importer
+from lib.pagination import InvalidCursor, decode_cursor, encode_cursor, next_cursor, seek_clause
+from lib.review_buffer import ReviewBuffer
+
+# Tests for the lib modules behind the routes. Route tests live next to the
+# routes, see StudySessionTestCase in routes/study_sessions.py.
+
+class PaginationTestCase(unittest.TestCase):
+    def test_cursor_round_trip_and_invalid_tokens(self):
+        token = encode_cursor('english', 'desc', 'to eat', 42)
+        self.assertEqual(decode_cursor(token, 'english', 'desc'), ('to eat', 42))
+        self.assertEqual(decode_cursor(encode_cursor('correct_count', 'asc', None, 7), 'correct_count', 'asc'), (None, 7))
+        # Issued for another sort, or not a cursor at all
+        for bad, sort_by, order in ((token, 'kanji', 'desc'), (token, 'english', 'asc'),
+                                    ('not-a-cursor', 'english', 'desc'), ('', 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', 'x', 1)[:-3], 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', ['x'], 1), 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', {'x': 1}, 1), 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', 'x', '1'), 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', 'x', True), 'english', 'desc'),
+                                    (encode_cursor('english', 'desc', 'x', 1.5), 'english', 'desc')):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(bad, sort_by, order)
+
+    def test_seek_walks_ties_without_gaps_or_repeats(self):
+        connection = sqlite3.connect(':memory:')
+        connection.row_factory = sqlite3.Row
+        connection.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)')
+        # Seven rows per value, so every page boundary falls inside a run of ties
+        connection.executemany('INSERT INTO t (id, value) VALUES (?, ?)', [(n, 'abc'[n % 3]) for n in range(1, 22)])
+        for order in ('asc', 'desc'):
+            expected = [row[0] for row in connection.execute(f'SELECT id FROM t ORDER BY value {order}, id {order}')]
+            seen = []
+            token = None
+            while True:
+                where, params = '', []
+                if token:
+                    where = 'WHERE ' + seek_clause('value', 'id', order)
+                    params = list(decode_cursor(token, 'value', order))
+                rows = connection.execute(
+                    f'SELECT id, value FROM t {where} ORDER BY value {order}, id {order} LIMIT ?', params + [5]
+                ).fetchall()
+                seen += [row['id'] for row in rows[:4]]
+                token = next_cursor(rows, 4, 'value', order, 'value')
+                if token is None:
+                    break
+            self.assertEqual(seen, expected)
+
+class ImporterTestCase(unittest.TestCase):
+    def test_json_array_is_decoded_across_chunk_boundaries(self):
+        items = [{'kanji': '食べる', 'english': 'to eat, "eat"', 'parts': [{'romaji': ['ta', 'be', 'ru']}]},
+                 'a ] , [ string', 12345678901234567890, [], {}, None, True, -1.5e3]
+        text = ' \n[ ' + ',\n  '.join(json.dumps(item, ensure_ascii=False) for item in items) + ' ]\n'
+        # Every chunk size splits some value, string, escape or separator somewhere
+        for chunk_size in (1, 2, 3, 7, 64, 65536):
+            self.assertEqual(list(importer.iter_json_array(io.StringIO(text), chunk_size)), items)
+        self.assertEqual(list(importer.iter_json_array(io.StringIO('[]'), 1)), [])
+        for bad in ('{"kanji": "x"}', '[{"kanji": "x"}, {"kan', '[1, 2', ''):
+            with self.assertRaises(ValueError):
+                list(importer.iter_json_array(io.StringIO(bad), 3))
+
+class AppTestCase(unittest.TestCase):
+    # Extra app config for the tests of a subclass
+    config = {}
+
+    def setUp(self):
+        # A test app backed by a fresh database with the full schema
+        from app import create_app
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(dict({
+            'TESTING': True,
+            'DEBUG': False,
+            'DATABASE': os.path.join(self.directory, 'test.db')
+        }, **self.config))
+        with self.app.app_context():
+            cursor = self.app.db.cursor()
+            self.app.db.setup_tables(cursor)
+            self.app.db.migrate(cursor)
+
+        # Separate connection for inspecting what the app wrote
+        self.db = sqlite3.connect(self.app.config['DATABASE'])
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app.history_reset.wait()
+        if self.app.review_buffer is not None:
+            self.app.review_buffer.close()
+        if self.app.db.writer is not None:
+            self.app.db.writer.close()
+        self.db.close()
+        self.app.db.pool.close_all()
+        if self.app.db.read_pool is not None:
+            self.app.db.read_pool.close_all()
+        if self.app.db.stream_pool is not None:
+            self.app.db.stream_pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class LibTestCase(AppTestCase):
+    def test_review_buffer_recovers_spool_after_crash(self):
+        spool = os.path.join(self.directory, 'reviews.spool')
+        crashed = ReviewBuffer(self.app.db, spool, max_items=1000, max_delay=3600)
+        for word_id in (1, 2, 3):
+            crashed.submit(1, word_id, True, datetime(2030, 1, 1, 10, 0, word_id))
+        # The process dies before a flush: the queue is lost, the spool is not
+        crashed.close(flush=False)
+        with open(spool, 'a') as file:
+            file.write('[4, 1, 4')  # torn write, never acknowledged
+
+        # Pretend the first review was committed just before the crash
+        self.db.execute('UPDATE review_buffer_state SET last_flushed_seq = 1')
+        self.db.commit()
+
+        recovered = self.app.review_buffer = ReviewBuffer(self.app.db, spool)
+        self.assertEqual(recovered.stats()['recovered'], 2)
+        rows = self.db.execute('SELECT word_id FROM word_review_items ORDER BY id').fetchall()
+        self.assertEqual(rows, [(2,), (3,)])
+        self.assertEqual(os.path.getsize(spool), 0)
+
+        # New reviews continue the sequence
+        self.assertEqual(recovered.submit(1, 5, True, datetime.now()).wait(5), 3)
+
+    def test_review_buffer_dead_letters_reviews_that_always_fail(self):
+        from lib import review_buffer
+        self.db.execute('''
+            CREATE TRIGGER reject_word_2 BEFORE INSERT ON word_review_items WHEN NEW.word_id = 2
+            BEGIN SELECT RAISE(ABORT, 'word 2 rejected'); END
+        ''')
+        self.db.commit()
+        spool = os.path.join(self.directory, 'reviews.spool')
+        buffer = self.app.review_buffer = ReviewBuffer(self.app.db, spool, max_items=3, max_delay=3600)
+        pending = [buffer.submit(1, word_id, True, datetime(2030, 1, 1, 10, 0, word_id)) for word_id in (1, 2, 3)]
+
+        # The batch fails, the reviews around the bad one still go in
+        self.assertEqual(pending[0].wait(5), 1)
+        with self.assertRaises(sqlite3.IntegrityError):
+            pending[1].wait(5)
+        self.assertEqual(pending[2].wait(5), 2)
+        self.assertEqual(self.db.execute('SELECT word_id FROM word_review_items ORDER BY id').fetchall(), [(1,), (3,)])
+        stats = buffer.stats()
+        self.assertEqual((stats['dead_lettered'], stats['errors']), (1, 0))
+        with open(spool + '.failed') as failed:
+            self.assertEqual(json.loads(failed.read())[2:4] + [stats['depth']], [2, 1, 0])
+        self.assertEqual(self.db.execute('SELECT last_flushed_seq FROM review_buffer_state').fetchone()[0], 3)
+        self.assertEqual(os.path.getsize(spool), 0)
+
+        # A queue that never empties still has its committed reviews trimmed from the spool
+        buffer.close()
+        writes = threading.Semaphore(0)
+        write = self.app.db.write
+        self.app.db.write = lambda fn: writes.acquire(timeout=5) and write(fn)
+        review_buffer.SPOOL_TRIM_BYTES = 0
+        try:
+            buffer = self.app.review_buffer = ReviewBuffer(self.app.db, spool, max_items=1, max_delay=3600)
+            pending = [buffer.submit(1, word_id, True, datetime(2030, 1, 1, 10, 0, word_id)) for word_id in (4, 5, 6)]
+            writes.release()
+            pending[0].wait(5)
+            deadline = time.monotonic() + 5
+            while os.path.getsize(spool) and len(open(spool).readlines()) > 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with open(spool) as file:
+                self.assertEqual([json.loads(line)[2] for line in file], [5, 6])
+        finally:
+            review_buffer.SPOOL_TRIM_BYTES = 1 << 20
+            writes.release(2)
+
+    def test_words_due_follow_reviews(self):
+        self.db.execute("INSERT INTO groups (name) VALUES ('Core Verbs')")
+        self.db.executemany("INSERT INTO words (kanji, romaji, english, parts) VALUES (?, ?, '', '[]')",
+                            [('一', 'ichi'), ('二', 'ni'), ('三', 'san')])
+        self.db.execute('INSERT INTO word_groups (word_id, group_id) SELECT id, 1 FROM words')
+        self.db.execute("INSERT INTO study_sessions (group_id, study_activity_id) VALUES (1, 1)")
+        self.db.commit()
+
+        # Word 1 was answered right yesterday (due today), word 2 wrong just now (due in 10 minutes)
+        self.client.post('/api/study-sessions/1/reviews', json=[
+            {'word_id': 1, 'correct': True, 'created_at': (datetime.now() - timedelta(days=1, minutes=1)).isoformat()},
+            {'word_id': 2, 'correct': False}
+        ])
+        state = self.db.execute('SELECT word_id, repetitions, interval_days, ease FROM word_srs ORDER BY word_id').fetchall()
+        self.assertEqual(state, [(1, 1, 1, 2.5), (2, 0, 0, 2.3)])
+
+        data = self.client.get('/groups/1/words/due?limit=2').get_json()
+        self.assertEqual([(word['id'], word['new']) for word in data['words']], [(1, False), (3, True)])
+
+    def test_group_words_raw_streams_every_word(self):
+        self.db.execute("INSERT INTO groups (name) VALUES ('Core Verbs')")
+        self.db.executemany("INSERT INTO words (kanji, romaji, english, parts) VALUES (?, ?, ?, ?)", [
+            ('一', 'ichi', 'one', '[{"kanji": "一", "romaji": ["i", "chi"]}]'),
+            ('二', 'ni', 'two', '[]')
+        ])
+        self.db.execute('INSERT INTO word_groups (word_id, group_id) SELECT id, 1 FROM words')
+        self.db.commit()
+
+        response = self.client.get('/groups/1/words/raw')
+        self.assertEqual(response.mimetype, 'application/json')
+        words = json.loads(response.get_data())
+        self.assertEqual(words[0], {'id': 1, 'kanji': '一', 'romaji': 'ichi', 'english': 'one',
+                                    'parts': [{'kanji': '一', 'romaji': ['i', 'chi']}]})
+        response.close()
+
+        response = self.client.get('/groups/1/words/raw?format=ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in response.get_data().splitlines()], [1, 2])
+        response.close()
+        # The stream's connection is back in the stream pool once the response is closed
+        self.assertEqual(self.app.db.pool_stats()['stream']['in_use'], 0)
+        self.assertEqual(self.client.get('/groups/2/words/raw').status_code, 404)
+
+        # Open exports use up the stream pool only, the other reads still get a connection
+        self.app.db.stream_pool.timeout = 0.1
+        streams = [self.client.get('/groups/1/words/raw') for _ in range(self.app.db.stream_pool.size)]
+        self.assertEqual(self.client.get('/groups/1/words/raw').status_code, 503)
+        self.assertEqual(self.client.get('/groups/1/words').status_code, 200)
+        for response in streams:
+            response.close()
+        self.assertEqual(self.app.db.pool_stats()['stream']['in_use'], 0)
+
+    def test_admin_backup_writes_a_compressed_copy(self):
+        import gzip
+        self.db.execute("INSERT INTO groups (name) VALUES ('Core Verbs')")
+        self.db.commit()
+        self.app.backups.directory = os.path.join(self.directory, 'backups')
+        self.app.backups.compress = True
+
+        self.assertEqual(self.client.post('/admin/backup').status_code, 202)
+        self.app.backups.wait()
+        status = self.client.get('/admin/backup').get_json()
+        self.assertEqual(status['state'], 'done')
+        self.assertTrue(status['path'].endswith('.db.gz'))
+
+        copy = os.path.join(self.directory, 'restored.db')
+        with gzip.open(status['path'], 'rb') as source, open(copy, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        restored = sqlite3.connect(copy)
+        self.assertEqual(restored.execute('SELECT name FROM groups').fetchall(), [('Core Verbs',)])
+        restored.close()
+
+    def test_migrations_apply_once_and_refuse_edits(self):
+        from lib import migrations
+        # setUp already applied everything, a second run is a no-op
+        loaded = self.app.db.schema_migrations()
+        self.assertTrue(migrations.is_current(self.db, loaded))
+        self.assertEqual(migrations.apply(self.db, loaded), [])
+
+        edited = migrations.load({loaded[0].name: loaded[0].sql + '\n-- edited\n'})
+        with self.assertRaises(migrations.MigrationError):
+            migrations.apply(self.db, edited)
+
+        # A failing migration leaves neither its changes nor its row behind
+        broken = migrations.load({'9999_broken.sql': 'CREATE TABLE broken (id INTEGER);\nINSERT INTO missing VALUES (1);'})
+        with self.assertRaises(migrations.MigrationError):
+            migrations.apply(self.db, broken)
+        self.assertIsNone(self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'broken'").fetchone())
+        self.assertIsNone(self.db.execute('SELECT 1 FROM schema_migrations WHERE version = 9999').fetchone())
+
+    def test_cors_origins_follow_study_activities(self):
+        # app.origins decides for every route, and for the preflight of a write
+        def allowed(origin):
+            response = self.client.get('/words', headers={'Origin': origin})
+            preflight = self.client.options('/api/study-sessions', headers={
+                'Origin': origin,
+                'Access-Control-Request-Method': 'POST',
+                'Access-Control-Request-Headers': 'Content-Type'
+            })
+            allows = [response.headers.get('Access-Control-Allow-Origin') == origin,
+                      preflight.headers.get('Access-Control-Allow-Origin') == origin]
+            self.assertEqual(allows[0], allows[1])
+            if allows[1]:
+                self.assertIn('POST', preflight.headers['Access-Control-Allow-Methods'])
+            return allows[0]
+
+        self.assertTrue(allowed('http://anywhere.test'))  # No activities allows every origin
+        self.db.execute("INSERT INTO study_activities (name, url) VALUES ('Typing', 'http://localhost:8081/typing')")
+        self.db.commit()
+        self.assertTrue(allowed('http://localhost:8081'))
+        self.assertFalse(allowed('http://anywhere.test'))
+        reloads = self.app.origins.stats()['reloads']
+        self.assertTrue(allowed('http://LOCALHOST:8081'))
+        self.assertEqual(self.app.origins.stats()['reloads'], reloads)
+
+        # Written outside the app, the migration 0011 triggers bump the version
+        self.db.execute("UPDATE study_activities SET url = 'https://typing.example.com/'")
+        self.db.commit()
+        self.assertFalse(allowed('http://localhost:8081'))
+        self.assertTrue(allowed('https://typing.example.com'))
+
+    def test_session_and_review_writes_bump_their_versions(self):
+        query = "SELECT name, version FROM table_versions WHERE name IN ('study_sessions', 'word_review_items')"
+        self.db.execute("INSERT INTO groups (name) VALUES ('Core Verbs')")
+        self.db.execute("INSERT INTO study_activities (name, url) VALUES ('Typing', 'http://localhost:8081')")
+        self.db.commit()
+        before = dict(self.db.execute(query).fetchall())
+        self.assertIsNone(self.client.get('/dashboard/recent-session').get_json())
+
+        # Written outside the app, the migration 0015 triggers bump the versions
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '一', 'ichi', 'one', '[]')")
+        self.db.execute("INSERT INTO study_sessions (group_id, study_activity_id) VALUES (1, 1)")
+        self.db.executemany("INSERT INTO word_review_items (word_id, study_session_id, correct) VALUES (1, 1, ?)", [(1,), (0,)])
+        self.db.execute("UPDATE word_review_items SET correct = 1 WHERE id = 2")
+        self.db.execute("DELETE FROM word_review_items WHERE id = 1")
+        self.db.commit()
+        after = dict(self.db.execute(query).fetchall())
+        self.assertEqual(after['study_sessions'], before['study_sessions'] + 1)
+        self.assertEqual(after['word_review_items'], before['word_review_items'] + 4)
+        self.assertEqual(self.client.get('/dashboard/recent-session').get_json()['correct_count'], 1)
+
+    def test_admin_routes_answer_local_requests_or_the_token(self):
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        self.assertEqual(self.client.get('/admin/writer').status_code, 200)
+        self.assertEqual(self.client.get('/admin/writer', environ_base=remote).status_code, 403)
+        self.assertEqual(self.client.post('/admin/backup', environ_base=remote).status_code, 403)
+        self.assertEqual(self.app.backups.status()['state'], 'idle')
+
+        # With a token, it is required from everywhere
+        self.app.config['ADMIN_TOKEN'] = 'secret'
+        self.assertEqual(self.client.get('/admin/writer').status_code, 403)
+        self.assertEqual(self.client.get('/admin/writer', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        headers = {'Authorization': 'Bearer secret'}
+        self.assertEqual(self.client.get('/admin/writer', headers=headers, environ_base=remote).status_code, 200)
+        # Metrics stay open for the scraper
+        self.assertEqual(self.client.get('/metrics', environ_base=remote).status_code, 200)
+
+    def test_learner_shards_join_the_catalog(self):
+        from lib import bench
+        self.db.execute("INSERT INTO words (kanji, romaji, english, parts) VALUES ('食べる', 'taberu', 'to eat', '[]')")
+        self.db.commit()
+        shards = bench.shard_router(self.app.db, os.path.join(self.directory, 'shards'), max_open=1)
+        self.addCleanup(shards.close_all)
+        with shards.connection('alice') as connection:
+            connection.execute("INSERT INTO word_review_items (word_id, study_session_id, correct) VALUES (1, 1, 1)")
+            connection.commit()
+            # Unqualified names fall through to the attached catalog
+            rows = connection.execute("""
+                SELECT w.kanji, r.correct_count FROM word_reviews r JOIN words w ON w.id = r.word_id
+            """).fetchall()
+            self.assertEqual([tuple(row) for row in rows], [('食べる', 1)])
+            with self.assertRaises(sqlite3.OperationalError):
+                connection.execute("DELETE FROM words")
+
+        # Opening a second learner closes the first, its data stays in its file
+        with shards.connection('bob') as connection:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM word_review_items').fetchone()[0], 0)
+        with shards.connection('alice') as connection:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM word_review_items').fetchone()[0], 1)
+        self.assertEqual(shards.stats()['evictions'], 2)
+        with self.assertRaises(ValueError):
+            shards.path('../alice')
+
+    def test_reads_are_read_only_and_writes_go_through_the_writer(self):
+        with self.app.test_request_context('/words', method='GET'):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.app.db.cursor().execute('DELETE FROM words')
+            self.app.db.close()
+
+        response = self.client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.app.db.writer.stats()['committed'], 1)
+        # A failed transaction is rolled back and its error reaches the caller
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.app.db.write(lambda cursor: cursor.execute('INSERT INTO words (kanji) VALUES (NULL)'))
+        self.assertEqual(self.app.db.writer.stats()['failed'], 1)
+
+        # Once the writer has stopped, a write fails instead of waiting forever
+        from lib.writer import WriterStopped
+        self.app.db.writer.close()
+        with self.assertRaises(WriterStopped):
+            self.app.db.write(lambda cursor: cursor.execute('DELETE FROM words'))
+
+    def test_writer_withdraws_transactions_queued_past_the_wait_timeout(self):
+        from lib.writer import Writer, WriterTimeout
+        writer = Writer(self.app.db.pool, wait_timeout=0.05, poll=0.01)
+        self.addCleanup(writer.close)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(cursor):
+            started.set()
+            release.wait(5)
+            return 'committed'
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(writer.run(slow)))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        ran = []
+        with self.assertRaises(WriterTimeout):
+            writer.run(lambda cursor: ran.append(True))
+        release.set()
+        thread.join(5)
+        # The running transaction outlived the timeout and was waited for, the queued one never ran
+        self.assertEqual(results, ['committed'])
+        self.assertEqual(ran, [])
+        self.assertEqual(writer.stats()['timeouts'], 1)
+
+    def test_statement_cache_holds_every_registered_variant(self):
+        # Every page of the same sort runs the same statement text
+        sql = self.app.db.statements.get('words.list', sort_by='english', order='desc', seek=False)
+        self.assertIs(self.app.db.statements.get('words.list', sort_by='english', order='desc', seek=False), sql)
+        stats = json.loads(self.client.get('/admin/statements').get_data(as_text=True))
+        self.assertGreaterEqual(stats['cache_size'], stats['statements'])
+        self.assertEqual(self.app.db.pool.cached_statements, stats['cache_size'])
+
+    def test_metrics_count_requests_without_timing_sql(self):
+        for _ in range(3):
+            self.client.get('/groups/1')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('lang_portal_requests_total{method="GET",route="/groups/<int:id>",status="404"} 3', text)
+        self.assertIn('lang_portal_request_duration_seconds_count{method="GET",route="/groups/<int:id>"} 3', text)
+        # SQL timing is opt-in, cursors stay plain sqlite3 cursors without it
+        self.assertNotIn('lang_portal_sql', text)
+        self.app.db.slow_queries = None
+        with self.app.test_request_context('/groups/1'):
+            self.assertIs(type(self.app.db.cursor()), sqlite3.Cursor)
+            self.app.db.close()
+
+    def test_slow_query_log_is_rate_limited(self):
+        from lib.slow_queries import SlowQueryLog, summarize
+        path = os.path.join(self.directory, 'slow.jsonl')
+        self.app.db.slow_queries = SlowQueryLog(path, threshold=0, interval=60)
+        self.client.get('/groups/7')
+        self.client.get('/groups/8')
+        with open(path) as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['sql'], 'SELECT id, name, words_count FROM groups WHERE id = ?')
+        self.assertEqual(entries[0]['parameters'], ['int'])
+        self.assertIn('USING INTEGER PRIMARY KEY', entries[0]['plan'][0])
+        self.assertEqual(self.app.db.slow_queries.stats()['suppressed'], 1)
+        # The suppressed run is written out by flush() and counted by the summary
+        self.app.db.slow_queries.flush()
+        self.assertEqual(summarize(path)[0]['count'], 2)
+
+    def test_search_words_follows_word_changes(self):
+        # words_fts is maintained by triggers on words, the table versions too,
+        # so the same search is never answered from a stale cached response
+        self.db.execute("""
+            INSERT INTO words (kanji, romaji, english, parts) VALUES ('食べる', 'taberu', 'to eat', '[]')
+        """)
+        self.db.commit()
+        data = json.loads(self.client.get('/words/search?q=tabe').get_data(as_text=True))
+        self.assertEqual([word['kanji'] for word in data['words']], ['食べる'])
+
+        self.db.execute("UPDATE words SET romaji = 'nomu', english = 'to drink' WHERE kanji = '食べる'")
+        self.db.commit()
+        data = json.loads(self.client.get('/words/search?q=tabe').get_data(as_text=True))
+        self.assertEqual(data['words'], [])
+
+        self.db.execute("INSERT INTO words (kanji, romaji, english, parts) VALUES ('食べ物', 'tabemono', 'food', '[]')")
+        self.db.commit()
+        data = json.loads(self.client.get('/words/search?q=tabe').get_data(as_text=True))
+        self.assertEqual([word['kanji'] for word in data['words']], ['食べ物'])
+
+        self.db.execute("DELETE FROM words WHERE kanji = '食べ物'")
+        self.db.commit()
+        data = json.loads(self.client.get('/words/search?q=tabe').get_data(as_text=True))
+        self.assertEqual(data['words'], [])
+        self.assertEqual(self.client.get('/words/search').status_code, 400)
+
+    def test_group_responses_follow_raw_writes(self):
+        self.db.execute("INSERT INTO groups (id, name) VALUES (1, 'Verbs')")
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '一', 'ichi', 'one', '[]')")
+        self.db.commit()
+        self.assertEqual([group['group_name'] for group in self.client.get('/groups').get_json()['groups']], ['Verbs'])
+        self.assertEqual(self.client.get('/groups/1/words').get_json()['words'], [])
+
+        self.db.execute("UPDATE groups SET name = 'Core Verbs' WHERE id = 1")
+        self.db.execute('INSERT INTO word_groups (word_id, group_id) VALUES (1, 1)')
+        self.db.commit()
+        self.assertEqual([group['group_name'] for group in self.client.get('/groups').get_json()['groups']], ['Core Verbs'])
+        self.assertEqual([word['id'] for word in self.client.get('/groups/1/words').get_json()['words']], [1])
+
+    def test_counters_follow_inserts_and_deletes(self):
+        from lib import rollups
+        self.db.executemany("INSERT INTO words (kanji, romaji, english, parts) VALUES (?, '', '', '[]')",
+                            [(str(n),) for n in range(3)])
+        self.db.execute("INSERT INTO groups (id, name) VALUES (1, 'Verbs')")
+        self.db.execute("INSERT INTO word_groups (word_id, group_id) SELECT id, 1 FROM words")
+        self.db.execute("DELETE FROM word_groups WHERE word_id = (SELECT id FROM words WHERE kanji = '2')")
+        self.db.execute("DELETE FROM words WHERE kanji = '2'")
+        self.db.execute("INSERT INTO study_activities (id, name, url) VALUES (1, 'Typing', 'http://localhost:8081')")
+        self.db.execute("INSERT INTO study_sessions (id, group_id, study_activity_id) VALUES (1, 1, 1)")
+        # Two reviews of the same word count once towards the session's words
+        self.db.execute("INSERT INTO word_review_items (study_session_id, word_id, correct) SELECT 1, id, 1 FROM words")
+        self.db.execute("INSERT INTO word_review_items (study_session_id, word_id, correct) SELECT 1, id, 0 FROM words")
+        self.db.commit()
+
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+        self.assertEqual(self.db.execute('SELECT words_count FROM groups WHERE id = 1').fetchone()[0], 2)
+        data = json.loads(self.client.get('/words').get_data(as_text=True))
+        self.assertEqual(data['total_words'], 2)
+        data = json.loads(self.client.get('/api/study-sessions/1?per_page=1').get_data(as_text=True))
+        self.assertEqual(data['total'], 2)
+
+        # The migration's backfill is the rebuild script
+        self.db.execute('DELETE FROM counters')
+        self.db.execute('UPDATE groups SET words_count = 0')
+        self.db.commit()
+        self.app.db.rebuild(self.app, 'counters')
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+        self.assertEqual(self.db.execute('SELECT words_count FROM groups WHERE id = 1').fetchone()[0], 2)
+
+    def test_reset_runs_in_chunks_and_archives(self):
+        from lib import rollups
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '食べる', 'taberu', 'to eat', '[]')")
+        self.db.execute("INSERT INTO groups (id, name) VALUES (1, 'Verbs')")
+        self.db.execute("INSERT INTO study_activities (id, name, url) VALUES (1, 'Typing', 'http://localhost:8081')")
+        self.db.executemany("INSERT INTO study_sessions (group_id, study_activity_id) VALUES (1, 1)", [()] * 5)
+        self.db.execute("INSERT INTO word_review_items (study_session_id, word_id, correct) SELECT id, 1, 1 FROM study_sessions")
+        self.db.commit()
+
+        self.app.history_reset.chunk = 2
+        self.assertEqual(self.client.post('/api/study-sessions/reset', json={'archive': 'yes'}).status_code, 400)
+        response = self.client.post('/api/study-sessions/reset', json={'archive': True})
+        self.assertEqual(response.status_code, 202)
+        self.app.history_reset.wait()
+        status = json.loads(self.client.get('/api/study-sessions/reset').get_data(as_text=True))
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual((status['reviews_deleted'], status['sessions_deleted'], status['chunks']), (5, 5, 6))
+
+        self.assertEqual(self.db.execute('SELECT COUNT(*) FROM study_sessions').fetchone()[0], 0)
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+        archive = sqlite3.connect(self.app.history_reset.archive)
+        self.assertEqual(archive.execute('SELECT COUNT(*) FROM word_review_items').fetchone()[0], 5)
+        archive.close()
+
+    def test_reset_refuses_reviews_of_sessions_being_deleted(self):
+        from lib import rollups
+        self.db.execute("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (1, '食べる', 'taberu', 'to eat', '[]')")
+        self.db.executemany("INSERT INTO study_sessions (group_id, study_activity_id) VALUES (1, 1)", [()] * 5)
+        self.db.execute("INSERT INTO word_review_items (study_session_id, word_id, correct) SELECT id, 1, 1 FROM study_sessions")
+        self.db.commit()
+
+        self.app.history_reset.chunk = 1
+        self.app.history_reset.pause = 0.05
+        self.assertEqual(self.client.post('/api/study-sessions/reset', json={}).status_code, 202)
+        deadline = time.monotonic() + 5
+        while 'cutoff' not in self.app.history_reset.status() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Old sessions are refused on every write path while they are drained, new ones are not
+        review = {'word_id': 1, 'correct': True}
+        self.assertEqual(self.client.post('/api/study-sessions/5/review', json=review).status_code, 409)
+        self.assertEqual(self.client.post('/api/study-sessions/5/reviews', json=[review]).status_code, 409)
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.execute('INSERT INTO word_review_items (study_session_id, word_id, correct) VALUES (5, 1, 0)')
+        self.db.rollback()
+        self.assertEqual(self.app.history_reset.status()['state'], 'running')
+        response = self.client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1})
+        new_id = json.loads(response.get_data(as_text=True))['id']
+        self.assertEqual(self.client.post(f'/api/study-sessions/{new_id}/review', json=review).status_code, 201)
+
+        self.app.history_reset.wait()
+        self.assertEqual(self.app.history_reset.status()['state'], 'done')
+        self.assertEqual(self.db.execute('SELECT COUNT(*) FROM history_reset').fetchone()[0], 0)
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+        self.assertEqual(self.db.execute('SELECT sessions_count, reviews_count FROM study_totals').fetchone(), (1, 1))
+
+
+    def test_import_dedupes_words_and_links_groups(self):
+        path = os.path.join(self.directory, 'words.json')
+        words = [
+            {'kanji': '一', 'romaji': 'ichi', 'english': 'one', 'parts': []},
+            {'kanji': '二', 'romaji': 'ni', 'english': 'two', 'parts': []},
+            {'kanji': '一', 'romaji': 'ichi', 'english': 'one', 'parts': []},  # Repeated in the next batch
+            {'kanji': '一', 'romaji': 'hito', 'english': 'one thing', 'parts': []},  # Same kanji, other english
+            {'kanji': '三', 'romaji': 'san', 'english': 'three', 'parts': []}
+        ]
+        with open(path, 'w') as file:
+            json.dump(words, file, ensure_ascii=False)
+        self.db.execute("INSERT INTO words (kanji, romaji, english, parts) VALUES ('三', 'san', 'three', '[]')")
+        self.db.commit()
+
+        cursor = self.db.cursor()
+        stats = importer.import_words(cursor, 'Numbers', path, batch_size=2)
+        self.db.commit()
+        self.assertEqual((stats['read'], stats['inserted'], stats['duplicates'], stats['linked']), (5, 3, 2, 4))
+        self.assertEqual(self.db.execute('SELECT COUNT(*) FROM words').fetchone()[0], 4)
+
+        # A second group links the existing words without inserting any
+        stats = importer.import_words(cursor, 'Again', path, batch_size=10)
+        self.db.commit()
+        self.assertEqual((stats['inserted'], stats['linked']), (0, 4))
+        rows = self.db.execute('''
+            SELECT g.name, g.words_count, COUNT(wg.word_id) FROM groups g
+            JOIN word_groups wg ON wg.group_id = g.id GROUP BY g.id ORDER BY g.id
+        ''').fetchall()
+        self.assertEqual(rows, [('Numbers', 4, 4), ('Again', 4, 4)])
+
+    def test_word_reviews_follow_the_review_log(self):
+        self.db.executemany("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (?, ?, '', '', '[]')",
+                            [(1, '一'), (2, '二')])
+        self.db.executemany('INSERT INTO word_review_items (study_session_id, word_id, correct, created_at) VALUES (1, ?, ?, ?)',
+                            [(1, 1, '2030-01-02 10:00:00'), (1, 0, '2030-01-01 10:00:00'), (2, 0, '2030-01-03 10:00:00')])
+        self.db.commit()
+        expected = [(1, 1, 1, '2030-01-02 10:00:00'), (2, 0, 1, '2030-01-03 10:00:00')]
+        query = 'SELECT word_id, correct_count, wrong_count, last_reviewed FROM word_reviews ORDER BY word_id'
+        self.assertEqual(self.db.execute(query).fetchall(), expected)
+
+        # The rebuild the migration runs as its backfill recomputes the same rows
+        self.db.execute('UPDATE word_reviews SET correct_count = 7')
+        self.db.commit()
+        self.app.db.rebuild(self.app, 'word_reviews')
+        self.assertEqual(self.db.execute(query).fetchall(), expected)
+        self.db.execute('DELETE FROM words WHERE id = 2')
+        self.db.commit()
+        self.assertEqual(self.db.execute(query).fetchall(), expected[:1])
+
+    def test_migrations_include_files(self):
+        from lib import migrations
+        include = {'rebuild/x.sql': 'INSERT INTO words_included VALUES (1);'}.get
+        text = 'CREATE TABLE words_included (id INTEGER);\n-- include rebuild/x.sql\n'
+        applied = migrations.load({'9001_included.sql': text}, include)
+        migrations.apply(self.db, applied)
+        self.assertEqual(self.db.execute('SELECT COUNT(*) FROM words_included').fetchone()[0], 1)
+        self.assertTrue(migrations.is_current(self.db, applied))
+        with self.assertRaises(migrations.MigrationError):
+            migrations.load({'9002_missing.sql': text})
+
+    def upgrade_database(self, version, rows):
+        # A database migrated up to `version` with `rows` ({table: [row]}) in it, then
+        # brought current on start like the app does. Returns the migrations applied.
+        from lib import migrations
+        from lib.db import Db
+        old = Db(database=os.path.join(self.directory, 'old.db'), stream_pool_size=0)
+        with self.app.app_context():
+            cursor = old.cursor()
+            old.setup_tables(cursor)
+            migrations.apply(cursor.connection, [m for m in old.schema_migrations() if m.version <= version])
+            for table, values in rows.items():
+                cursor.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(values[0]))})", values)
+            old.commit()
+            old.close()
+        try:
+            return old.migrate_on_start(), sqlite3.connect(old.database)
+        finally:
+            old.pool.close_all()
+
+    def test_migrations_backfill_the_streak_of_existing_sessions(self):
+        sessions = [(1, 1, 1, '2030-01-01 10:00:00'), (2, 1, 1, '2030-01-02 09:00:00'),
+                    (3, 1, 1, '2030-01-02 20:00:00'), (4, 1, 1, '2030-01-05 10:00:00')]
+        applied, connection = self.upgrade_database(3, {'study_sessions': sessions})
+        self.addCleanup(connection.close)
+        self.assertIn('0004_study_streak.sql', [migration.name for migration in applied])
+        self.assertEqual(connection.execute('SELECT last_study_date, current_streak, longest_streak FROM study_streak').fetchone(),
+                         ('2030-01-05', 1, 2))
+
+    def test_migrations_backfill_spaced_repetition_of_existing_reviews(self):
+        applied, connection = self.upgrade_database(9, {
+            'words': [(1, '一', '', '', '[]'), (2, '二', '', '', '[]'), (3, '三', '', '', '[]')],
+            'word_groups': [(1, 1), (2, 1), (3, 1)],
+            'study_sessions': [(1, 1, 1, '2030-01-01 10:00:00')],
+            'word_review_items': [(1, 1, 1, 1, '2030-01-01 10:00:00'), (2, 1, 1, 1, '2030-01-02 10:00:00'),
+                                  (3, 2, 1, 0, '2030-01-01 10:00:00')]
+        })
+        self.addCleanup(connection.close)
+        self.assertIn('0010_spaced_repetition.sql', [migration.name for migration in applied])
+        self.assertEqual(connection.execute('SELECT word_id, repetitions, interval_days, due_at FROM word_srs ORDER BY word_id').fetchall(),
+                         [(1, 2, 6, '2030-01-08 10:00:00'), (2, 0, 0, '2030-01-01 10:10:00')])
+        self.assertEqual(connection.execute('SELECT word_id, due_at FROM group_word_due ORDER BY word_id').fetchall(),
+                         [(1, '2030-01-08 10:00:00'), (2, '2030-01-01 10:10:00'), (3, None)])
+
+    def test_dashboard_rollups_follow_sessions_and_reviews(self):
+        from lib import rollups
+        self.db.executemany("INSERT INTO words (id, kanji, romaji, english, parts) VALUES (?, ?, '', '', '[]')",
+                            [(1, '一'), (2, '二')])
+        self.db.executemany('INSERT INTO study_sessions (id, group_id, study_activity_id, created_at) VALUES (?, 1, 1, ?)',
+                            [(1, '2030-01-01 09:00:00'), (2, '2030-01-02 09:00:00')])
+        # Word 1 crosses the mastered threshold on its fifth review, word 2 is studied only
+        reviews = [(1, 1, 1, '2030-01-01 10:00:00')] * 4 + [(2, 1, 0, '2030-01-02 10:00:00'), (2, 2, 0, '2030-01-02 10:00:00')]
+        self.db.executemany(
+            'INSERT INTO word_review_items (study_session_id, word_id, correct, created_at) VALUES (?, ?, ?, ?)', reviews
+        )
+        self.db.commit()
+        daily = self.db.execute('SELECT * FROM study_daily_stats ORDER BY study_date').fetchall()
+        self.assertEqual(daily, [('2030-01-01', 1, 4, 4), ('2030-01-02', 1, 2, 0)])
+        totals = 'SELECT sessions_count, reviews_count, correct_count, words_studied, mastered_words FROM study_totals'
+        self.assertEqual(self.db.execute(totals).fetchone(), (2, 6, 4, 2, 1))
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+
+        # A wrong answer drops word 1 below 80% again
+        self.db.execute("INSERT INTO word_review_items (study_session_id, word_id, correct) VALUES (2, 1, 0)")
+        self.db.commit()
+        self.assertEqual(self.db.execute(totals).fetchone()[3:], (2, 0))
+        self.db.execute('UPDATE study_totals SET reviews_count = 0')
+        self.db.execute('DELETE FROM study_daily_stats')
+        self.db.commit()
+        self.app.db.rebuild(self.app, 'rollups')
+        self.assertEqual(rollups.check(self.db.cursor()), {})
+
+class SqlMetricsTestCase(AppTestCase):
+    config = {'METRICS_SQL': True}
+
+    def test_metrics_count_requests_and_statements(self):
+        self.client.get('/groups/1')
+        self.client.get('/groups/1')
+        self.client.get('/no-such-route')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('lang_portal_requests_total{method="GET",route="/groups/<int:id>",status="404"} 2', text)
+        self.assertIn('lang_portal_requests_total{method="GET",route="unmatched",status="404"} 1', text)
+        self.assertIn('lang_portal_request_duration_seconds_count{method="GET",route="/groups/<int:id>"} 2', text)
+        # One group lookup per request, nothing for the unmatched one
+        self.assertIn('lang_portal_sql_statements_total{method="GET",route="/groups/<int:id>"} 2', text)
+        self.assertIn('lang_portal_sql_statements_total{method="GET",route="unmatched"} 0', text)
+
+        # Statements run on the writer thread count towards the request that queued them
+        self.app.db.slow_queries.threshold = 0
+        self.client.post('/api/study-sessions', json={'group_id': 1, 'activity_id': 1})
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertNotIn('lang_portal_sql_statements_total{method="POST",route="/api/study-sessions"} 0', text)
+        self.assertIn('lang_portal_sql_statements_total{method="POST",route="/api/study-sessions"}', text)
+        with open(self.app.db.slow_queries.path) as log:
+            self.assertIn('INSERT INTO study_sessions', log.read())
+
+if __name__ == '__main__':
+    unittest.main()